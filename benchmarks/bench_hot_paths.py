@@ -0,0 +1,99 @@
+import argparse
+import copy
+import itertools
+import os
+import tempfile
+
+import vcr.matchers
+from multidict import MultiDict
+
+from benchmarks.common import (
+    parse_body_mix, generate_interactions, write_cassette, measure, print_results, save_results
+)
+from zelig.cassette import ZeligCassette
+from zelig.constants import RequestMatchCriteria, ResponseMatchCriteria
+from zelig.matchers import match_responses
+from zelig.report import save_report, get_report_path
+from zelig.sidecar import get_sidecar_path
+from zelig.utils import get_response_from_data, load_data
+
+BASE_URL = 'http://example.com:80'
+
+
+def get_request_info(request):
+    return {
+        'method': request.method,
+        'url': request.uri,
+        'params': MultiDict(),
+        'headers': request.headers,
+        'data': request.body,
+    }
+
+
+def bench_match_responses(interactions, repeat):
+    match_on = [cr.value for cr in ResponseMatchCriteria]
+    pairs = itertools.cycle([(response, copy.deepcopy(response)) for _, response in interactions])
+    return measure(lambda: match_responses(*next(pairs), match_on), repeat)
+
+
+def bench_get_response_from_data(interactions, repeat):
+    match_on = [getattr(vcr.matchers, cr.value) for cr in RequestMatchCriteria]
+    cassette = ZeligCassette('benchmark', match_on=match_on, record_mode='none')
+    for request, response in interactions:
+        cassette.append(request, response)
+    requests_info = itertools.cycle([get_request_info(request) for request, _ in interactions])
+    return measure(lambda: get_response_from_data(cassette, next(requests_info)), repeat)
+
+
+def bench_load_data(directory, interactions, repeat, sidecar):
+    path = os.path.join(directory, f'cassette_{sidecar}.yaml')
+    write_cassette(path, interactions)
+    if sidecar:
+        load_data(path, sidecar=True)
+        assert os.path.exists(get_sidecar_path(path)), 'Sidecar was not built'
+    return measure(load_data, repeat, path, sidecar)
+
+
+def bench_save_report(directory, interactions, repeat):
+    # Reports are changed while saved, so every call gets its own copy
+    reports = []
+    for i, (request, response) in zip(range(repeat), itertools.cycle(interactions)):
+        received_response = copy.deepcopy(response)
+        received_response['status'] = {'code': 500, 'message': 'Internal Server Error'}
+        reports.append((get_report_path(directory, i), {
+            'request': get_request_info(request),
+            'original_response': response,
+            'received_response': received_response,
+            'result': 'Responses mismatch',
+        }))
+    reports = iter(reports)
+    return measure(lambda: save_report(*next(reports)), repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time of Zelig hot paths')
+    parser.add_argument('--size', type=int, default=1000, help='Number of interactions in cassette')
+    parser.add_argument('--repeat', type=int, default=1000, help='Number of calls of every function')
+    parser.add_argument('--load-repeat', type=int, default=5, help='Number of cassette loads')
+    parser.add_argument('--body-size', type=int, default=1024, help='Response body size, bytes')
+    parser.add_argument('--body-mix', default='json:1', help='Response body kinds, e.g. "json:3,text:1,binary:1"')
+    parser.add_argument('--output', help='Path of JSON file to save results to')
+    args = parser.parse_args()
+
+    interactions = list(generate_interactions(BASE_URL, args.size, args.body_size, parse_body_mix(args.body_mix)))
+    results = {
+        'match_responses': bench_match_responses(interactions, args.repeat),
+        'get_response_from_data': bench_get_response_from_data(interactions, args.repeat),
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        results['load_data'] = bench_load_data(directory, interactions, args.load_repeat, sidecar=False)
+        results['load_data_sidecar'] = bench_load_data(directory, interactions, args.load_repeat, sidecar=True)
+        results['save_report'] = bench_save_report(directory, interactions, args.repeat)
+
+    print_results(results)
+    if args.output:
+        save_results(args.output, results, vars(args))
+
+
+if __name__ == '__main__':
+    main()
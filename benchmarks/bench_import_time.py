@@ -0,0 +1,79 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+from benchmarks.common import summarize, print_results, save_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules imported by every command and import time budget of the command in milliseconds
+COMMANDS = {
+    'summary': (('zelig.main', 'zelig.summary'), 50),
+    'report': (('zelig.main', 'zelig.report_command'), 200),
+    'convert': (('zelig.main', 'zelig.convert'), 200),
+    'playback': (('zelig.main', 'zelig.config', 'zelig.client'), 500),
+    'server': (('zelig.main', 'zelig.config', 'zelig.server'), 600),
+}
+# Packages that commands reading reports should never import
+HEAVY_PACKAGES = ('aiohttp', 'multidict', 'yarl', 'vcr', 'yaml')
+LIGHT_COMMANDS = ('summary',)
+IMPORT_TIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+def measure_imports(modules):
+    # Returns import time of the modules in seconds and names of all modules imported by them.
+    # Modules imported by interpreter startup are not counted, they are paid by every Python process.
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT, os.environ.get('PYTHONPATH')))))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {", ".join(modules)}'],
+                             env=env, stderr=subprocess.PIPE, check=True, universal_newlines=True)
+    total, imported = 0, set()
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_RE.match(line)
+        if match is None:
+            continue
+        _, cumulative, indent, name = match.groups()
+        # Nested imports are printed with indent, cumulative time of top level modules includes them
+        if not indent and name in modules:
+            total += int(cumulative)
+        imported.add(name)
+    return total / 10 ** 6, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import time of Zelig commands, fails when it is over budget')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--commands', nargs='+', choices=COMMANDS, default=list(COMMANDS))
+    parser.add_argument('--budget', action='append', default=[], metavar='COMMAND=MS',
+                        help='Import time budget of a command, could be repeated')
+    parser.add_argument('--output', help='Path of JSON file to save results to')
+    args = parser.parse_args()
+
+    budgets = {command: budget for command, (_, budget) in COMMANDS.items()}
+    budgets.update((command, float(ms)) for command, ms in (item.split('=', 1) for item in args.budget))
+    results, failures = {}, []
+    for command in args.commands:
+        modules, _ = COMMANDS[command]
+        timings, imported = [], set()
+        for _ in range(args.repeat):
+            elapsed, imported = measure_imports(modules)
+            timings.append(elapsed)
+        results[command] = dict(summarize(timings), budget_ms=budgets[command])
+        if results[command]['p50_ms'] > budgets[command]:
+            failures.append(f'{command} imports in {results[command]["p50_ms"]:.1f} ms, '
+                            f'budget is {budgets[command]:g} ms')
+        heavy = sorted(p for p in HEAVY_PACKAGES if p in imported)
+        if command in LIGHT_COMMANDS and heavy:
+            failures.append(f'{command} imports {", ".join(heavy)}')
+
+    print_results(results)
+    if args.output:
+        save_results(args.output, results, vars(args))
+    for failure in failures:
+        print(f'FAILED: {failure}')
+    if failures:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
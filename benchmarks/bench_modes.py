@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from benchmarks.common import (
+    parse_body_mix, generate_interactions, write_cassette, summarize, print_results, save_results
+)
+from zelig.constants import FILES_DIRECTORY, METADATA_FILE
+from zelig.latency import LatencyStore, get_latency_path
+
+# Zelig reads its configuration from environment and keeps data in FILES_DIRECTORY,
+# so it is started as a separate process the same way it runs in container
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ZELIG_MAIN = os.path.join(ROOT, 'zelig', 'main.py')
+MODES = ('record', 'serve', 'observe', 'playback')
+STARTUP_TIMEOUT = 120
+
+
+def get_free_port():
+    with contextlib.closing(socket.socket()) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process):
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Process exited with code {process.returncode} before it started listening')
+        with contextlib.suppress(OSError), socket.create_connection(('127.0.0.1', port), timeout=1):
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f'Port {port} was not opened in {STARTUP_TIMEOUT} seconds')
+
+
+def get_env(env):
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT, os.environ.get('PYTHONPATH')))), **env)
+
+
+@contextlib.contextmanager
+def run_process(args, env, port):
+    process = subprocess.Popen(args, env=get_env(env), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, process)
+        yield process
+    finally:
+        # Zelig saves cassette and reports on SIGTERM
+        process.send_signal(signal.SIGTERM)
+        process.wait()
+
+
+async def send_requests(loop, base_url, interactions, concurrency):
+    latencies = []
+    errors = 0
+    pending = iter(interactions)
+    connector = aiohttp.TCPConnector(limit=concurrency, loop=loop)
+
+    async def send(session):
+        nonlocal errors
+        for request, _ in pending:
+            url = urlsplit(request.uri)
+            started = time.perf_counter()
+            try:
+                async with session.request(request.method, f'{base_url}{url.path}?{url.query}'.rstrip('?'),
+                                           data=request.body or None, headers=request.headers) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    async with aiohttp.ClientSession(connector=connector, loop=loop) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(send(session) for _ in range(concurrency)), loop=loop)
+        elapsed = time.perf_counter() - started
+    return dict(summarize(latencies, elapsed), errors=errors)
+
+
+def bench_server(loop, mode, env, interactions, concurrency):
+    port = get_free_port()
+    env = dict(env, ZELIG_MODE=mode, ZELIG_HOST='127.0.0.1', ZELIG_PORT=str(port))
+    with run_process([sys.executable, ZELIG_MAIN], env, port):
+        return loop.run_until_complete(send_requests(loop, f'http://127.0.0.1:{port}', interactions, concurrency))
+
+
+def bench_playback(env, report_name):
+    # Playback latencies are measured by Zelig itself and read from its report
+    env = dict(env, ZELIG_MODE='playback', ZELIG_PLAYBACK_PACING='none', ZELIG_PLAYBACK_REPORT_DIRECTORY=report_name)
+    subprocess.run([sys.executable, ZELIG_MAIN], env=get_env(env), stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL, check=True)
+    report_dir = os.path.join(FILES_DIRECTORY, report_name)
+    with open(os.path.join(report_dir, METADATA_FILE)) as f:
+        meta = json.load(f)
+    latencies = LatencyStore.load(get_latency_path(report_dir)).replayed
+    return dict(summarize(latencies, meta['finished'] - meta['started']), errors=meta['reports_number'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput and latency of Zelig modes')
+    parser.add_argument('--requests', type=int, default=2000, help='Number of requests and cassette size')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--body-size', type=int, default=1024, help='Response body size, bytes')
+    parser.add_argument('--body-mix', default='json:1', help='Response body kinds, e.g. "json:3,text:1,binary:1"')
+    parser.add_argument('--upstream-delay', type=float, default=0, help='Upstream processing time, seconds')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Additional Zelig environment variable, could be repeated')
+    parser.add_argument('--output', help='Path of JSON file to save results to')
+    args = parser.parse_args()
+
+    upstream_port = get_free_port()
+    upstream_url = f'http://127.0.0.1:{upstream_port}'
+    interactions = list(generate_interactions(upstream_url, args.requests, args.body_size,
+                                              parse_body_mix(args.body_mix)))
+    work_dir = tempfile.mkdtemp(prefix='benchmark_', dir=FILES_DIRECTORY)
+    work_name = os.path.basename(work_dir)
+    cassette_name = os.path.join(work_name, 'cassette.yaml')
+    write_cassette(os.path.join(FILES_DIRECTORY, cassette_name), interactions)
+
+    env = dict((item.split('=', 1) for item in args.env), TARGET_SERVER_BASE_URL=upstream_url)
+    loop = asyncio.get_event_loop()
+    results = {}
+    upstream_args = [sys.executable, '-m', 'benchmarks.upstream', '--port', str(upstream_port),
+                     '--delay', str(args.upstream_delay)]
+    try:
+        with run_process(upstream_args, {}, upstream_port):
+            for mode in args.modes:
+                if mode == 'record':
+                    mode_env = dict(env, ZELIG_DATA_DIRECTORY=os.path.join(work_name, 'recorded.yaml'))
+                    results[mode] = bench_server(loop, mode, mode_env, interactions, args.concurrency)
+                elif mode == 'playback':
+                    mode_env = dict(env, ZELIG_DATA_DIRECTORY=cassette_name,
+                                    ZELIG_PLAYBACK_CONCURRENCY=str(args.concurrency))
+                    results[mode] = bench_playback(mode_env, os.path.join(work_name, 'playback_report'))
+                else:
+                    mode_env = dict(env, ZELIG_DATA_DIRECTORY=cassette_name,
+                                    ZELIG_OBSERVE_REPORT_DIRECTORY=os.path.join(work_name, 'observe_report'))
+                    results[mode] = bench_server(loop, mode, mode_env, interactions, args.concurrency)
+    finally:
+        loop.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(results)
+    if args.output:
+        save_results(args.output, results, vars(args))
+
+
+if __name__ == '__main__':
+    main()
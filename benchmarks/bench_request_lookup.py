@@ -0,0 +1,59 @@
+import sys
+import time
+
+import vcr.matchers
+from vcr.cassette import Cassette
+from vcr.request import Request
+
+from zelig.cassette import ZeligCassette
+from zelig.constants import RequestMatchCriteria
+
+SIZES = (100, 1000, 10000, 50000)
+LOOKUPS = 100
+# Linear scan of larger cassettes takes minutes
+LINEAR_MAX_SIZE = 10000
+
+
+def generate_interactions(size):
+    for i in range(size):
+        request = Request(method='POST' if i % 2 else 'GET',
+                          uri=f'http://example.com:80/api/items/{i}?page={i % 10}&sort=asc',
+                          body=f'{{"item": {i}}}'.encode('utf-8'),
+                          headers={'Content-Type': 'application/json'})
+        response = {'status': {'code': 200, 'message': 'OK'}, 'headers': {}, 'body': {'string': b''}}
+        yield request, response
+
+
+def build_cassette(cassette_class, size):
+    match_on = [getattr(vcr.matchers, cr.value) for cr in RequestMatchCriteria]
+    cassette = cassette_class('benchmark', match_on=match_on, record_mode='all')
+    for request, response in generate_interactions(size):
+        cassette.append(request, response)
+    return cassette
+
+
+def measure_lookup(cassette, size):
+    step = max(1, size // LOOKUPS)
+    requests = [cassette.data[i][0] for i in range(0, size, step)]
+    started = time.perf_counter()
+    for request in requests:
+        cassette.responses_of(request)
+    return (time.perf_counter() - started) / len(requests)
+
+
+def main(sizes):
+    cassette_classes = [('indexed', ZeligCassette), ('linear', Cassette)]
+    print(f'{"size":>8} ' + ' '.join(f'{name + " us/lookup":>20}' for name, _ in cassette_classes))
+    for size in sizes:
+        results = []
+        for name, cassette_class in cassette_classes:
+            if cassette_class is Cassette and size > LINEAR_MAX_SIZE:
+                results.append(float('nan'))
+                continue
+            cassette = build_cassette(cassette_class, size)
+            results.append(measure_lookup(cassette, size) * 10 ** 6)
+        print(f'{size:>8} ' + ' '.join(f'{r:>20.2f}' for r in results), flush=True)
+
+
+if __name__ == '__main__':
+    main([int(s) for s in sys.argv[1:]] or SIZES)
@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import time
+
+import vcr.matchers
+from vcr.persisters.filesystem import FilesystemPersister
+from vcr.request import Request
+from vcr.serializers import yamlserializer
+
+from zelig.cassette import ZeligCassette
+from zelig.constants import RequestMatchCriteria
+from zelig.sidecar import get_sidecar_path
+
+SIZES = (1000, 10000)
+BODY_SIZE = 1024
+
+
+def generate_cassette(path, size):
+    requests, responses = [], []
+    for i in range(size):
+        requests.append(Request(method='POST' if i % 2 else 'GET',
+                                uri=f'http://example.com:80/api/items/{i}?page={i % 10}&sort=asc',
+                                body=f'{{"item": {i}}}'.encode('utf-8'),
+                                headers={'Content-Type': 'application/json'}))
+        body = f'{{"item": {i}, "data": "{"x" * BODY_SIZE}"}}'.encode('utf-8')
+        responses.append({'status': {'code': 200, 'message': 'OK'},
+                          'headers': {'Content-Type': ['application/json']},
+                          'body': {'string': body}})
+    FilesystemPersister.save_cassette(path, {'requests': requests, 'responses': responses}, yamlserializer)
+
+
+def measure_load(path, sidecar):
+    match_on = [getattr(vcr.matchers, cr.value) for cr in RequestMatchCriteria]
+    started = time.perf_counter()
+    cassette = ZeligCassette.load(path=path, match_on=match_on, record_mode='none',
+                                  persister=FilesystemPersister, sidecar=sidecar)
+    elapsed = time.perf_counter() - started
+    assert len(cassette.data), 'Cassette is empty'
+    return elapsed
+
+
+def main(sizes):
+    columns = ('no sidecar', 'sidecar build', 'sidecar reuse')
+    print(f'{"size":>8} ' + ' '.join(f'{name + " s":>18}' for name in columns))
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = os.path.join(directory, f'cassette_{size}.yaml')
+            generate_cassette(path, size)
+            results = [measure_load(path, sidecar=False)]
+            results.append(measure_load(path, sidecar=True))
+            assert os.path.exists(get_sidecar_path(path)), 'Sidecar was not built'
+            results.append(measure_load(path, sidecar=True))
+            print(f'{size:>8} ' + ' '.join(f'{r:>18.3f}' for r in results), flush=True)
+
+
+if __name__ == '__main__':
+    main([int(s) for s in sys.argv[1:]] or SIZES)
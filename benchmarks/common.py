@@ -0,0 +1,116 @@
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+from vcr.persisters.filesystem import FilesystemPersister
+from vcr.request import Request
+from vcr.serializers import yamlserializer
+
+from zelig.latency import percentile
+
+BODY_KINDS = ('json', 'text', 'binary')
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'text': 'text/plain; charset=utf-8',
+    'binary': 'application/octet-stream',
+}
+PERCENTILES = (50, 90, 99)
+
+
+def parse_body_mix(value):
+    # Body mix is given as comma separated 'kind:weight' pairs, e.g. 'json:3,text:1'
+    mix = {}
+    for item in value.split(','):
+        kind, _, weight = item.partition(':')
+        if kind not in BODY_KINDS:
+            raise ValueError(f'Unknown body kind \'{kind}\'. Possible values: {", ".join(BODY_KINDS)}')
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def make_body(kind, size, i):
+    # Bodies are generated from the request number, so upstream and generated cassettes agree on them
+    if kind == 'json':
+        prefix = f'{{"id": {i}, "data": "'
+        return (prefix + 'x' * max(0, size - len(prefix) - 2) + '"}').encode('utf-8')
+    if kind == 'text':
+        line = f'line of request {i}\n'
+        return (line * (size // len(line) + 1))[:size].encode('utf-8')
+    return random.Random(i).getrandbits(8 * size).to_bytes(size, 'little') if size else b''
+
+
+def get_path(kind, size, i):
+    return f'/bench/{kind}/{size}/{i}'
+
+
+def generate_interactions(base_url, count, body_size, body_mix):
+    kinds = random.Random(0).choices(list(body_mix), weights=list(body_mix.values()), k=count)
+    for i, kind in enumerate(kinds):
+        method = 'POST' if i % 4 == 3 else 'GET'
+        url = f'{base_url.rstrip("/")}{get_path(kind, body_size, i)}'
+        request = Request(method=method, uri=url, body=f'{{"id": {i}}}'.encode('utf-8') if method == 'POST' else b'',
+                          headers={'Content-Type': 'application/json'} if method == 'POST' else {})
+        body = make_body(kind, body_size, i)
+        response = {
+            'status': {'code': 200, 'message': 'OK'},
+            'headers': {'Content-Type': CONTENT_TYPES[kind]},
+            'body': {'string': body.decode('utf-8') if kind != 'binary' else body},
+            'url': url,
+            'latency': 0.0,
+        }
+        yield request, response
+
+
+def write_cassette(path, interactions):
+    requests, responses = zip(*interactions)
+    FilesystemPersister.save_cassette(path, {'requests': list(requests), 'responses': list(responses)},
+                                      yamlserializer)
+
+
+def summarize(latencies, elapsed=None):
+    # Latencies are in seconds, summary is in milliseconds and requests per second
+    latencies = sorted(latencies)
+    summary = {'count': len(latencies)}
+    if elapsed:
+        summary['throughput'] = len(latencies) / elapsed
+    if latencies:
+        summary['mean_ms'] = statistics.mean(latencies) * 1000
+        for p in PERCENTILES:
+            summary[f'p{p}_ms'] = percentile(latencies, p) * 1000
+    return summary
+
+
+def measure(func, repeat, *args):
+    # Every call is timed separately, so percentiles of a hot path could be reported
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        call_started = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def print_results(results):
+    columns = ('count', 'throughput', 'mean_ms') + tuple(f'p{p}_ms' for p in PERCENTILES)
+    print(f'{"benchmark":<32} ' + ' '.join(f'{c:>12}' for c in columns))
+    for name, summary in results.items():
+        values = (summary.get(c, float('nan')) for c in columns)
+        print(f'{name:<32} ' + ' '.join(f'{v:>12.3f}' if isinstance(v, float) else f'{v:>12}' for v in values),
+              flush=True)
+
+
+def save_results(path, results, parameters):
+    # Results are saved with parameters and environment, so runs could be compared with compare.py
+    data = {
+        'created': time.time(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'parameters': parameters,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
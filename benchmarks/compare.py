@@ -0,0 +1,31 @@
+import json
+import sys
+
+METRICS = ('throughput', 'p50_ms', 'p90_ms', 'p99_ms')
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare(baseline, current):
+    # Change is shown in percents, positive throughput and negative latency changes are improvements
+    print(f'{"benchmark":<32} ' + ' '.join(f'{m + " %":>14}' for m in METRICS))
+    for name in sorted(set(baseline) & set(current)):
+        changes = []
+        for metric in METRICS:
+            old, new = baseline[name].get(metric), current[name].get(metric)
+            changes.append((new - old) / old * 100 if old and new is not None else float('nan'))
+        print(f'{name:<32} ' + ' '.join(f'{c:>+14.1f}' for c in changes))
+
+
+def main(args):
+    if len(args) != 2:
+        print('Please use "python benchmarks/compare.py <baseline.json> <current.json>" command')
+        exit(1)
+    compare(load_results(args[0]), load_results(args[1]))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
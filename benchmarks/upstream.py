@@ -0,0 +1,39 @@
+import argparse
+import asyncio
+
+from aiohttp import web
+
+from benchmarks.common import BODY_KINDS, CONTENT_TYPES, make_body
+
+
+async def handle(request):
+    # Path is '/bench/<kind>/<size>/<i>', so every request gets the body stored in generated cassettes
+    kind, size, i = request.match_info['kind'], int(request.match_info['size']), int(request.match_info['i'])
+    if kind not in BODY_KINDS:
+        raise web.HTTPNotFound()
+    await request.read()
+    delay = request.app['delay']
+    if delay:
+        await asyncio.sleep(delay, loop=request.app.loop)
+    return web.Response(body=make_body(kind, size, i), headers={'Content-Type': CONTENT_TYPES[kind]})
+
+
+def create_app(loop, delay=0):
+    app = web.Application(loop=loop)
+    app['delay'] = delay
+    app.router.add_route('*', '/bench/{kind}/{size:\\d+}/{i:\\d+}', handle)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Upstream server stand-in for Zelig benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--delay', type=float, default=0, help='Processing time of every request, seconds')
+    args = parser.parse_args()
+    loop = asyncio.get_event_loop()
+    web.run_app(create_app(loop, delay=args.delay), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
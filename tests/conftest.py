@@ -0,0 +1,99 @@
+import collections
+import contextlib
+import functools
+import types
+
+import pytest
+from aiohttp import web
+
+from zelig.cassette import load_cassette
+from zelig.constants import (
+    RequestMatchCriteria, ResponseMatchCriteria, CassetteFormat, CoalesceRecord, Compression, ReportLayout,
+    ReportQueuePolicy, ServeLatency, ServeBandwidth
+)
+from zelig.routing import UpstreamRouter, get_upstreams
+from zelig.server import create_app, get_cassette_kwargs
+
+pytest_plugins = 'aiohttp.pytest_plugin'
+
+
+def make_config(mode, data_directory, **options):
+    # Configs read environment once per process, so tests use plain objects with the same attributes
+    values = dict(
+        mode=mode,
+        data_directory=data_directory,
+        target_server_base_url='',
+        routes=[],
+        cassette_format=CassetteFormat.STREAM,
+        compression=Compression.NONE,
+        load_cache=False,
+        mmap_bodies=False,
+        upstream_pool_size=10,
+        upstream_pool_size_per_host=0,
+        upstream_keepalive_timeout=15,
+        upstream_dns_cache=False,
+        upstream_connect_timeout=5,
+        upstream_read_timeout=5,
+        zelig_host='127.0.0.1',
+        zelig_port=0,
+        metrics_enabled=False,
+        admin_path='/__zelig__',
+        stream_responses=False,
+        stream_body_cap=10 * 1024 * 1024,
+        coalesce_requests=False,
+        coalesce_record=CoalesceRecord.SINGLE,
+        request_match_on=list(RequestMatchCriteria),
+        response_match_on=list(ResponseMatchCriteria),
+        response_ignore_paths=[],
+        report_queue_size=1000,
+        report_queue_policy=ReportQueuePolicy.BLOCK,
+        meta_flush_interval=500,
+        report_layout=ReportLayout.RESULTS,
+        workers=1,
+        reload_interval=0,
+        serve_latency=ServeLatency.NONE,
+        serve_bandwidth=ServeBandwidth.NONE,
+        serve_bandwidth_rate=1024 * 1024,
+        cache_max_size=1024 * 1024,
+        cache_ttl=0,
+    )
+    values.update(options)
+    return types.SimpleNamespace(**values)
+
+
+@pytest.yield_fixture
+def zelig(loop):
+    # Builds application the same way start_server does, but cassettes are loaded without patching HTTP clients,
+    # so requests of the test client are not intercepted by vcr
+    with contextlib.ExitStack() as stack:
+        def create(config):
+            cassette_kwargs = get_cassette_kwargs(config)
+            if config.routes:
+                cassette = None
+                router = stack.enter_context(UpstreamRouter(get_upstreams(config),
+                                                            load=functools.partial(load_cassette, **cassette_kwargs)))
+            else:
+                cassette = load_cassette(config.data_directory, **cassette_kwargs)
+                stack.callback(cassette._save)
+                router = UpstreamRouter.from_cassette(config, cassette)
+            return create_app(config, router, stack, loop, cassette=cassette), cassette, router
+        yield create
+
+
+@pytest.fixture
+def upstream(loop, test_server):
+    # Target server stand-in, responds with status from 'status' query parameter
+    # and a body that changes with every request to the same path
+    hits = collections.Counter()
+
+    async def handle(request):
+        await request.read()
+        hits[request.method, request.path] += 1
+        return web.Response(status=int(request.query.get('status', 200)),
+                            text=f'{request.method} {request.path} {hits[request.method, request.path]}')
+
+    app = web.Application(loop=loop)
+    app.router.add_route('*', '/{path:.*}', handle)
+    server = loop.run_until_complete(test_server(app))
+    server.hits = hits
+    return server
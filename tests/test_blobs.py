@@ -0,0 +1,40 @@
+import os
+
+import pytest
+from vcr.request import Request
+
+from zelig.blobs import MIN_BLOB_SIZE, MissingBlobError, get_blobs_path
+from zelig.cassette import load_cassette
+from zelig.persisters import StreamCassetteWriter
+
+
+def write_compact_cassette(path, bodies):
+    with StreamCassetteWriter(path, blobs=os.path.basename(get_blobs_path(path))) as writer:
+        for i, body in enumerate(bodies):
+            writer.append(Request('GET', f'http://example.com/{i}', b'', {}), {
+                'status': {'code': 200, 'message': 'OK'},
+                'headers': {},
+                'body': {'string': body},
+            })
+        return writer.blobs
+
+
+def test_compact_cassette_is_loaded(tmpdir):
+    path = str(tmpdir.join('data'))
+    large = b'x' * MIN_BLOB_SIZE
+    write_compact_cassette(path, [b'small', large, large])
+
+    cassette = load_cassette(path)
+    assert [response['body']['string'] for _, response in cassette.data] == [b'small', large, large]
+    # Equal bodies are stored once and shared
+    assert cassette.data[1][1]['body']['string'] is cassette.data[2][1]['body']['string']
+
+
+def test_cassette_with_missing_blob_is_not_loaded(tmpdir):
+    path = str(tmpdir.join('data'))
+    blobs = write_compact_cassette(path, [b'small', b'x' * MIN_BLOB_SIZE])
+    [(directory, _, [name])] = [entry for entry in os.walk(blobs.directory) if entry[2]]
+    os.remove(os.path.join(directory, name))
+
+    with pytest.raises(MissingBlobError):
+        load_cassette(path)
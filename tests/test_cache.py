@@ -0,0 +1,40 @@
+from zelig.constants import ZeligMode
+
+from tests.conftest import make_config
+
+
+def cache_config(tmpdir, upstream):
+    return make_config(ZeligMode.CACHE, str(tmpdir.join('data')), target_server_base_url=str(upstream.make_url('/')))
+
+
+async def test_get_is_cached(zelig, upstream, test_client, tmpdir):
+    app, _, _ = zelig(cache_config(tmpdir, upstream))
+    client = await test_client(app)
+
+    for _ in range(2):
+        response = await client.get('/items')
+        assert response.status == 200
+        assert await response.text() == 'GET /items 1'
+    assert upstream.hits['GET', '/items'] == 1
+
+
+async def test_post_is_not_cached(zelig, upstream, test_client, tmpdir):
+    app, _, _ = zelig(cache_config(tmpdir, upstream))
+    client = await test_client(app)
+
+    for i in range(1, 3):
+        response = await client.post('/items', data=b'{}')
+        assert response.status == 200
+        assert await response.text() == f'POST /items {i}'
+    assert upstream.hits['POST', '/items'] == 2
+
+
+async def test_server_error_is_not_cached(zelig, upstream, test_client, tmpdir):
+    app, _, _ = zelig(cache_config(tmpdir, upstream))
+    client = await test_client(app)
+
+    for i in range(1, 3):
+        response = await client.get('/items', params={'status': '503'})
+        assert response.status == 503
+        assert await response.text() == f'GET /items {i}'
+    assert upstream.hits['GET', '/items'] == 2
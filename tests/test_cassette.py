@@ -0,0 +1,107 @@
+import xmlrpc.client
+
+import pytest
+from vcr import matchers
+from vcr.errors import UnhandledHTTPRequestError
+from vcr.request import Request
+
+from zelig.cassette import REQUEST_KEY_BUILDERS, load_cassette
+from zelig.constants import RequestMatchCriteria
+
+URL = 'http://example.com:8080/items?b=2&a=1'
+JSON = {'Content-Type': 'application/json'}
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+XMLRPC = {'Content-Type': 'text/xml', 'User-Agent': 'Python-xmlrpc/3.6'}
+
+
+def make_response(body):
+    return {'status': {'code': 200, 'message': 'OK'}, 'headers': {}, 'body': {'string': body}}
+
+
+def make_cassette(tmpdir, match_on=tuple(c.value for c in RequestMatchCriteria), **kwargs):
+    return load_cassette(str(tmpdir.join('data')), match_on=list(match_on), **kwargs)
+
+
+def test_every_criterion_has_key_builder():
+    assert set(REQUEST_KEY_BUILDERS) == {c.value for c in RequestMatchCriteria}
+
+
+# Requests that differ from the recorded one only in the given criterion
+VARIANTS = {
+    RequestMatchCriteria.METHOD: Request('PUT', URL, b'{"a": 1}', JSON),
+    RequestMatchCriteria.SCHEME: Request('POST', 'https://example.com:8080/items?b=2&a=1', b'{"a": 1}', JSON),
+    RequestMatchCriteria.HOST: Request('POST', 'http://other.com:8080/items?b=2&a=1', b'{"a": 1}', JSON),
+    RequestMatchCriteria.PORT: Request('POST', 'http://example.com:9090/items?b=2&a=1', b'{"a": 1}', JSON),
+    RequestMatchCriteria.PATH: Request('POST', 'http://example.com:8080/other?b=2&a=1', b'{"a": 1}', JSON),
+    RequestMatchCriteria.QUERY: Request('POST', 'http://example.com:8080/items?b=3&a=1', b'{"a": 1}', JSON),
+    RequestMatchCriteria.BODY: Request('POST', URL, b'{"a": 2}', JSON),
+}
+
+
+@pytest.mark.parametrize('criterion', list(RequestMatchCriteria))
+def test_request_is_looked_up_on_criterion(tmpdir, criterion):
+    cassette = make_cassette(tmpdir, match_on=[criterion.value])
+    cassette.append(Request('POST', URL, b'{"a": 1}', JSON), make_response(b'recorded'))
+
+    # Equal request in a different form is found
+    index, response = cassette.find_response(Request('POST', 'http://example.com:8080/items?a=1&b=2',
+                                                     b'{ "a" : 1 }', JSON))
+    assert (index, response['body']['string']) == (0, b'recorded')
+    for varied, request in VARIANTS.items():
+        index, _ = cassette.find_response(request)
+        if varied == criterion:
+            assert index is None
+        else:
+            assert index == 0
+
+
+def test_duplicate_requests_are_played_in_recorded_order(tmpdir):
+    cassette = make_cassette(tmpdir)
+    for i in range(3):
+        cassette.append(Request('GET', URL, b'', {}), make_response(f'{i}'.encode()))
+    cassette.append(Request('GET', 'http://example.com:8080/other', b'', {}), make_response(b'other'))
+    cassette.append(Request('GET', URL, b'', {}), make_response(b'3'))
+
+    assert cassette.play_response(Request('GET', 'http://example.com:8080/other', b'', {}))['body']['string'] == \
+        b'other'
+    played = [cassette.play_response(Request('GET', URL, b'', {}))['body']['string'] for _ in range(4)]
+    assert played == [b'0', b'1', b'2', b'3']
+    assert Request('GET', URL, b'', {}) not in cassette
+    with pytest.raises(UnhandledHTTPRequestError):
+        cassette.play_response(Request('GET', URL, b'', {}))
+    # Lookup without playing still finds the first recorded response
+    assert cassette.find_response(Request('GET', URL, b'', {}))[0] == 0
+
+
+def test_played_responses_are_repeated_when_allowed(tmpdir):
+    cassette = make_cassette(tmpdir, allow_playback_repeats=True)
+    cassette.append(Request('GET', URL, b'', {}), make_response(b'first'))
+    cassette.append(Request('GET', URL, b'', {}), make_response(b'second'))
+
+    played = [cassette.play_response(Request('GET', URL, b'', {}))['body']['string'] for _ in range(3)]
+    assert played == [b'first', b'first', b'first']
+    assert Request('GET', URL, b'', {}) in cassette
+
+
+def xmlrpc_body(*params):
+    return xmlrpc.client.dumps(params, 'get_items').encode('utf-8')
+
+
+@pytest.mark.parametrize('headers, body1, body2', [
+    (JSON, b'{"a": 1, "b": [1, 2]}', b'{"b": [1, 2], "a": 1}'),
+    (JSON, b'{"a": 1}', b'{ "a":1 }'),
+    (JSON, b'{"a": 1}', b'{"a": 2}'),
+    (JSON, b'{"a": [1, 2]}', b'{"a": [2, 1]}'),
+    (FORM, b'a=1&b=2', b'b=2&a=1'),
+    (FORM, b'a=1&a=2', b'a=2&a=1'),
+    (FORM, b'a=1', b'a=2'),
+    (FORM, b'a=1&b=', b'a=1'),
+    (XMLRPC, xmlrpc_body(1, 'x'), xmlrpc_body(1, 'x').replace(b'\n', b'')),
+    (XMLRPC, xmlrpc_body(1, 'x'), xmlrpc_body(2, 'x')),
+    ({}, b'a=1&b=2', b'b=2&a=1'),
+    ({}, b'same', b'same'),
+])
+def test_body_key_agrees_with_vcr_matcher(tmpdir, headers, body1, body2):
+    cassette = make_cassette(tmpdir, match_on=[RequestMatchCriteria.BODY.value])
+    r1, r2 = Request('POST', URL, body1, headers), Request('POST', URL, body2, headers)
+    assert (cassette.request_key(r1) == cassette.request_key(r2)) == matchers.requests_match(r1, r2, [matchers.body])
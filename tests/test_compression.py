@@ -0,0 +1,103 @@
+import pytest
+from vcr.request import Request
+from vcr.serializers import yamlserializer
+
+from zelig.compression import zstandard, compress, decompress, detect_compression, open_file
+from zelig.constants import Compression
+from zelig.encoding import MIN_COMPRESSED_SIZE, COMPRESSED_KEYS
+from zelig.persisters import StreamCassetteWriter, get_persister, iter_stream_cassette
+from zelig.results import ResultsWriter, read_report
+
+COMPRESSIONS = [
+    Compression.GZIP,
+    pytest.param(Compression.ZSTD, marks=pytest.mark.skipif(zstandard is None, reason='zstandard is not installed')),
+]
+LARGE_BODY = b'{"items": [' + b'"item", ' * MIN_COMPRESSED_SIZE + b'"item"]}'
+
+
+def make_response(body):
+    return {'status': {'code': 200, 'message': 'OK'}, 'headers': {}, 'body': {'string': body}}
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+def test_data_is_decompressed(compression):
+    assert decompress(compress(LARGE_BODY, compression), compression) == LARGE_BODY
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+def test_compression_is_detected_by_content(tmpdir, compression):
+    # File name says nothing about its compression
+    path = str(tmpdir.join('data'))
+    with open_file(path, 'wb', compression) as f:
+        f.write(LARGE_BODY)
+    assert detect_compression(path) == compression
+
+    plain_path = str(tmpdir.join('plain.gz'))
+    with open(plain_path, 'wb') as f:
+        f.write(LARGE_BODY)
+    assert detect_compression(plain_path) == Compression.NONE
+    assert detect_compression(str(tmpdir.join('missing'))) == Compression.NONE
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+def test_yaml_cassette_round_trip(tmpdir, compression):
+    path = str(tmpdir.join('data'))
+    request = Request('GET', 'http://example.com/items', b'', {})
+    get_persister(path, compression=compression).save_cassette(
+        path, {'requests': [request], 'responses': [make_response(LARGE_BODY)]}, yamlserializer)
+    assert detect_compression(path) == compression
+
+    # Existing cassette is read with compression found in its content, whatever is configured
+    requests, responses = get_persister(path).load_cassette(path, yamlserializer)
+    assert [r.uri for r in requests] == ['http://example.com/items']
+    assert responses[0]['body']['string'] == LARGE_BODY
+
+
+def test_yaml_cassette_compression_is_chosen_by_extension(tmpdir):
+    path = str(tmpdir.join('data.gz'))
+    get_persister(path).save_cassette(path, {'requests': [], 'responses': []}, yamlserializer)
+    assert detect_compression(path) == Compression.GZIP
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+def test_stream_cassette_bodies_are_compressed(tmpdir, compression):
+    path = str(tmpdir.join('data'))
+    with StreamCassetteWriter(path, compression) as writer:
+        writer.append(Request('GET', 'http://example.com/large', b'', {}), make_response(LARGE_BODY))
+        writer.append(Request('GET', 'http://example.com/small', b'', {}), make_response(b'small'))
+
+    # Every body is compressed on its own, so lines are still read one by one
+    with open(path) as f:
+        _, large, small = f.read().splitlines()
+    assert COMPRESSED_KEYS[compression] in large
+    assert COMPRESSED_KEYS[compression] not in small
+
+    responses = [response for _, response in iter_stream_cassette(path)]
+    assert [response['body']['string'] for response in responses] == [LARGE_BODY, b'small']
+
+    # Appended interactions use compression of the existing cassette
+    with StreamCassetteWriter(path) as writer:
+        writer.append(Request('GET', 'http://example.com/appended', b'', {}), make_response(LARGE_BODY))
+    with open(path) as f:
+        assert COMPRESSED_KEYS[compression] in f.read().splitlines()[-1]
+    assert [response['body']['string'] for _, response in iter_stream_cassette(path)][-1] == LARGE_BODY
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+def test_report_bodies_are_decompressed(tmpdir, compression):
+    directory = str(tmpdir)
+    writer = ResultsWriter(directory, compression=compression)
+    writer.write(1, {
+        'request': {'method': 'POST', 'url': 'http://example.com/items', 'body': LARGE_BODY},
+        'original_response': make_response(LARGE_BODY),
+        'received_response': make_response(b'small'),
+        'result': 'Responses mismatch',
+    }, 'POST /items')
+    writer.close()
+
+    with open(tmpdir.join('results.jsonl')) as f:
+        assert COMPRESSED_KEYS[compression] in f.read()
+    report = read_report(directory, 1)
+    assert report['request']['body'] == LARGE_BODY
+    assert report['original_response']['body']['string'] == LARGE_BODY
+    assert report['received_response']['body']['string'] == b'small'
@@ -0,0 +1,79 @@
+import pytest
+
+from zelig.config.errors import InvalidValueError
+from zelig.config.properties import JsonPathListProperty
+from zelig.diff import (
+    DESCEND, INDEX, KEY, MAX_REPORTED_DIFFERENCES, WILDCARD, get_differences, has_differences, iter_differences,
+    parse_path
+)
+
+
+@pytest.mark.parametrize('path, tokens', [
+    ('$', ()),
+    ('$.a.b', ((KEY, 'a'), (KEY, 'b'))),
+    ('$.a[0]', ((KEY, 'a'), (INDEX, 0))),
+    ('$.a[*].b', ((KEY, 'a'), (WILDCARD, None), (KEY, 'b'))),
+    ('$.a.*', ((KEY, 'a'), (WILDCARD, None))),
+    ('$..b', ((DESCEND, None), (KEY, 'b'))),
+    ('$..[1]', ((DESCEND, None), (INDEX, 1))),
+    ("$['a b'].c", ((KEY, 'a b'), (KEY, 'c'))),
+])
+def test_path_is_parsed(path, tokens):
+    assert parse_path(path) == tokens
+
+
+@pytest.mark.parametrize('path', ['a.b', '$a', '$.a[', '$.a[x]', '$.a..'])
+def test_invalid_path_is_rejected(path):
+    with pytest.raises(ValueError):
+        parse_path(path)
+
+
+def test_invalid_path_in_config_is_rejected():
+    prop = JsonPathListProperty('RESPONSE_IGNORE_PATHS', default='')
+    assert prop.clean('$.a $..b') == [parse_path('$.a'), parse_path('$..b')]
+    with pytest.raises(InvalidValueError):
+        prop.clean('$.a b')
+
+
+def differences(original, received, *ignore_paths):
+    return list(iter_differences(original, received, [parse_path(path) for path in ignore_paths]))
+
+
+def test_differences_are_found():
+    original = {'a': 1, 'b': [1, 2, 3], 'c': {'d': True}, 'removed': 1}
+    received = {'a': 2, 'b': [1, 5], 'c': {'d': 1}, 'added': 1}
+    assert differences(original, received) == [
+        {'path': '$.a', 'original': 1, 'received': 2},
+        {'path': '$.b[1]', 'original': 2, 'received': 5},
+        {'path': '$.b[2]', 'original': 3},
+        {'path': '$.c.d', 'original': True, 'received': 1},
+        {'path': '$.removed', 'original': 1},
+        {'path': '$.added', 'received': 1},
+    ]
+
+
+def test_ignored_paths_are_skipped():
+    original = {'id': 1, 'items': [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}], 'meta': {'time': 1}}
+    received = {'id': 2, 'items': [{'id': 3, 'name': 'a'}, {'id': 4, 'name': 'c'}], 'meta': {'time': 2, 'new': 1}}
+    assert differences(original, received, '$..id', '$.meta') == [
+        {'path': '$.items[1].name', 'original': 'b', 'received': 'c'},
+    ]
+    assert differences(original, received, '$.id', '$.items[*]', '$.meta.*') == []
+    assert [d['path'] for d in differences(original, received, '$.id', '$.items[0]', '$.meta')] == \
+        ['$.items[1].id', '$.items[1].name']
+
+
+def test_has_differences():
+    assert not has_differences({'a': [1, {'b': 2}]}, {'a': [1, {'b': 2}]})
+    assert has_differences({'a': [1, {'b': 2}]}, {'a': [1, {'b': 3}]})
+    assert not has_differences({'a': [1, {'b': 2}]}, {'a': [1, {'b': 3}]}, [parse_path('$.a[1].b')])
+
+
+def test_reported_differences_are_capped():
+    original = {f'key{i}': i for i in range(MAX_REPORTED_DIFFERENCES + 50)}
+    reported = get_differences(original, {})
+    assert len(reported) == MAX_REPORTED_DIFFERENCES + 1
+    assert reported[:-1] == [{'path': f'$.key{i}', 'original': i} for i in range(MAX_REPORTED_DIFFERENCES)]
+    assert reported[-1] == {'path': '...', 'note': f'Only first {MAX_REPORTED_DIFFERENCES} differences are reported'}
+
+    assert len(get_differences(original, {}, limit=MAX_REPORTED_DIFFERENCES + 50)) == MAX_REPORTED_DIFFERENCES + 50
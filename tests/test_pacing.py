@@ -0,0 +1,111 @@
+import asyncio
+import types
+
+import pytest
+
+from zelig import client, pacing
+from zelig.constants import PlaybackPacing
+from zelig.pacing import get_pacer
+
+FIRST_TIMESTAMP = 100.0
+
+
+class FakeClock:
+    # Stands in for event loop time, waiting only moves the clock forward
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    async def wait(self, duration, reserve=0, loop=None):
+        self.now += max(0, duration - reserve)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(pacing, 'wait', clock.wait)
+    return clock
+
+
+def make_request(timestamp):
+    return types.SimpleNamespace(timestamp=timestamp)
+
+
+def make_config(pacing_mode, concurrency=1, speed=1):
+    return types.SimpleNamespace(playback_pacing=pacing_mode, playback_concurrency=concurrency, playback_speed=speed)
+
+
+async def get_send_times(clock, pacing_mode, timestamps, speed=1, latency=0, request_time=0):
+    pacer = get_pacer(make_config(pacing_mode, speed=speed), FIRST_TIMESTAMP, loop=clock)
+    sent = []
+    for timestamp in timestamps:
+        await pacer.pace(make_request(timestamp), {'latency': latency})
+        sent.append(clock.now - 1000.0)
+        # Request is played before the next one is paced
+        clock.now += request_time
+    return sent
+
+
+async def test_open_loop_follows_recorded_offsets(clock):
+    # Requests are sent at their recorded offsets divided by speed, however long requests take
+    sent = await get_send_times(clock, PlaybackPacing.OPEN_LOOP, [100, 100.5, 102, 102], speed=2, request_time=0.1)
+    assert sent == pytest.approx([0, 0.25, 1, 1.1])
+
+
+async def test_scaled_keeps_intervals_between_sends(clock):
+    sent = await get_send_times(clock, PlaybackPacing.SCALED, [100, 101, 103], speed=2, request_time=0.2)
+    assert sent == pytest.approx([0, 0.5, 1.5])
+
+
+async def test_recorded_waits_interval_minus_latency(clock):
+    sent = await get_send_times(clock, PlaybackPacing.RECORDED, [100, 101, 103], latency=0.25)
+    assert sent == pytest.approx([0, 0.75, 2.5])
+
+
+async def test_none_does_not_wait(clock):
+    sent = await get_send_times(clock, PlaybackPacing.NONE, [100, 110, 120])
+    assert sent == [0, 0, 0]
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+def play(loop, monkeypatch, config, requests):
+    # Returns the largest number of requests that were in flight at once
+    in_flight, played = set(), []
+    peak = 0
+
+    async def play_request(session, request, original_response, config, reporter, index):
+        nonlocal peak
+        in_flight.add(index)
+        peak = max(peak, len(in_flight))
+        await asyncio.sleep(0.01, loop=loop)
+        in_flight.discard(index)
+        played.append(index)
+
+    async def interactions():
+        for i in range(1, requests + 1):
+            yield i, make_request(FIRST_TIMESTAMP), {'latency': 0}
+
+    monkeypatch.setattr(client, 'play_request', play_request)
+    monkeypatch.setattr(client, 'create_client_session', lambda config, loop: FakeSession())
+    loop.run_until_complete(client.play_interactions(config, loop, None, interactions(), FIRST_TIMESTAMP))
+    assert sorted(played) == list(range(1, requests + 1))
+    return peak
+
+
+@pytest.mark.parametrize('concurrency', [1, 3])
+def test_concurrency_is_bounded(loop, monkeypatch, concurrency):
+    assert play(loop, monkeypatch, make_config(PlaybackPacing.NONE, concurrency=concurrency), 10) == concurrency
+
+
+def test_open_loop_is_not_bounded(loop, monkeypatch):
+    # Requests due at the same time are all sent, whatever the concurrency limit is
+    assert play(loop, monkeypatch, make_config(PlaybackPacing.OPEN_LOOP, concurrency=1), 10) > 1
@@ -0,0 +1,37 @@
+import pytest
+from vcr.request import Request
+
+from zelig.persisters import StreamCassetteWriter, iter_stream_cassette
+
+
+def write_stream_cassette(path, urls):
+    with StreamCassetteWriter(path) as writer:
+        for url in urls:
+            writer.append(Request('GET', url, b'', {}), {
+                'status': {'code': 200, 'message': 'OK'},
+                'headers': {},
+                'body': {'string': b'body'},
+            })
+
+
+def test_corrupt_interaction_is_skipped(tmpdir):
+    path = str(tmpdir.join('data'))
+    write_stream_cassette(path, ['http://example.com/1'])
+    with open(path, 'a') as f:
+        f.write('{"request": \n')
+    write_stream_cassette(path, ['http://example.com/2'])
+
+    interactions = iter_stream_cassette(path, skip_invalid=True)
+    assert [request.uri for request, _ in interactions] == ['http://example.com/1', 'http://example.com/2']
+
+    with pytest.raises(ValueError):
+        list(iter_stream_cassette(path))
+
+
+def test_partly_written_interaction_is_ignored(tmpdir):
+    path = str(tmpdir.join('data'))
+    write_stream_cassette(path, ['http://example.com/1'])
+    with open(path, 'a') as f:
+        f.write('{"request": {')
+
+    assert [request.uri for request, _ in iter_stream_cassette(path)] == ['http://example.com/1']
@@ -0,0 +1,53 @@
+from zelig.results import ResultsWriter, read_positions, read_report, iter_headers, iter_reports
+
+
+def make_report(result, body):
+    return {
+        'request': {'method': 'GET', 'url': 'http://example.com/items', 'body': None},
+        'original_response': {'body': {'string': body}},
+        'result': result,
+    }
+
+
+def test_reports_are_read_back(tmpdir):
+    directory = str(tmpdir)
+    writer = ResultsWriter(directory)
+    writer.write(1, make_report('Responses mismatch', 'first'), 'GET /items')
+    writer.write(2, make_report('Responses mismatch', 'second'), 'GET /items')
+    writer.close()
+
+    positions = read_positions(directory)
+    assert sorted(positions) == [1, 2]
+    assert read_report(directory, 2, positions)['original_response']['body']['string'] == 'second'
+    assert read_report(directory, 1)['original_response']['body']['string'] == 'first'
+    assert read_report(directory, 3) is None
+    assert list(iter_headers(directory)) == [
+        {'index': 1, 'result': 'Responses mismatch', 'endpoint': 'GET /items'},
+        {'index': 2, 'result': 'Responses mismatch', 'endpoint': 'GET /items'},
+    ]
+    assert [index for index, _ in iter_reports(directory)] == [1, 2]
+
+
+def test_latest_report_of_request_wins(tmpdir):
+    directory = str(tmpdir)
+    writer = ResultsWriter(directory)
+    writer.write(1, make_report('Responses mismatch', 'old'), 'GET /items')
+    writer.write(2, make_report('Responses mismatch', 'other'), 'GET /items')
+    writer.flush()
+    # Reports appended to the same directory by a later run replace earlier ones
+    writer.write(1, make_report('Responses mismatch', 'new'), 'GET /items')
+    writer.close()
+
+    assert read_report(directory, 1)['original_response']['body']['string'] == 'new'
+    assert read_report(directory, 2)['original_response']['body']['string'] == 'other'
+
+
+def test_index_points_only_to_flushed_lines(tmpdir):
+    directory = str(tmpdir)
+    writer = ResultsWriter(directory)
+    writer.write(1, make_report('Responses mismatch', 'first'), 'GET /items')
+    assert read_positions(directory) == {}
+
+    writer.flush()
+    assert list(read_positions(directory)) == [1]
+    writer.close()
@@ -0,0 +1,45 @@
+import os
+
+from zelig.constants import ZeligMode
+from zelig.persisters import iter_stream_cassette
+
+from tests.conftest import make_config
+
+
+def get_routes(upstream):
+    return [{'upstream': str(upstream.make_url('/')), 'prefix': '/api', 'name': 'api'}]
+
+
+async def test_routed_upstream_is_recorded_and_served(zelig, upstream, test_client, tmpdir):
+    data_directory = str(tmpdir.join('data'))
+    record_app, _, _ = zelig(make_config(ZeligMode.RECORD, data_directory, routes=get_routes(upstream)))
+    record_client = await test_client(record_app)
+
+    response = await record_client.get('/api/items')
+    assert response.status == 200
+    assert await response.text() == 'GET /api/items 1'
+
+    # Routed upstreams are not intercepted by vcr, so the interaction is recorded by Zelig to the route's shard
+    [(request, recorded)] = list(iter_stream_cassette(os.path.join(data_directory, 'api')))
+    assert request.method == 'GET'
+    assert request.path == '/api/items'
+    assert recorded['status']['code'] == 200
+    assert recorded['body']['string'] == b'GET /api/items 1'
+    assert recorded['latency'] is not None
+
+    serve_app, _, _ = zelig(make_config(ZeligMode.SERVE, data_directory, routes=get_routes(upstream)))
+    serve_client = await test_client(serve_app)
+
+    response = await serve_client.get('/api/items')
+    assert response.status == 200
+    assert await response.text() == 'GET /api/items 1'
+    assert upstream.hits['GET', '/api/items'] == 1
+
+
+async def test_request_without_route_is_rejected(zelig, upstream, test_client, tmpdir):
+    app, _, _ = zelig(make_config(ZeligMode.RECORD, str(tmpdir.join('data')), routes=get_routes(upstream)))
+    client = await test_client(app)
+
+    response = await client.get('/other')
+    assert response.status == 404
+    assert not upstream.hits
@@ -0,0 +1,50 @@
+from vcr.request import Request
+
+from zelig.constants import ZeligMode, BODY_DIGEST_KEY
+
+from tests.conftest import make_config
+
+TARGET = 'http://example.com'
+
+
+def recorded_response(body):
+    return {
+        'status': {'code': 200, 'message': 'OK'},
+        'headers': {'Content-Type': 'text/plain'},
+        'body': body,
+        'url': f'{TARGET}/large',
+    }
+
+
+async def test_recorded_body_is_served(zelig, test_client, tmpdir):
+    app, cassette, _ = zelig(make_config(ZeligMode.SERVE, str(tmpdir.join('data')), target_server_base_url=TARGET))
+    cassette.append(Request('GET', f'{TARGET}/large', b'', {}), recorded_response({'string': b'recorded body'}))
+    client = await test_client(app)
+
+    response = await client.get('/large')
+    assert response.status == 200
+    assert await response.read() == b'recorded body'
+
+
+async def test_body_over_stream_cap_is_not_served(zelig, test_client, tmpdir):
+    app, cassette, _ = zelig(make_config(ZeligMode.SERVE, str(tmpdir.join('data')), target_server_base_url=TARGET))
+    # Body that was over ZELIG_STREAM_BODY_CAP is recorded the way BodyRecorder stores it
+    truncated = {'string': b'', BODY_DIGEST_KEY: '0' * 64, 'length': 100}
+    cassette.append(Request('GET', f'{TARGET}/large', b'', {}), recorded_response(truncated))
+    client = await test_client(app)
+
+    response = await client.get('/large')
+    assert response.status == 502
+    assert '100 bytes' in await response.text()
+
+
+async def test_admin_path_is_not_proxied(zelig, test_client, tmpdir):
+    app, _, _ = zelig(make_config(ZeligMode.SERVE, str(tmpdir.join('data')), target_server_base_url=TARGET))
+    client = await test_client(app)
+
+    response = await client.get('/__zelig__/reload')
+    assert response.status == 405
+    assert response.headers['Allow'] == 'POST'
+
+    response = await client.get('/__zelig__/unknown')
+    assert response.status == 404
@@ -1,11 +1,86 @@
-from aiohttp import web
+from aiohttp import web, ClientSession
+
+from zelig.coalesce import SingleFlight
+from zelig.constants import ZeligMode
+from zelig.metrics import Metrics, NullMetrics, metrics_middleware, metrics_handler
+from zelig.routing import routing_middleware
+from zelig.session import create_client_session, UnpatchedClientSession
 
 
 class ZeligServerApplication(web.Application):
     def __init__(self, config, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._config = config
+        self._cassette = None
+        self._simulator = None
+        self._upstream_router = None
+        self._client_session = None
+        self._single_flight = SingleFlight() if getattr(config, 'coalesce_requests', False) else None
+        if getattr(config, 'metrics_enabled', False):
+            self._metrics = Metrics(config.mode)
+            self.middlewares.append(metrics_middleware)
+            self.router.add_route('GET', f'{config.admin_path}/metrics', metrics_handler)
+        else:
+            self._metrics = NullMetrics()
+        self.middlewares.append(routing_middleware)
+        self.on_startup.append(self._open_client_session)
+        self.on_startup.append(self._open_upstream_sessions)
+        self.on_cleanup.append(self._close_upstream_sessions)
+        self.on_cleanup.append(self._close_client_session)
 
     @property
     def config(self):
         return self._config
+
+    @property
+    def cassette(self):
+        return self._cassette
+
+    @cassette.setter
+    def cassette(self, cassette):
+        self._cassette = cassette
+
+    @property
+    def upstream_router(self):
+        return self._upstream_router
+
+    @upstream_router.setter
+    def upstream_router(self, upstream_router):
+        self._upstream_router = upstream_router
+
+    @property
+    def simulator(self):
+        return self._simulator
+
+    @simulator.setter
+    def simulator(self, simulator):
+        self._simulator = simulator
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @property
+    def single_flight(self):
+        return self._single_flight
+
+    @property
+    def client_session(self):
+        return self._client_session
+
+    async def _open_client_session(self, app):
+        # Streamed and cached responses are recorded by Zelig itself, so vcr should not intercept them
+        unpatched = getattr(self.config, 'stream_responses', False) or self.config.mode == ZeligMode.CACHE
+        session_class = UnpatchedClientSession if unpatched else ClientSession
+        self._client_session = create_client_session(self.config, loop=self.loop, session_class=session_class)
+
+    async def _close_client_session(self, app):
+        if self._client_session is not None:
+            self._client_session.close()
+            self._client_session = None
+
+    async def _open_upstream_sessions(self, app):
+        await self._upstream_router.open_sessions(app)
+
+    async def _close_upstream_sessions(self, app):
+        await self._upstream_router.close_sessions(app)
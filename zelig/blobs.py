@@ -0,0 +1,105 @@
+import hashlib
+import os
+import threading
+
+BLOBS_SUFFIX = '.blobs'
+BLOB_KEY = '__blob__'
+ENCODING_KEY = 'encoding'
+TMP_SUFFIX = '.tmp'
+# Smaller bodies are cheaper to keep in the cassette than to reference
+MIN_BLOB_SIZE = 512
+
+
+class MissingBlobError(Exception):
+    # Not a ValueError, which vcr takes for a missing cassette, so a cassette with a lost body is never loaded partly
+    pass
+
+
+def get_blobs_path(cassette_path):
+    return f'{cassette_path}{BLOBS_SUFFIX}'
+
+
+class BlobStore:
+    # Bodies are written once to a file named by their SHA-256 hash, interactions keep only the hash.
+    # Every body is read once and the same bytes object is shared by all interactions referencing it.
+    # Bodies are stored as they are, so the store can be shared by cassettes with different compression.
+
+    def __init__(self, directory):
+        self.directory = directory
+        # Stored bytes and text decoded from them, keyed by digest and encoding
+        self._bodies = {}
+        self._lock = threading.Lock()
+
+    def get_path(self, digest):
+        # Bodies are spread over subdirectories, so none of them gets too large
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.get_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Body is moved in place when complete, so concurrent writers and readers never see a partial one
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}{TMP_SUFFIX}'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def _read(self, digest):
+        try:
+            with open(self.get_path(digest), 'rb') as f:
+                return f.read()
+        except IOError:
+            raise MissingBlobError(f'Body {digest} not found in {self.directory}')
+
+    def get(self, digest, encoding=None):
+        # Returns stored bytes, or text decoded from them when `encoding` is given
+        key = (digest, encoding)
+        body = self._bodies.get(key)
+        if body is None:
+            with self._lock:
+                body = self._bodies.get(key)
+                if body is None:
+                    body = self._bodies.get((digest, None))
+                    if body is None:
+                        body = self._bodies[(digest, None)] = self._read(digest)
+                    if encoding is not None:
+                        body = self._bodies[key] = body.decode(encoding)
+        return body
+
+    def reference(self, body):
+        # Returns reference to the stored body, small and missing bodies are kept as they are.
+        # Text bodies are stored encoded, their encoding is kept in the reference, so they are resolved as text.
+        if isinstance(body, str):
+            data = body.encode('utf-8')
+            reference = {ENCODING_KEY: 'utf-8'}
+        else:
+            data, reference = body, {}
+        if not isinstance(data, (bytes, bytearray, memoryview)) or len(data) < MIN_BLOB_SIZE:
+            return body
+        reference[BLOB_KEY] = self.put(bytes(data))
+        return reference
+
+    def resolve(self, body, as_bytes=False):
+        # Returns body of the same type it was referenced with, or stored bytes when `as_bytes` is set
+        if isinstance(body, dict) and BLOB_KEY in body:
+            return self.get(body[BLOB_KEY], None if as_bytes else body.get(ENCODING_KEY))
+        return body
+
+    def count(self):
+        # Bodies that were being written when writer was interrupted are not counted
+        return sum(len([f for f in files if not f.endswith(TMP_SUFFIX)]) for _, _, files in os.walk(self.directory))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_blob_store(directory):
+    # One store per directory in a process, so cassettes sharing blobs share bodies in memory too
+    directory = os.path.abspath(directory)
+    with _stores_lock:
+        if directory not in _stores:
+            _stores[directory] = BlobStore(directory)
+        return _stores[directory]
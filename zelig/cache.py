@@ -0,0 +1,100 @@
+import collections
+import queue
+import threading
+import time
+
+from zelig.coalesce import COALESCED_METHODS
+from zelig.constants import BODY_DIGEST_KEY
+from zelig.log import logger
+
+_STOP = object()
+
+
+def get_response_size(response):
+    body = response['body']
+    headers_size = sum(len(k) + len(str(v)) for k, v in response['headers'].items())
+    return len(body.get('string') or b'') + headers_size
+
+
+def is_cacheable(response):
+    # Bodies that were too large to be recorded are stored as digest only and could not be served
+    return response is not None and BODY_DIGEST_KEY not in response['body']
+
+
+def should_cache(method, response):
+    # Requests that change server state are always sent to the target server,
+    # and error responses are not kept, so transient failures are not served again
+    return method in COALESCED_METHODS and response['status']['code'] < 400
+
+
+class ResponseCache:
+    # Least recently used responses are evicted when their total size exceeds `max_size` bytes.
+    # Responses older than `ttl` seconds are not returned, ttl of 0 means they never expire
+
+    def __init__(self, max_size, ttl=0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.size = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        response, _, expires = entry
+        if expires is not None and expires <= time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def put(self, key, response):
+        size = get_response_size(response)
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_size:
+            return
+        expires = time.time() + self.ttl if self.ttl else None
+        self._entries[key] = (response, size, expires)
+        self.size += size
+        while self.size > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+
+class CassetteAppender:
+    # New interactions are appended to cassette by a background thread, so writing them does not block event loop
+
+    def __init__(self, cassette):
+        self._cassette = cassette
+        self._queue = queue.Queue()
+        self._writer = None
+
+    def __enter__(self):
+        self._writer = threading.Thread(target=self._append_interactions, name='zelig-cassette-appender', daemon=True)
+        self._writer.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._writer = None
+
+    def _append_interactions(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            try:
+                self._cassette.append(*item)
+            except Exception as e:
+                logger.error(f'Could not save response to cassette. {e!r}')
+
+    def append(self, request, response):
+        self._queue.put((request, response))
@@ -0,0 +1,274 @@
+import collections
+import hashlib
+import json
+import os
+import xmlrpc.client
+from urllib.parse import parse_qs
+from xml.parsers.expat import ExpatError
+
+import vcr
+from vcr.cassette import Cassette
+from vcr.errors import UnhandledHTTPRequestError
+from vcr.util import read_body
+
+from zelig.constants import RequestMatchCriteria, CassetteFormat, Compression
+from zelig.matchers import get_fingerprint
+from zelig.persisters import ReadOnlyCassetteError, get_persister, get_stream_position, read_stream_tail
+from zelig.sidecar import load_sidecar, save_sidecar
+
+
+def _normalize_body(request):
+    body = read_body(request) or b''
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    content_type = (request.headers.get('Content-Type') or '').lower()
+    try:
+        # Same transformations as vcr's 'body' matcher applies before comparing
+        if 'application/x-www-form-urlencoded' in content_type:
+            body = json.dumps(sorted(parse_qs(body.decode('ascii')).items())).encode('utf-8')
+        elif 'application/json' in content_type:
+            body = json.dumps(json.loads(body.decode('utf-8')), sort_keys=True).encode('utf-8')
+        elif 'text/xml' in content_type and 'xmlrpc' in (request.headers.get('User-Agent') or '').lower():
+            params, method = xmlrpc.client.loads(body)
+            body = xmlrpc.client.dumps(params, method).encode('utf-8')
+    except (ValueError, ExpatError, xmlrpc.client.Error):
+        pass
+    return hashlib.sha1(body).hexdigest()
+
+
+def _get_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Interactions read from changed cassette: either ones appended to stream cassette
+# or a whole cassette loaded again with number of leading interactions that did not change
+CassetteChanges = collections.namedtuple('CassetteChanges', 'stat position appended staged unchanged')
+
+
+REQUEST_KEY_BUILDERS = {
+    RequestMatchCriteria.METHOD.value: lambda r: r.method,
+    RequestMatchCriteria.SCHEME.value: lambda r: r.scheme,
+    RequestMatchCriteria.HOST.value: lambda r: r.host,
+    RequestMatchCriteria.PORT.value: lambda r: r.port,
+    RequestMatchCriteria.PATH.value: lambda r: r.path,
+    RequestMatchCriteria.QUERY.value: lambda r: tuple(r.query),
+    RequestMatchCriteria.BODY.value: _normalize_body,
+}
+
+
+# Keeps a hash index of recorded requests keyed on the configured match criteria,
+# so looking up a request does not scan the whole cassette
+class ZeligCassette(Cassette):
+    def __init__(self, *args, retain_recorded=True, sidecar=False, allow_playback_repeats=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Changed cassette is loaded again with the same arguments
+        self._init_args = (args, dict(kwargs, retain_recorded=retain_recorded, sidecar=sidecar,
+                                      allow_playback_repeats=allow_playback_repeats))
+        # Responses are played any number of times, the first matching one is always played
+        self.allow_playback_repeats = allow_playback_repeats
+        self._loaded_stat = None
+        self._stream_position = None
+        self._match_on_names = [m.__name__ for m in self._match_on]
+        self._key_builders = [REQUEST_KEY_BUILDERS[name] for name in self._match_on_names]
+        self._index = collections.defaultdict(list)
+        # Position of the first possibly unplayed interaction in every index bucket
+        self._cursors = collections.defaultdict(int)
+        # Streaming persisters get every new interaction as soon as it is recorded
+        self._streaming = hasattr(self._persister, 'open_writer')
+        # Read-only cassettes are only loaded, nothing could be recorded to them
+        self._read_only = getattr(self._persister, 'read_only', False)
+        self._writer = None
+        self._loading = False
+        self._retain_recorded = retain_recorded
+        # Parsed cassette and its index are cached in a sidecar file, stream cassettes are parsed fast enough
+        self._sidecar = sidecar and not self._streaming
+        self._index_prebuilt = False
+        # Response fingerprints are computed on first use, so bodies of memory-mapped cassettes are not read
+        self._fingerprints = {}
+
+    def request_key(self, request):
+        return tuple(build(request) for build in self._key_builders)
+
+    def append(self, request, response):
+        if self._read_only and not self._loading:
+            raise ReadOnlyCassetteError(f'Cassette {self._path!r} is read-only, request {request!r} is not recorded')
+        length = len(self.data)
+        super().append(request, response)
+        if len(self.data) == length:
+            return
+        stored_request, stored_response = self.data[-1]
+        if self._streaming and not self._loading:
+            if self._writer is None:
+                self._writer = self._persister.open_writer(self._path)
+            self._writer.append(stored_request, stored_response)
+            self.dirty = False
+        if not self._retain_recorded and not self._loading:
+            # Newly recorded interactions are not looked up, streamed ones are not even kept in memory
+            if self._streaming:
+                self.data.pop()
+            return
+        if self._index_prebuilt:
+            return
+        self._index[self.request_key(stored_request)].append(length)
+
+    def _load(self):
+        self._loading = True
+        self._loaded_stat = _get_stat(self._path)
+        if self._streaming and self._loaded_stat is not None:
+            self._stream_position = get_stream_position(self._path)
+        try:
+            if self._sidecar and self._load_sidecar():
+                return
+            super()._load()
+            if self._sidecar and self.data:
+                save_sidecar(self._path, self.data, self._match_on_names, dict(self._index))
+        finally:
+            self._loading = False
+
+    def _load_sidecar(self):
+        sidecar = load_sidecar(self._path)
+        if sidecar is None:
+            return False
+        # Prebuilt index is reused when cassette is matched on the same criteria
+        self._index_prebuilt = sidecar['match_on'] == self._match_on_names
+        try:
+            for request, response in sidecar['data']:
+                self.append(request, response)
+        finally:
+            self._index_prebuilt = False
+        if sidecar['match_on'] == self._match_on_names:
+            self._index.update(sidecar['index'])
+        else:
+            save_sidecar(self._path, self.data, self._match_on_names, dict(self._index))
+        self.dirty = False
+        self.rewound = True
+        return True
+
+    def changed(self):
+        return _get_stat(self._path) != self._loaded_stat
+
+    def load_changes(self):
+        # Changes are read outside of event loop, cassette itself is only changed by apply_changes
+        stat = _get_stat(self._path)
+        if self._streaming and self._stream_position is not None and stat is not None:
+            tail = read_stream_tail(self._path, self._stream_position)
+            if tail is not None:
+                appended, position = tail
+                return CassetteChanges(stat, position, appended, None, len(self.data))
+        args, kwargs = self._init_args
+        staged = type(self)(*args, **kwargs)
+        staged._load()
+        unchanged = 0
+        for (request, response), (staged_request, staged_response) in zip(self.data, staged.data):
+            if request._to_dict() != staged_request._to_dict() or response != staged_response:
+                break
+            unchanged += 1
+        return CassetteChanges(staged._loaded_stat, staged._stream_position, None, staged, unchanged)
+
+    def apply_changes(self, changes):
+        # Changes are applied without yielding to event loop, so requests never see a partially updated cassette.
+        # Unchanged interactions keep their play counts and fingerprints. Returns number of new interactions.
+        self._loaded_stat, self._stream_position = changes.stat, changes.position
+        if changes.staged is None:
+            self._loading = True
+            try:
+                for request, response in changes.appended:
+                    self.append(request, response)
+            finally:
+                self._loading = False
+        else:
+            staged = changes.staged
+            self.data, self._index, self._cursors = staged.data, staged._index, staged._cursors
+            self.play_counts = collections.Counter(
+                {i: count for i, count in self.play_counts.items() if i < changes.unchanged})
+            self._fingerprints = {i: f for i, f in self._fingerprints.items() if i < changes.unchanged}
+        # Reloaded interactions are already in the file
+        self.dirty = False
+        return len(self.data) - changes.unchanged
+
+    def _save(self, force=False):
+        if self._read_only:
+            return
+        if self._streaming:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            return
+        super()._save(force=force)
+
+    def _candidates(self, request):
+        request = self._before_record_request(request)
+        if not request:
+            return None, ()
+        key = self.request_key(request)
+        return key, self._index.get(key, ())
+
+    def _responses(self, request):
+        _, candidates = self._candidates(request)
+        for index in candidates:
+            yield index, self.data[index][1]
+
+    def find_response(self, request):
+        for index, response in self._responses(request):
+            return index, response
+        return None, None
+
+    def fingerprint(self, index):
+        if index not in self._fingerprints:
+            self._fingerprints[index] = get_fingerprint(self.data[index][1])
+        return self._fingerprints[index]
+
+    def _first_unplayed(self, request):
+        key, candidates = self._candidates(request)
+        if not candidates:
+            return None
+        if self.allow_playback_repeats:
+            return candidates[0]
+        position = self._cursors[key]
+        while position < len(candidates) and self.play_counts[candidates[position]]:
+            position += 1
+        self._cursors[key] = position
+        return candidates[position] if position < len(candidates) else None
+
+    def play_response(self, request):
+        index = self._first_unplayed(request)
+        if index is None:
+            raise UnhandledHTTPRequestError(
+                f'The cassette ({self._path!r}) doesn\'t contain the request ({request!r}) asked for')
+        self.play_counts[index] += 1
+        return self.data[index][1]
+
+    def __contains__(self, request):
+        return self._first_unplayed(request) is not None
+
+
+zelig_vcr = vcr.VCR()
+
+
+def _get_cassette_args(path, cassette_format, compression, retain_recorded, persister, sidecar, **kwargs):
+    cassette_kwargs = zelig_vcr.get_merged_config(path=path, **kwargs)
+    # Existing cassette is always read and appended in its own format
+    cassette_kwargs['persister'] = persister or get_persister(path, default_format=cassette_format,
+                                                              compression=compression)
+    cassette_kwargs['retain_recorded'] = retain_recorded
+    cassette_kwargs['allow_playback_repeats'] = kwargs.get('allow_playback_repeats', False)
+    cassette_kwargs['sidecar'] = sidecar and persister is None
+    return cassette_kwargs
+
+
+def use_cassette(path, cassette_format=CassetteFormat.YAML, compression=Compression.NONE, retain_recorded=True,
+                 persister=None, sidecar=False, **kwargs):
+    def args_getter():
+        return _get_cassette_args(path, cassette_format, compression, retain_recorded, persister, sidecar, **kwargs)
+    return ZeligCassette.use_arg_getter(args_getter)
+
+
+def load_cassette(path, cassette_format=CassetteFormat.YAML, compression=Compression.NONE, retain_recorded=True,
+                  persister=None, sidecar=False, **kwargs):
+    # Loads cassette without patching HTTP clients, requests of such cassette are recorded and played by Zelig
+    return ZeligCassette.load(**_get_cassette_args(path, cassette_format, compression, retain_recorded, persister,
+                                                   sidecar, **kwargs))
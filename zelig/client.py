@@ -1,57 +1,117 @@
 import asyncio
+import itertools
+import time
 
 import aiohttp
 
+from zelig.blobs import MissingBlobError
 from zelig.constants import ZeligMode
 from zelig.log import logger
 from zelig.matchers import match_responses
+from zelig.pacing import get_pacer
 from zelig.report import Reporter
+from zelig.session import create_client_session
 from zelig.utils import (
-    load_data, extract_vcr_request_info, wait, extract_response_info, extract_error_response_info, get_query_string
+    iter_data, extract_vcr_request_info, extract_response_info, extract_error_response_info, get_query_string
 )
 
 
-async def playback(config, loop, reporter):
-    logger.info('Loading data {data}'.format(data=config.data_directory))
+async def play_request(session, request, original_response, config, reporter, index):
+    request_info = extract_vcr_request_info(request)
+    try:
+        started = time.time()
+        async with session.request(**request_info) as response:
+            logger.info('{request[method]} {request[url]}{qs} - {status}'.format(
+                request=request_info, status=response.status, qs=get_query_string(request_info['params'])))
+            received_response = await extract_response_info(response)
+        # Latency is measured the same way as in 'record' mode: until the whole body is read
+        reporter.record_latency(request_info['method'], request_info['url'], original_response.get('latency'),
+                                time.time() - started)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning('{request[method]} {request[url]}{qs} - Failed: {error}'.format(
+            request=request_info, qs=get_query_string(request_info['params']), error=str(e) or repr(e)))
+        received_response = extract_error_response_info(request_info, e)
+
+    match_on = [m.value for m in config.response_match_on]
+    match = match_responses(original_response, received_response, match_on, ignore_paths=config.response_ignore_paths)
+    logger.debug(f'Responses match: {match}')
+    if not match:
+        await reporter.report({
+            'request': request_info,
+            'original_response': original_response,
+            'received_response': received_response,
+            'result': 'Responses {}'.format('match' if match else 'mismatch')
+        }, request_index=index)
+    reporter.record_metadata()
+
+
+async def enumerate_interactions(interactions):
+    for (i, (request, original_response)) in enumerate(interactions, 1):
+        yield i, request, original_response
+
+
+def load_interactions(path, sidecar=False):
+    logger.info('Loading data {data}'.format(data=path))
     try:
-        requests, responses = load_data(config.data_directory)
-    except ValueError as e:
+        # Interactions of stream cassettes are read lazily while playing
+        interactions = iter_data(path, sidecar=sidecar)
+        first_interaction = next(interactions)
+    except (ValueError, MissingBlobError) as e:
         logger.error(f'Error while loading data: {str(e)}')
+        return None
+    except StopIteration:
+        logger.error('Error while loading data: cassette is empty')
+        return None
+    first_request, _ = first_interaction
+    return first_request, itertools.chain([first_interaction], interactions)
+
+
+async def play_interactions(config, loop, reporter, interactions, first_timestamp):
+    # Interactions are asynchronously iterated (index, request, original_response) tuples
+    pacer = get_pacer(config, first_timestamp, loop=loop)
+    logger.info(f'Playback pacing: {config.playback_pacing.value}')
+    # Keep at most `playback_concurrency` requests in flight unless pacing is open-loop
+    semaphore = asyncio.Semaphore(config.playback_concurrency, loop=loop)
+    in_flight = set()
+
+    def on_request_played(task):
+        in_flight.discard(task)
+        if pacer.bounded:
+            semaphore.release()
+        if not task.cancelled() and task.exception():
+            logger.error(f'Error while playing request: {task.exception()!r}')
+
+    async with create_client_session(config, loop=loop) as session:
+        try:
+            async for (i, request, original_response) in interactions:
+                if pacer.bounded:
+                    await semaphore.acquire()
+                await pacer.pace(request, original_response)
+
+                task = loop.create_task(play_request(session, request, original_response, config, reporter, index=i))
+                task.add_done_callback(on_request_played)
+                in_flight.add(task)
+        finally:
+            # Requests already sent are finished and reported even when reading interactions failed
+            if in_flight:
+                await asyncio.wait(in_flight, loop=loop)
+
+
+async def playback(config, loop, reporter):
+    loaded = load_interactions(config.data_directory, sidecar=config.load_cache)
+    if loaded is None:
         return
-    logger.info(f'Loaded {len(requests)} request-response pairs')
-
-    async with aiohttp.ClientSession() as session:
-        offset = requests[0].timestamp
-        for (i, (request, original_response)) in enumerate(zip(requests, responses), 1):
-            await wait(request.timestamp - offset, original_response['latency'], loop=loop)
-            offset = request.timestamp
-
-            request_info = extract_vcr_request_info(request)
-            try:
-                async with session.request(**request_info) as response:
-                    logger.info('{request[method]} {request[url]}{qs} - {status}'.format(
-                        request=request_info, status=response.status, qs=get_query_string(request_info['params'])))
-                    received_response = await extract_response_info(response)
-            except aiohttp.ClientError as e:
-                logger.warning('{request[method]} {request[url]}{qs} - Failed: {error}'.format(
-                    request=request_info, qs=get_query_string(request_info['params']), error=str(e)))
-                received_response = extract_error_response_info(request_info, e)
-
-            match_on = [m.value for m in config.response_match_on]
-            match = match_responses(original_response, received_response, match_on)
-            logger.debug(f'Responses match: {match}')
-            if not match:
-                reporter.report({
-                    'request': request_info,
-                    'original_response': original_response,
-                    'received_response': received_response,
-                    'result': 'Responses {}'.format('match' if match else 'mismatch')
-                }, request_index=i)
-            reporter.record_metadata()
+    first_request, interactions = loaded
+    await play_interactions(config, loop, reporter, enumerate_interactions(interactions), first_request.timestamp)
+    logger.info(f'Played {reporter.total_played} request-response pairs')
 
 
 def start_playback(config):
-    with Reporter(config.playback_report_directory, mode=ZeligMode.PLAYBACK) as reporter:
+    with Reporter(config.playback_report_directory, mode=ZeligMode.PLAYBACK,
+                  queue_size=config.report_queue_size, queue_policy=config.report_queue_policy,
+                  flush_interval=config.meta_flush_interval / 1000,
+                  ignore_paths=config.response_ignore_paths, compression=config.compression,
+                  layout=config.report_layout) as reporter:
         loop = asyncio.get_event_loop()
         loop.run_until_complete(playback(config, loop, reporter))
         loop.close()
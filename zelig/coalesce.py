@@ -0,0 +1,36 @@
+import asyncio
+
+# Only requests that do not change server state are sent once for all callers
+COALESCED_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class SingleFlight:
+    # Identical requests that arrive while one of them is in flight wait for its result instead of repeating it
+
+    def __init__(self):
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def run(self, key, call, loop):
+        # Returns result of `call` and whether it was made by another caller
+        future = self._calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future, loop=loop), True
+
+        future = self._calls[key] = asyncio.Future(loop=loop)
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Exception is raised to this caller, so it is not logged as never retrieved when nobody waits for it
+            future.exception()
+            raise
+        finally:
+            del self._calls[key]
+        future.set_result(result)
+        return result, False
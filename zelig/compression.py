@@ -0,0 +1,76 @@
+import gzip
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from zelig.constants import Compression
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+EXTENSIONS = {
+    Compression.GZIP: '.gz',
+    Compression.ZSTD: '.zst',
+}
+
+
+def _check_available(compression):
+    if compression == Compression.ZSTD and zstandard is None:
+        raise ValueError('zstd compression requires \'zstandard\' package to be installed')
+
+
+def compress(data, compression):
+    _check_available(compression)
+    if compression == Compression.GZIP:
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    if compression == Compression.ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return data
+
+
+def decompress(data, compression):
+    _check_available(compression)
+    if compression == Compression.GZIP:
+        return gzip.decompress(data)
+    if compression == Compression.ZSTD:
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+def detect_compression(path):
+    # Compressed files are recognized by content, so they are read whatever their name is
+    try:
+        with open(path, 'rb') as f:
+            magic = f.read(len(ZSTD_MAGIC))
+    except IOError:
+        return Compression.NONE
+    if magic.startswith(GZIP_MAGIC):
+        return Compression.GZIP
+    if magic == ZSTD_MAGIC:
+        return Compression.ZSTD
+    return Compression.NONE
+
+
+def get_compression(path, default=Compression.NONE):
+    # Compression of a new file is chosen by its extension and falls back to configured one
+    _, ext = os.path.splitext(path)
+    for compression, extension in EXTENSIONS.items():
+        if ext == extension:
+            return compression
+    return default
+
+
+def open_file(path, mode='r', compression=Compression.NONE):
+    _check_available(compression)
+    # Compressed files are opened in text mode unless binary mode is requested
+    mode = mode if 'b' in mode else mode + 't'
+    if compression == Compression.GZIP:
+        return gzip.open(path, mode, compresslevel=GZIP_LEVEL)
+    if compression == Compression.ZSTD:
+        return zstandard.open(path, mode, cctx=zstandard.ZstdCompressor(level=ZSTD_LEVEL))
+    return open(path, mode)
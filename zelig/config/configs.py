@@ -1,8 +1,16 @@
 from urllib.parse import urlparse
 import os
 
-from zelig.constants import RequestMatchCriteria, ZeligMode, ResponseMatchCriteria, FILES_DIRECTORY
-from .properties import Property, IntProperty, MultiEnumProperty, PathProperty, AutoGeneratedDirectoryProperty
+from zelig.constants import (
+    RequestMatchCriteria, ZeligMode, ResponseMatchCriteria, PlaybackPacing, PlaybackShardBy, CassetteFormat,
+    CoalesceRecord, Compression, ReportQueuePolicy, ReportLayout, ServeLatency, ServeBandwidth, FILES_DIRECTORY
+)
+from zelig.persisters import get_cassette_format
+from .errors import InvalidValueError, MissingValueError
+from .properties import (
+    Property, IntProperty, FloatProperty, BoolProperty, EnumProperty, MultiEnumProperty, PathProperty,
+    AutoGeneratedDirectoryProperty, JsonPathListProperty, AddressListProperty, RoutesProperty
+)
 
 DEFAULT_REQUEST_MATCH_ON = ' '.join((cr.value for cr in RequestMatchCriteria))
 DEFAULT_RESPONSE_MATCH_ON = ' '.join((cr.value for cr in ResponseMatchCriteria))
@@ -10,12 +18,26 @@ DEFAULT_RESPONSE_MATCH_ON = ' '.join((cr.value for cr in ResponseMatchCriteria))
 
 class BaseConfig:
     mode = None
+    # Playback workers get requests with full recorded URLs from coordinator, so they do not need the target
+    target_required = True
     base_files_dir = PathProperty(FILES_DIRECTORY)
     data_directory_name = AutoGeneratedDirectoryProperty('ZELIG_DATA_DIRECTORY', prefix='data')
-    target_server_base_url = Property('TARGET_SERVER_BASE_URL')
+    target_server_base_url = Property('TARGET_SERVER_BASE_URL', default='')
+    cassette_format = EnumProperty('ZELIG_CASSETTE_FORMAT', enum_class=CassetteFormat,
+                                   default=CassetteFormat.YAML.value)
+    compression = EnumProperty('ZELIG_COMPRESSION', enum_class=Compression, default=Compression.NONE.value)
+
+    upstream_pool_size = IntProperty('ZELIG_UPSTREAM_POOL_SIZE', default=100)
+    upstream_pool_size_per_host = IntProperty('ZELIG_UPSTREAM_POOL_SIZE_PER_HOST', default=0)
+    upstream_keepalive_timeout = FloatProperty('ZELIG_UPSTREAM_KEEPALIVE_TIMEOUT', default=15)
+    upstream_dns_cache = BoolProperty('ZELIG_UPSTREAM_DNS_CACHE', default=True)
+    upstream_connect_timeout = FloatProperty('ZELIG_UPSTREAM_CONNECT_TIMEOUT', default=30)
+    upstream_read_timeout = FloatProperty('ZELIG_UPSTREAM_READ_TIMEOUT', default=300)
 
     def __init__(self):
         self.__perform_check()
+        if self.target_required and not self.target_server_base_url and not getattr(self, 'routes', None):
+            raise MissingValueError('You should set \'TARGET_SERVER_BASE_URL\' environment variable')
 
     @property
     def target_server_host(self):
@@ -36,24 +58,81 @@ class PlaybackConfig(BaseConfig):
     mode = ZeligMode.PLAYBACK
 
     data_directory_name = AutoGeneratedDirectoryProperty('ZELIG_DATA_DIRECTORY', prefix='data', required=True)
+    load_cache = BoolProperty('ZELIG_LOAD_CACHE', default=True)
     request_match_on = MultiEnumProperty('REQUEST_MATCH_ON', enum_class=RequestMatchCriteria,
                                          default=DEFAULT_REQUEST_MATCH_ON)
     response_match_on = MultiEnumProperty('RESPONSE_MATCH_ON', enum_class=ResponseMatchCriteria,
                                           default=DEFAULT_RESPONSE_MATCH_ON)
+    response_ignore_paths = JsonPathListProperty('RESPONSE_IGNORE_PATHS', default='')
 
     playback_report_directory_name = AutoGeneratedDirectoryProperty('ZELIG_PLAYBACK_REPORT_DIRECTORY',
                                                                     prefix='playback_report')
+    report_queue_size = IntProperty('ZELIG_REPORT_QUEUE_SIZE', default=1000, min_value=1)
+    report_queue_policy = EnumProperty('ZELIG_REPORT_QUEUE_POLICY', enum_class=ReportQueuePolicy,
+                                       default=ReportQueuePolicy.BLOCK.value)
+    meta_flush_interval = IntProperty('ZELIG_META_FLUSH_INTERVAL', default=500, min_value=1)
+    report_layout = EnumProperty('ZELIG_REPORT_LAYOUT', enum_class=ReportLayout, default=ReportLayout.RESULTS.value)
+    playback_concurrency = IntProperty('ZELIG_PLAYBACK_CONCURRENCY', default=1, min_value=1)
+    playback_pacing = EnumProperty('ZELIG_PLAYBACK_PACING', enum_class=PlaybackPacing,
+                                   default=PlaybackPacing.RECORDED.value)
+    playback_speed = FloatProperty('ZELIG_PLAYBACK_SPEED', default=1, positive=True)
+    playback_workers = IntProperty('ZELIG_PLAYBACK_WORKERS', default=1, min_value=1)
+    playback_remote_workers = AddressListProperty('ZELIG_PLAYBACK_REMOTE_WORKERS', default='')
+    playback_shard_by = EnumProperty('ZELIG_PLAYBACK_SHARD_BY', enum_class=PlaybackShardBy,
+                                     default=PlaybackShardBy.INDEX.value)
+    playback_session_header = Property('ZELIG_PLAYBACK_SESSION_HEADER', default='Authorization')
+    worker_token = Property('ZELIG_WORKER_TOKEN', default='')
+
+    def __init__(self):
+        super().__init__()
+        if self.playback_remote_workers and not self.worker_token:
+            raise MissingValueError('You should set \'ZELIG_WORKER_TOKEN\' environment variable '
+                                    'to the token remote playback workers accept')
 
     @property
     def playback_report_directory(self):
         return os.path.join(self.base_files_dir, self.playback_report_directory_name)
 
+    @property
+    def distributed(self):
+        return self.playback_workers > 1 or bool(self.playback_remote_workers)
+
+
+class PlaybackWorkerConfig(BaseConfig):
+    mode = ZeligMode.PLAYBACK_WORKER
+    target_required = False
+
+    zelig_host = Property('ZELIG_HOST', default='0.0.0.0')
+    zelig_port = IntProperty('ZELIG_PORT', default=8082)
+    # Worker sends requests it gets to the target, so only coordinators knowing the token are accepted
+    worker_token = Property('ZELIG_WORKER_TOKEN')
+    response_match_on = MultiEnumProperty('RESPONSE_MATCH_ON', enum_class=ResponseMatchCriteria,
+                                          default=DEFAULT_RESPONSE_MATCH_ON)
+    response_ignore_paths = JsonPathListProperty('RESPONSE_IGNORE_PATHS', default='')
+    playback_concurrency = IntProperty('ZELIG_PLAYBACK_CONCURRENCY', default=1, min_value=1)
+    playback_pacing = EnumProperty('ZELIG_PLAYBACK_PACING', enum_class=PlaybackPacing,
+                                   default=PlaybackPacing.RECORDED.value)
+    playback_speed = FloatProperty('ZELIG_PLAYBACK_SPEED', default=1, positive=True)
+
+    def __init__(self):
+        super().__init__()
+        if not self.worker_token:
+            raise InvalidValueError('Value of ZELIG_WORKER_TOKEN param should not be empty')
+
 
 class RecordConfig(BaseConfig):
     mode = ZeligMode.RECORD
 
     zelig_host = Property('ZELIG_HOST', default='0.0.0.0')
     zelig_port = IntProperty('ZELIG_PORT', default=8081)
+    metrics_enabled = BoolProperty('ZELIG_METRICS', default=False)
+    admin_path = Property('ZELIG_ADMIN_PATH', default='/__zelig__')
+    routes = RoutesProperty('ZELIG_ROUTES', default='')
+    stream_responses = BoolProperty('ZELIG_STREAM_RESPONSES', default=False)
+    stream_body_cap = IntProperty('ZELIG_STREAM_BODY_CAP', default=10 * 1024 * 1024, min_value=0)
+    coalesce_requests = BoolProperty('ZELIG_COALESCE_REQUESTS', default=False)
+    coalesce_record = EnumProperty('ZELIG_COALESCE_RECORD', enum_class=CoalesceRecord,
+                                   default=CoalesceRecord.SINGLE.value)
 
     request_match_on = MultiEnumProperty('REQUEST_MATCH_ON', enum_class=RequestMatchCriteria,
                                          default=DEFAULT_REQUEST_MATCH_ON)
@@ -63,26 +142,89 @@ class ServeConfig(BaseConfig):
     mode = ZeligMode.SERVE
 
     data_directory_name = AutoGeneratedDirectoryProperty('ZELIG_DATA_DIRECTORY', prefix='data', required=True)
+    load_cache = BoolProperty('ZELIG_LOAD_CACHE', default=True)
+    mmap_bodies = BoolProperty('ZELIG_SERVE_MMAP_BODIES', default=False)
+    workers = IntProperty('ZELIG_WORKERS', default=1, min_value=1)
+    relax_played_once = BoolProperty('ZELIG_RELAX_PLAYED_ONCE', default=False)
+    reload_interval = FloatProperty('ZELIG_RELOAD_INTERVAL', default=0)
+    serve_latency = EnumProperty('ZELIG_SERVE_LATENCY', enum_class=ServeLatency, default=ServeLatency.RECORDED.value)
+    serve_bandwidth = EnumProperty('ZELIG_SERVE_BANDWIDTH', enum_class=ServeBandwidth,
+                                   default=ServeBandwidth.NONE.value)
+    serve_bandwidth_rate = IntProperty('ZELIG_SERVE_BANDWIDTH_RATE', default=1024 * 1024, min_value=1)
+    zelig_host = Property('ZELIG_HOST', default='0.0.0.0')
+    zelig_port = IntProperty('ZELIG_PORT', default=8081)
+    metrics_enabled = BoolProperty('ZELIG_METRICS', default=False)
+    admin_path = Property('ZELIG_ADMIN_PATH', default='/__zelig__')
+    routes = RoutesProperty('ZELIG_ROUTES', default='')
+    request_match_on = MultiEnumProperty('REQUEST_MATCH_ON', enum_class=RequestMatchCriteria,
+                                         default=DEFAULT_REQUEST_MATCH_ON)
+
+    def __init__(self):
+        super().__init__()
+        if self.workers > 1 and not self.relax_played_once:
+            # Every worker marks responses as played only in its own copy of the cassette
+            raise InvalidValueError(f'Running several workers allows every recorded response to be played once '
+                                    f'per worker. Set \'ZELIG_RELAX_PLAYED_ONCE\' to \'true\' to confirm it')
+        if self.mmap_bodies and not os.path.exists(self.data_directory):
+            # Memory-mapped store is built from existing data and is never written back
+            raise InvalidValueError(f'Data with memory-mapped bodies is read-only, so \'ZELIG_DATA_DIRECTORY\' should '
+                                    f'point to existing data when \'ZELIG_SERVE_MMAP_BODIES\' is set')
+
+
+class CacheConfig(BaseConfig):
+    mode = ZeligMode.CACHE
+
+    # New responses are appended to data file as soon as they are cached, so memory stays bounded
+    cassette_format = EnumProperty('ZELIG_CASSETTE_FORMAT', enum_class=CassetteFormat,
+                                   default=CassetteFormat.STREAM.value)
+    load_cache = BoolProperty('ZELIG_LOAD_CACHE', default=True)
     zelig_host = Property('ZELIG_HOST', default='0.0.0.0')
     zelig_port = IntProperty('ZELIG_PORT', default=8081)
+    metrics_enabled = BoolProperty('ZELIG_METRICS', default=False)
+    admin_path = Property('ZELIG_ADMIN_PATH', default='/__zelig__')
+    cache_max_size = IntProperty('ZELIG_CACHE_MAX_SIZE', default=64 * 1024 * 1024, min_value=0)
+    cache_ttl = FloatProperty('ZELIG_CACHE_TTL', default=0)
     request_match_on = MultiEnumProperty('REQUEST_MATCH_ON', enum_class=RequestMatchCriteria,
                                          default=DEFAULT_REQUEST_MATCH_ON)
 
+    def __init__(self):
+        super().__init__()
+        # YAML data is written only when Zelig stops, so cached responses would pile up in memory until then
+        if get_cassette_format(self.data_directory, default=self.cassette_format) == CassetteFormat.YAML:
+            raise InvalidValueError(f'\'cache\' mode appends responses to \'stream\' or \'compact\' data only. '
+                                    f'Set \'ZELIG_CASSETTE_FORMAT\' to one of them and point '
+                                    f'\'ZELIG_DATA_DIRECTORY\' to new data or data in such format')
+
 
 class ObserveConfig(BaseConfig):
     mode = ZeligMode.OBSERVE
 
     data_directory_name = AutoGeneratedDirectoryProperty('ZELIG_DATA_DIRECTORY', prefix='data', required=True)
+    load_cache = BoolProperty('ZELIG_LOAD_CACHE', default=True)
     zelig_host = Property('ZELIG_HOST', default='0.0.0.0')
     zelig_port = IntProperty('ZELIG_PORT', default=8081)
+    metrics_enabled = BoolProperty('ZELIG_METRICS', default=False)
+    admin_path = Property('ZELIG_ADMIN_PATH', default='/__zelig__')
+    routes = RoutesProperty('ZELIG_ROUTES', default='')
+    stream_responses = BoolProperty('ZELIG_STREAM_RESPONSES', default=False)
+    stream_body_cap = IntProperty('ZELIG_STREAM_BODY_CAP', default=10 * 1024 * 1024, min_value=0)
+    coalesce_requests = BoolProperty('ZELIG_COALESCE_REQUESTS', default=False)
+    coalesce_record = EnumProperty('ZELIG_COALESCE_RECORD', enum_class=CoalesceRecord,
+                                   default=CoalesceRecord.SINGLE.value)
 
     request_match_on = MultiEnumProperty('REQUEST_MATCH_ON', enum_class=RequestMatchCriteria,
                                          default=DEFAULT_REQUEST_MATCH_ON)
 
     response_match_on = MultiEnumProperty('RESPONSE_MATCH_ON', enum_class=ResponseMatchCriteria,
                                           default=DEFAULT_RESPONSE_MATCH_ON)
+    response_ignore_paths = JsonPathListProperty('RESPONSE_IGNORE_PATHS', default='')
     observe_report_directory_name = AutoGeneratedDirectoryProperty('ZELIG_OBSERVE_REPORT_DIRECTORY',
                                                                    prefix='observe_report')
+    report_queue_size = IntProperty('ZELIG_REPORT_QUEUE_SIZE', default=1000, min_value=1)
+    report_queue_policy = EnumProperty('ZELIG_REPORT_QUEUE_POLICY', enum_class=ReportQueuePolicy,
+                                       default=ReportQueuePolicy.BLOCK.value)
+    meta_flush_interval = IntProperty('ZELIG_META_FLUSH_INTERVAL', default=500, min_value=1)
+    report_layout = EnumProperty('ZELIG_REPORT_LAYOUT', enum_class=ReportLayout, default=ReportLayout.RESULTS.value)
 
     @property
     def observe_report_directory(self):
@@ -1,5 +1,5 @@
 from .properties import EnumProperty
-from .configs import PlaybackConfig, ServeConfig, RecordConfig, ObserveConfig
+from .configs import PlaybackConfig, ServeConfig, RecordConfig, ObserveConfig, PlaybackWorkerConfig, CacheConfig
 
 from zelig.constants import ZeligMode
 
@@ -12,6 +12,8 @@ class ConfigFactory:
         ZeligMode.SERVE: ServeConfig,
         ZeligMode.RECORD: RecordConfig,
         ZeligMode.OBSERVE: ObserveConfig,
+        ZeligMode.PLAYBACK_WORKER: PlaybackWorkerConfig,
+        ZeligMode.CACHE: CacheConfig,
     }
 
     @classmethod
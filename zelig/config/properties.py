@@ -1,7 +1,10 @@
+import json
 import os
+import re
 import time
 
 from .errors import MissingValueError, InvalidValueError
+from zelig.diff import parse_path
 from zelig.log import logger
 
 notset = object()
@@ -56,11 +59,48 @@ class AutoGeneratedDirectoryProperty(Property):
 
 
 class IntProperty(Property):
+    def __init__(self, key, default=notset, min_value=None):
+        super().__init__(key, default)
+        self.min_value = min_value
+
     def clean(self, value):
         try:
-            return int(value)
+            value = int(value)
         except TypeError:
             raise InvalidValueError(f'Value of {self.key} param should be integer')
+        if self.min_value is not None and value < self.min_value:
+            raise InvalidValueError(f'Value of {self.key} param should be greater or equal to {self.min_value}')
+        return value
+
+
+class FloatProperty(Property):
+    def __init__(self, key, default=notset, positive=False):
+        super().__init__(key, default)
+        self.positive = positive
+
+    def clean(self, value):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise InvalidValueError(f'Value of {self.key} param should be a number')
+        if self.positive and value <= 0:
+            raise InvalidValueError(f'Value of {self.key} param should be greater than 0')
+        return value
+
+
+class BoolProperty(Property):
+    TRUE_VALUES = ('true', '1', 'yes')
+    FALSE_VALUES = ('false', '0', 'no')
+
+    def clean(self, value):
+        if isinstance(value, bool):
+            return value
+        if value.lower() in self.TRUE_VALUES:
+            return True
+        if value.lower() in self.FALSE_VALUES:
+            return False
+        possible_values = ', '.join(self.TRUE_VALUES + self.FALSE_VALUES)
+        raise InvalidValueError(f'Value of {self.key} param should be one of [{possible_values}]')
 
 
 class EnumProperty(Property):
@@ -89,11 +129,66 @@ class MultiEnumProperty(EnumProperty):
         return res
 
 
+class JsonPathListProperty(Property):
+    def clean(self, value):
+        try:
+            return [parse_path(path) for path in value.split()]
+        except ValueError as e:
+            raise InvalidValueError(f'Value of {self.key} param should be space separated JSON paths. {e!s}')
+
+
+class AddressListProperty(Property):
+    def clean(self, value):
+        addresses = []
+        for address in value.split():
+            host, _, port = address.rpartition(':')
+            if not host or not port.isdigit():
+                raise InvalidValueError(f'Value of {self.key} param should be space separated list of host:port')
+            addresses.append((host, int(port)))
+        return addresses
+
+
+class RoutesProperty(Property):
+    # Routes are a JSON list of objects with 'upstream' URL, optional 'host' and path 'prefix' to match requests,
+    # shard 'name' and connection pool settings of the upstream
+    OPTIONS = ('upstream', 'host', 'prefix', 'name', 'pool_size', 'pool_size_per_host', 'keepalive_timeout',
+               'connect_timeout', 'read_timeout')
+    RESERVED_NAMES = ('default',)
+
+    def clean(self, value):
+        if not value:
+            return []
+        try:
+            routes = json.loads(value)
+        except ValueError as e:
+            raise InvalidValueError(f'Value of {self.key} param should be a JSON list of routes. {e!s}')
+        if not isinstance(routes, list) or not all(isinstance(r, dict) and r.get('upstream') for r in routes):
+            raise InvalidValueError(f'Value of {self.key} param should be a JSON list of objects with \'upstream\' URL')
+        names = set()
+        for route in routes:
+            unknown = set(route) - set(self.OPTIONS)
+            if unknown:
+                raise InvalidValueError(f'Unknown options of {self.key} route: {", ".join(sorted(unknown))}')
+            route['prefix'] = '/' + route.get('prefix', '').lstrip('/')
+            # Route name is the name of its cassette shard
+            name = route.get('name') or f'{route.get("host", "")}{route["prefix"]}'
+            route['name'] = re.sub(r'[^\w.-]+', '_', name).strip('_.') or 'root'
+            if route['name'] in names or route['name'] in self.RESERVED_NAMES:
+                raise InvalidValueError(f'Name \'{route["name"]}\' of {self.key} route is not unique')
+            names.add(route['name'])
+        return routes
+
+
 class PathProperty(object):
+    # Path is checked when config is created, not when the module is imported
     def __init__(self, path=notset):
-        self._path = self.__get_value(path)
+        self._path = path
+        self._checked = False
 
     def __get__(self, instance, owner):
+        if not self._checked:
+            self._path = self.__get_value(self._path)
+            self._checked = True
         return self._path
 
     def __get_value(self, path):
@@ -7,6 +7,8 @@ class ZeligMode(Enum):
     SERVE = 'serve'
     PLAYBACK = 'playback'
     OBSERVE = 'observe'
+    PLAYBACK_WORKER = 'playback-worker'
+    CACHE = 'cache'
 
 
 @unique
@@ -34,13 +36,83 @@ class ResponseMatchCriteria(Enum):
     STATUS = 'status'
 
 
+@unique
+class PlaybackPacing(Enum):
+    RECORDED = 'recorded'
+    NONE = 'none'
+    SCALED = 'scaled'
+    OPEN_LOOP = 'open-loop'
+
+
+@unique
+class PlaybackShardBy(Enum):
+    INDEX = 'index'
+    SESSION = 'session'
+
+
+@unique
+class CoalesceRecord(Enum):
+    SINGLE = 'single'
+    PER_CALLER = 'per-caller'
+
+
+@unique
+class Compression(Enum):
+    NONE = 'none'
+    GZIP = 'gzip'
+    ZSTD = 'zstd'
+
+
+@unique
+class ReportLayout(Enum):
+    RESULTS = 'results'
+    FILES = 'files'
+
+
+@unique
+class CassetteFormat(Enum):
+    YAML = 'yaml'
+    STREAM = 'stream'
+    COMPACT = 'compact'
+
+
+@unique
+class ReportQueuePolicy(Enum):
+    BLOCK = 'block'
+    DROP = 'drop'
+
+
+@unique
+class ServeLatency(Enum):
+    RECORDED = 'recorded'
+    DISTRIBUTION = 'distribution'
+    NONE = 'none'
+
+
+@unique
+class ServeBandwidth(Enum):
+    NONE = 'none'
+    FIXED = 'fixed'
+    RECORDED = 'recorded'
+
+
 @unique
 class ErrorCodes(IntEnum):
     RequestError = 490
 
 
+# Bodies that were too large to be stored are saved as a digest under this key
+BODY_DIGEST_KEY = 'sha256'
+
 HEADERS_TO_IGNORE = ['Content-Encoding', 'Content-Length', 'Transfer-Encoding', 'Trailer']
 
+# Request key of the upstream request was routed to
+UPSTREAM_KEY = 'zelig_upstream'
+
 FILES_DIRECTORY = '/files'
 METADATA_FILE = '.meta'
+LATENCY_FILE = '.latency'
 SUMMARY_ARGUMENT = 'summary'
+CONVERT_ARGUMENT = 'convert'
+REPORT_ARGUMENT = 'report'
+COMPACT_ARGUMENT = 'compact'
@@ -0,0 +1,90 @@
+import os
+
+from vcr.serializers import yamlserializer
+
+from zelig.compression import get_compression
+from zelig.blobs import MissingBlobError, get_blobs_path
+from zelig.constants import FILES_DIRECTORY, CONVERT_ARGUMENT, COMPACT_ARGUMENT, CassetteFormat
+from zelig.log import logger
+from zelig.persisters import (
+    StreamCassetteWriter, StreamPersister, is_stream_cassette, get_persister, iter_stream_cassette
+)
+
+
+def convert_to_yaml(source, destination):
+    # Destination is compressed when its name ends with '.gz' or '.zst'
+    requests, responses = StreamPersister.load_cassette(source)
+    persister = get_persister(destination, default_format=CassetteFormat.YAML)
+    persister.save_cassette(destination, {'requests': requests, 'responses': responses}, yamlserializer)
+    return len(requests)
+
+
+def convert_to_stream(source, destination):
+    requests, responses = get_persister(source).load_cassette(source, yamlserializer)
+    with StreamCassetteWriter(destination, get_compression(destination)) as writer:
+        for request, response in zip(requests, responses):
+            writer.append(request, response)
+    return len(requests)
+
+
+def convert_cassette(source, destination):
+    if is_stream_cassette(source):
+        return convert_to_yaml(source, destination)
+    return convert_to_stream(source, destination)
+
+
+def compact_cassette(source, destination):
+    # Bodies of the destination are written to the blob store next to it, every unique body once.
+    # Returns number of interactions and number of bodies in the store.
+    if is_stream_cassette(source):
+        interactions = iter_stream_cassette(source)
+    else:
+        interactions = zip(*get_persister(source).load_cassette(source, yamlserializer))
+    blobs = os.path.basename(get_blobs_path(destination))
+    compacted = 0
+    with StreamCassetteWriter(destination, get_compression(destination), blobs=blobs) as writer:
+        for request, response in interactions:
+            writer.append(request, response)
+            compacted += 1
+    return compacted, writer.blobs.count()
+
+
+def convert(args):
+    convert_arg_index = args.index(CONVERT_ARGUMENT)
+    paths = args[convert_arg_index + 1:convert_arg_index + 3]
+    if len(paths) == 2:
+        source, destination = (os.path.join(FILES_DIRECTORY, path) for path in paths)
+        if os.path.exists(destination):
+            logger.error(f'\'{destination}\' already exists')
+        else:
+            try:
+                converted = convert_cassette(source, destination)
+                logger.info(f'Converted {converted} request-response pairs to \'{destination}\'')
+                return
+            except (ValueError, MissingBlobError) as e:
+                logger.error(f'Could not convert cassette. {e!s}')
+    else:
+        logger.error(f'Could not parse arguments "{args}". '
+                     f'Please use "zelig convert <source_data> <destination_data>" command')
+    exit(1)
+
+
+def compact(args):
+    compact_arg_index = args.index(COMPACT_ARGUMENT)
+    paths = args[compact_arg_index + 1:compact_arg_index + 3]
+    if len(paths) == 2:
+        source, destination = (os.path.join(FILES_DIRECTORY, path) for path in paths)
+        if os.path.exists(destination):
+            logger.error(f'\'{destination}\' already exists')
+        else:
+            try:
+                compacted, bodies = compact_cassette(source, destination)
+                logger.info(f'Compacted {compacted} request-response pairs to \'{destination}\', '
+                            f'{bodies} unique bodies are stored in \'{get_blobs_path(destination)}\'')
+                return
+            except (ValueError, MissingBlobError) as e:
+                logger.error(f'Could not compact cassette. {e!s}')
+    else:
+        logger.error(f'Could not parse arguments "{args}". '
+                     f'Please use "zelig compact <source_data> <destination_data>" command')
+    exit(1)
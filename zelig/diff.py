@@ -0,0 +1,117 @@
+import re
+
+KEY, INDEX, WILDCARD, DESCEND = 'key', 'index', 'wildcard', 'descend'
+MAX_REPORTED_DIFFERENCES = 100
+MISSING = object()
+
+_TOKEN_RE = re.compile(r'''
+    (?P<descend>\.)?\.(?P<key>[^.\[\]]+) |  # .key, .* or recursive descent ..key
+    \.\.(?=\[) |                            # recursive descent followed by [...]
+    \[(?P<index>\d+|\*)\] |                 # [0] or [*]
+    \[['"](?P<quoted>[^'"]+)['"]\]          # ['key']
+''', re.VERBOSE)
+
+
+def parse_path(path):
+    # Supports JSONPath subset: $.a.b, $.a[0], $.a[*].b, $.a.*, $..b, $['a b']
+    if not path.startswith('$'):
+        raise ValueError(f'JSON path "{path}" should start with "$"')
+    tokens = []
+    position = 1
+    while position < len(path):
+        match = _TOKEN_RE.match(path, position)
+        if not match:
+            raise ValueError(f'Could not parse JSON path "{path}" at position {position}')
+        position = match.end()
+        key, index, quoted = match.group('key'), match.group('index'), match.group('quoted')
+        if match.group('descend') or match.group(0) == '..':
+            tokens.append((DESCEND, None))
+        if key == '*' or index == '*':
+            tokens.append((WILDCARD, None))
+        elif key is not None:
+            tokens.append((KEY, key))
+        elif index is not None:
+            tokens.append((INDEX, int(index)))
+        elif quoted is not None:
+            tokens.append((KEY, quoted))
+    return tuple(tokens)
+
+
+def _path_matches(tokens, path):
+    if not tokens:
+        # Ignoring a node ignores everything inside it
+        return True
+    kind, value = tokens[0]
+    if kind == DESCEND:
+        return any(_path_matches(tokens[1:], path[i:]) for i in range(len(path) + 1))
+    if not path:
+        return False
+    head = path[0]
+    if kind == WILDCARD or (kind == KEY and head == value) or (kind == INDEX and head == value and isinstance(head, int)):
+        return _path_matches(tokens[1:], path[1:])
+    return False
+
+
+def is_ignored(path, ignore_paths):
+    return any(_path_matches(tokens, path) for tokens in ignore_paths)
+
+
+def format_path(path):
+    return '$' + ''.join(f'[{p}]' if isinstance(p, int) else f'.{p}' for p in path)
+
+
+def _difference(path, original=MISSING, received=MISSING):
+    # Side where the value is missing is left out of the difference
+    difference = {'path': format_path(path)}
+    if original is not MISSING:
+        difference['original'] = original
+    if received is not MISSING:
+        difference['received'] = received
+    return difference
+
+
+def _equal_scalars(v1, v2):
+    if isinstance(v1, bool) or isinstance(v2, bool):
+        return v1 is v2
+    return v1 == v2
+
+
+def iter_differences(original, received, ignore_paths=(), path=()):
+    if ignore_paths and is_ignored(path, ignore_paths):
+        return
+    if isinstance(original, dict) and isinstance(received, dict):
+        for key in original:
+            if key in received:
+                yield from iter_differences(original[key], received[key], ignore_paths, path + (key,))
+            elif not (ignore_paths and is_ignored(path + (key,), ignore_paths)):
+                yield _difference(path + (key,), original=original[key])
+        for key in received:
+            if key not in original and not (ignore_paths and is_ignored(path + (key,), ignore_paths)):
+                yield _difference(path + (key,), received=received[key])
+    elif isinstance(original, list) and isinstance(received, list):
+        for i, (v1, v2) in enumerate(zip(original, received)):
+            yield from iter_differences(v1, v2, ignore_paths, path + (i,))
+        for i in range(len(received), len(original)):
+            if not (ignore_paths and is_ignored(path + (i,), ignore_paths)):
+                yield _difference(path + (i,), original=original[i])
+        for i in range(len(original), len(received)):
+            if not (ignore_paths and is_ignored(path + (i,), ignore_paths)):
+                yield _difference(path + (i,), received=received[i])
+    elif isinstance(original, (dict, list)) or isinstance(received, (dict, list)) \
+            or not _equal_scalars(original, received):
+        yield _difference(path, original=original, received=received)
+
+
+def has_differences(original, received, ignore_paths=()):
+    # Stops at the first difference that is not ignored
+    return next(iter_differences(original, received, ignore_paths), None) is not None
+
+
+def get_differences(original, received, ignore_paths=(), limit=MAX_REPORTED_DIFFERENCES):
+    differences = []
+    for difference in iter_differences(original, received, ignore_paths):
+        if len(differences) == limit:
+            differences.append({'path': '...', 'note': f'Only first {limit} differences are reported'})
+            break
+        differences.append(difference)
+    return differences
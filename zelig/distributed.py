@@ -0,0 +1,255 @@
+import asyncio
+import functools
+import hmac
+import os
+import signal
+import socket
+import zlib
+
+from zelig.client import load_interactions, play_interactions
+from zelig.constants import ZeligMode, PlaybackShardBy
+from zelig.encoding import dump_json, load_json
+from zelig.log import logger
+from zelig.persisters import interaction_to_dict, interaction_from_dict
+from zelig.report import Reporter
+
+# Coordinator and workers exchange JSON lines, one line can hold a whole interaction
+MESSAGE_LIMIT = 256 * 1024 * 1024
+
+START = 'start'
+INTERACTION = 'interaction'
+END = 'end'
+REPORT = 'report'
+PLAYED = 'played'
+LATENCY = 'latency'
+DONE = 'done'
+
+
+def _send(writer, message):
+    writer.write(dump_json(message).encode('utf-8') + b'\n')
+
+
+class ResultStream:
+    # Stands in for Reporter in workers and sends results back to coordinator
+
+    def __init__(self, writer):
+        self._writer = writer
+        self.total_played = 0
+
+    async def report(self, report, request_index=None, loop=None):
+        report['request'] = dict(report['request'], headers=dict(report['request']['headers']))
+        _send(self._writer, {'type': REPORT, 'index': request_index, 'report': report})
+        await self.drain()
+
+    def record_metadata(self):
+        self.total_played += 1
+        _send(self._writer, {'type': PLAYED})
+
+    def record_latency(self, method, url, recorded, replayed):
+        _send(self._writer, {'type': LATENCY, 'latency': [method, url, recorded, replayed]})
+
+    async def drain(self):
+        # Worker waits for slow coordinator instead of buffering results of the whole shard
+        await self._writer.drain()
+
+
+async def _receive_interactions(reader, results):
+    while True:
+        # Results are drained once per request, which covers PLAYED and LATENCY messages sent without waiting
+        await results.drain()
+        line = await reader.readline()
+        if not line:
+            return
+        message = load_json(line)
+        if message['type'] == END:
+            return
+        request, response = interaction_from_dict(message)
+        yield message['index'], request, response
+
+
+def _check_token(start, token):
+    received = start.get('token') if isinstance(start, dict) else None
+    return isinstance(received, str) and hmac.compare_digest(received.encode('utf-8'), token.encode('utf-8'))
+
+
+async def play_shard(config, loop, reader, writer, token=None):
+    # Local workers are connected through socket pair, remote ones should get the token in the first message
+    try:
+        start = load_json(await reader.readline())
+        if token is not None and not _check_token(start, token):
+            logger.warning(f'Connection from {writer.get_extra_info("peername")} is refused, token does not match')
+            return
+        results = ResultStream(writer)
+        await play_interactions(config, loop, results, _receive_interactions(reader, results), start['first_timestamp'])
+        _send(writer, {'type': DONE})
+        await writer.drain()
+        logger.info(f'Played {results.total_played} request-response pairs')
+    except (ConnectionError, ValueError) as e:
+        logger.error(f'Error while playing shard: {e!r}')
+    finally:
+        writer.close()
+
+
+def _run_local_worker(config, sock):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    reader, writer = loop.run_until_complete(asyncio.open_connection(sock=sock, limit=MESSAGE_LIMIT, loop=loop))
+    loop.run_until_complete(play_shard(config, loop, reader, writer))
+    loop.close()
+
+
+def start_local_workers(config, workers):
+    # Workers are forked before coordinator starts reporter thread and event loop
+    children, sockets = [], []
+    for _ in range(workers):
+        coordinator_sock, worker_sock = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                coordinator_sock.close()
+                _run_local_worker(config, worker_sock)
+            finally:
+                os._exit(0)
+        worker_sock.close()
+        logger.info(f'Started playback worker {pid}')
+        children.append(pid)
+        sockets.append(coordinator_sock)
+    return children, sockets
+
+
+async def _iterate_range(interactions, start, stop):
+    for i in range(start, stop):
+        request, response = interactions[i]
+        yield i + 1, request, response
+
+
+async def _iterate_queue(queue):
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        yield item
+
+
+async def _dispatch_by_session(interactions, queues, header):
+    # Requests of one session are played by one worker in recorded order
+    for (i, (request, response)) in enumerate(interactions, 1):
+        key = request.headers.get(header) or ''
+        await queues[zlib.crc32(key.encode('utf-8')) % len(queues)].put((i, request, response))
+    for queue in queues:
+        await queue.put(None)
+
+
+def get_shards(config, interactions, count, loop):
+    # Returns asynchronous iterators of (index, request, response) for every worker and optional dispatcher coroutine
+    if config.playback_shard_by == PlaybackShardBy.SESSION:
+        queues = [asyncio.Queue(maxsize=1000, loop=loop) for _ in range(count)]
+        dispatcher = _dispatch_by_session(interactions, queues, config.playback_session_header)
+        return [_iterate_queue(queue) for queue in queues], dispatcher
+    interactions = list(interactions)
+    bounds = [len(interactions) * i // count for i in range(count + 1)]
+    return [_iterate_range(interactions, start, stop) for start, stop in zip(bounds, bounds[1:])], None
+
+
+async def _send_shard(name, writer, shard, first_timestamp, token):
+    try:
+        _send(writer, {'type': START, 'first_timestamp': first_timestamp, 'token': token})
+        async for (i, request, response) in shard:
+            _send(writer, dict(interaction_to_dict(request, response), type=INTERACTION, index=i))
+            await writer.drain()
+        _send(writer, {'type': END})
+        await writer.drain()
+    except ConnectionError as e:
+        logger.error(f'Could not send requests to worker {name}: {e!r}')
+        # Shard is consumed anyway, so dispatcher is not blocked by a failed worker
+        async for _ in shard:
+            pass
+
+
+async def _receive_results(name, reader, reporter):
+    while True:
+        line = await reader.readline()
+        if not line:
+            logger.error(f'Worker {name} disconnected before finishing its shard')
+            return
+        message = load_json(line)
+        if message['type'] == REPORT:
+            await reporter.report(message['report'], request_index=message['index'])
+        elif message['type'] == PLAYED:
+            reporter.record_metadata()
+        elif message['type'] == LATENCY:
+            reporter.record_latency(*message['latency'])
+        elif message['type'] == DONE:
+            return
+
+
+async def _connect_workers(config, loop, sockets):
+    connections = []
+    for sock in sockets:
+        reader, writer = await asyncio.open_connection(sock=sock, limit=MESSAGE_LIMIT, loop=loop)
+        connections.append((f'{len(connections) + 1}', reader, writer))
+    for host, port in config.playback_remote_workers:
+        try:
+            reader, writer = await asyncio.open_connection(host, port, limit=MESSAGE_LIMIT, loop=loop)
+        except OSError as e:
+            logger.error(f'Could not connect to worker {host}:{port}: {e!s}')
+            continue
+        connections.append((f'{host}:{port}', reader, writer))
+    return connections
+
+
+async def coordinate(config, loop, reporter, sockets):
+    connections = await _connect_workers(config, loop, sockets)
+    try:
+        if len(connections) < len(sockets) + len(config.playback_remote_workers):
+            return
+        loaded = load_interactions(config.data_directory, sidecar=config.load_cache)
+        if loaded is None:
+            return
+        first_request, interactions = loaded
+        shards, dispatcher = get_shards(config, interactions, len(connections), loop)
+        logger.info(f'Playing data on {len(connections)} workers sharded by {config.playback_shard_by.value}')
+
+        tasks = [dispatcher] if dispatcher else []
+        for (name, reader, writer), shard in zip(connections, shards):
+            tasks.append(_send_shard(name, writer, shard, first_request.timestamp, config.worker_token))
+            tasks.append(_receive_results(name, reader, reporter))
+        await asyncio.gather(*tasks, loop=loop)
+        logger.info(f'Played {reporter.total_played} request-response pairs')
+    finally:
+        # Workers that did not get their shard stop on closed connection
+        for _, _, writer in connections:
+            writer.close()
+
+
+def start_distributed_playback(config):
+    children, sockets = start_local_workers(config, config.playback_workers if config.playback_workers > 1 else 0)
+    with Reporter(config.playback_report_directory, mode=ZeligMode.PLAYBACK,
+                  queue_size=config.report_queue_size, queue_policy=config.report_queue_policy,
+                  flush_interval=config.meta_flush_interval / 1000,
+                  ignore_paths=config.response_ignore_paths, compression=config.compression,
+                  layout=config.report_layout) as reporter:
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(coordinate(config, loop, reporter, sockets))
+        loop.close()
+    for child in children:
+        os.waitpid(child, 0)
+
+
+def start_playback_worker(config):
+    loop = asyncio.get_event_loop()
+    handler = functools.partial(play_shard, config, loop, token=config.worker_token)
+    server = loop.run_until_complete(asyncio.start_server(handler, config.zelig_host, config.zelig_port,
+                                                          limit=MESSAGE_LIMIT, loop=loop))
+    host, port = server.sockets[0].getsockname()[:2]
+    logger.info(f'Playback worker is waiting for coordinator on {host}:{port}')
+
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+    loop.close()
@@ -0,0 +1,46 @@
+import base64
+import json
+
+from zelig.compression import compress, decompress
+from zelig.constants import Compression
+
+BYTES_KEY = '__bytes__'
+COMPRESSED_KEYS = {
+    Compression.GZIP: '__gzip__',
+    Compression.ZSTD: '__zstd__',
+}
+# Smaller bodies are not worth compressing
+MIN_COMPRESSED_SIZE = 256
+
+
+def _encode_default(obj):
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return {BYTES_KEY: base64.b64encode(bytes(obj)).decode('ascii')}
+    return str(obj)
+
+
+def _decode_object(obj):
+    if len(obj) == 1:
+        if BYTES_KEY in obj:
+            return base64.b64decode(obj[BYTES_KEY])
+        for compression, key in COMPRESSED_KEYS.items():
+            if key in obj:
+                return decompress(base64.b64decode(obj[key]), compression)
+    return obj
+
+
+def compress_body(body, compression):
+    # Every body is compressed on its own, so interactions could still be read one by one
+    data = body.encode('utf-8') if isinstance(body, str) else body
+    if not isinstance(data, (bytes, bytearray, memoryview)) or len(data) < MIN_COMPRESSED_SIZE:
+        return body
+    return {COMPRESSED_KEYS[compression]: base64.b64encode(compress(bytes(data), compression)).decode('ascii')}
+
+
+def dump_json(data):
+    # Bytes are kept as base64, so binary bodies survive JSON
+    return json.dumps(data, default=_encode_default)
+
+
+def load_json(line):
+    return json.loads(line, object_hook=_decode_object)
@@ -0,0 +1,83 @@
+import array
+import json
+import math
+import os
+import re
+from urllib.parse import urlparse
+
+from zelig.constants import LATENCY_FILE
+
+_ID_SEGMENT_RE = re.compile(r'^(\d+|[0-9a-fA-F-]{32,36}|[0-9a-fA-F]{16,})$')
+
+
+def normalize_path(path):
+    # Ids in paths are replaced, so requests to the same endpoint are grouped together
+    return '/'.join(':id' if _ID_SEGMENT_RE.match(s) else s for s in path.split('/'))
+
+
+def get_endpoint(method, url):
+    return f'{method} {normalize_path(urlparse(url).path) or "/"}'
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile of already sorted values
+    if not sorted_values:
+        return math.nan
+    rank = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+class LatencyStore:
+    # Latencies are kept in flat typed arrays, so a long playback costs 20 bytes per request
+
+    def __init__(self):
+        self.endpoints = []
+        self._endpoint_ids = {}
+        self.endpoint_ids = array.array('I')
+        self.recorded = array.array('d')
+        self.replayed = array.array('d')
+
+    def __len__(self):
+        return len(self.replayed)
+
+    def add(self, endpoint, recorded, replayed):
+        endpoint_id = self._endpoint_ids.get(endpoint)
+        if endpoint_id is None:
+            endpoint_id = self._endpoint_ids[endpoint] = len(self.endpoints)
+            self.endpoints.append(endpoint)
+        self.endpoint_ids.append(endpoint_id)
+        # Responses recorded by old versions may have no latency
+        self.recorded.append(math.nan if recorded is None else recorded)
+        self.replayed.append(replayed)
+
+    def by_endpoint(self):
+        grouped = [(array.array('d'), array.array('d')) for _ in self.endpoints]
+        for endpoint_id, recorded, replayed in zip(self.endpoint_ids, self.recorded, self.replayed):
+            grouped[endpoint_id][0].append(recorded)
+            grouped[endpoint_id][1].append(replayed)
+        return {endpoint: grouped[i] for i, endpoint in enumerate(self.endpoints)}
+
+    def save(self, path):
+        # JSON header line is followed by raw arrays
+        header = {'endpoints': self.endpoints, 'count': len(self)}
+        with open(path, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b'\n')
+            self.endpoint_ids.tofile(f)
+            self.recorded.tofile(f)
+            self.replayed.tofile(f)
+
+    @classmethod
+    def load(cls, path):
+        store = cls()
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline().decode('utf-8'))
+            store.endpoints = header['endpoints']
+            store._endpoint_ids = {endpoint: i for i, endpoint in enumerate(store.endpoints)}
+            store.endpoint_ids.fromfile(f, header['count'])
+            store.recorded.fromfile(f, header['count'])
+            store.replayed.fromfile(f, header['count'])
+        return store
+
+
+def get_latency_path(report_dir):
+    return os.path.join(report_dir, LATENCY_FILE)
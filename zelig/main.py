@@ -1,15 +1,16 @@
 import sys
 
-from zelig import config
-from zelig.client import start_playback
-from zelig.config import ConfigurationError
-from zelig.constants import ZeligMode, SUMMARY_ARGUMENT
-from zelig.server import start_server
-from zelig.summary import print_summary
+from zelig.constants import ZeligMode, SUMMARY_ARGUMENT, CONVERT_ARGUMENT, REPORT_ARGUMENT, COMPACT_ARGUMENT
 from zelig.log import logger
 
+# Modules of every mode and command are imported only when they are used,
+# so commands like 'summary' do not pay for importing aiohttp, vcr and yaml
+
 
 def start_zelig():
+    from zelig import config
+    from zelig.config import ConfigurationError
+
     try:
         conf = config.get_config()
     except ConfigurationError as e:
@@ -19,15 +20,35 @@ def start_zelig():
     logger.info('Start zelig in "{mode}" mode'.format(mode=conf.mode.value))
     if conf.mode == ZeligMode.PLAYBACK:
         # Run coroutine for 'playback' mode
-        start_playback(conf)
+        if conf.distributed:
+            from zelig.distributed import start_distributed_playback
+            start_distributed_playback(conf)
+        else:
+            from zelig.client import start_playback
+            start_playback(conf)
+    elif conf.mode == ZeligMode.PLAYBACK_WORKER:
+        # Play requests sent by 'playback' mode coordinator
+        from zelig.distributed import start_playback_worker
+        start_playback_worker(conf)
     else:
         # Run server for 'serve', 'observe' and 'record' modes
+        from zelig.server import start_server
         start_server(conf)
 
 
 def main():
     if SUMMARY_ARGUMENT in sys.argv:
+        from zelig.summary import print_summary
         print_summary(sys.argv[1:])
+    elif CONVERT_ARGUMENT in sys.argv:
+        from zelig.convert import convert
+        convert(sys.argv[1:])
+    elif COMPACT_ARGUMENT in sys.argv:
+        from zelig.convert import compact
+        compact(sys.argv[1:])
+    elif REPORT_ARGUMENT in sys.argv:
+        from zelig.report_command import report_command
+        report_command(sys.argv[1:])
     else:
         start_zelig()
 
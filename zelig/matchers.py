@@ -1,31 +1,86 @@
+import collections
+import hashlib
 import json
 
 from vcr.request import HeadersDict
 
+from zelig.constants import BODY_DIGEST_KEY
+from zelig.diff import has_differences
+
+# Digests of the raw body and of the body as canonical JSON, `json` is None for non-JSON responses
+Fingerprint = collections.namedtuple('Fingerprint', ['raw', 'json'])
+
+
+def _body_bytes(body):
+    string = body.get('string') or b''
+    if isinstance(string, str):
+        return string.encode('utf-8')
+    return bytes(string)
+
+
+def _is_json(response):
+    headers = response.get('headers')
+    if not headers:
+        return False
+    content_type = HeadersDict(headers).get('content-type') or ''
+    return content_type.startswith('application/json')
+
+
+def _normalize_json(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {k: _normalize_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize_json(v) for v in value]
+    return value
+
+
+def load_json_body(response):
+    # Raises ValueError if response is not JSON
+    body = response.get('body') or {}
+    if BODY_DIGEST_KEY in body or not _is_json(response):
+        raise ValueError('Response body is not JSON')
+    return json.loads(_body_bytes(body).decode('utf-8'))
+
+
+def get_fingerprint(response):
+    body = response.get('body') or {}
+    if BODY_DIGEST_KEY in body:
+        # Body is too large to be stored, only its digest is known
+        return Fingerprint(raw=body[BODY_DIGEST_KEY], json=None)
+    string = _body_bytes(body)
+    json_digest = None
+    try:
+        canonical = json.dumps(_normalize_json(load_json_body(response)), sort_keys=True)
+        json_digest = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    except ValueError:
+        pass
+    return Fingerprint(raw=hashlib.sha256(string).hexdigest(), json=json_digest)
+
 
 class ResponseMatchers:
     @staticmethod
-    def status(r1, r2):
+    def status(r1, r2, fingerprints, ignore_paths):
         return r1.get('status') == r2.get('status')
 
     @staticmethod
-    def body(r1, r2):
-        body1, body2 = r1.get('body'), r2.get('body')
-        match = body1 == body2
-        if not match:
-            headers1, headers2 = r1.get('headers'), r2.get('headers')
-            if headers1 and headers2:
-                type1, type2 = HeadersDict(headers1).get('content-type'), HeadersDict(headers2).get('content-type')
-                if type1.startswith('application/json') and type2.startswith('application/json'):
-                    try:
-                        body1, body2 = json.loads(body1['string']), json.loads(body2['string'])
-                        match = body1 == body2
-                    except json.JSONDecodeError:
-                        pass
-        return match
+    def body(r1, r2, fingerprints, ignore_paths):
+        fingerprint1 = fingerprints[0] or get_fingerprint(r1)
+        fingerprint2 = fingerprints[1] or get_fingerprint(r2)
+        if fingerprint1.raw == fingerprint2.raw:
+            return True
+        if fingerprint1.json is None or fingerprint2.json is None:
+            return False
+        if fingerprint1.json == fingerprint2.json:
+            return True
+        if ignore_paths:
+            # Bodies are parsed only when some differences could be ignored
+            return not has_differences(load_json_body(r1), load_json_body(r2), ignore_paths)
+        return False
 
     @staticmethod
-    def headers(r1, r2):
+    def headers(r1, r2, fingerprints, ignore_paths):
         return r1.get('headers') == r2.get('headers')
 
 
@@ -33,10 +88,10 @@ def check_errors(r1, r2):
     return r1['status'].get('error') or r2['status'].get('error')
 
 
-def match_responses(r1, r2, match_on):
+def match_responses(r1, r2, match_on, fingerprint1=None, fingerprint2=None, ignore_paths=()):
     if check_errors(r1, r2):
         # Force responses to not be equal on errors
         return False
+    fingerprints = (fingerprint1, fingerprint2)
     response_matchers = [getattr(ResponseMatchers, matcher) for matcher in match_on]
-    matches = [m(r1, r2) for m in response_matchers]
-    return all(matches)
+    return all(m(r1, r2, fingerprints, ignore_paths) for m in response_matchers)
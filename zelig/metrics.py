@@ -0,0 +1,156 @@
+import bisect
+import collections
+import time
+
+from aiohttp import web
+
+from zelig.latency import normalize_path
+
+# Exponential buckets from 100 microseconds to ~105 seconds, each bucket is sqrt(2) times wider than previous
+LATENCY_BUCKETS = tuple(0.0001 * 2 ** (i / 2) for i in range(41))
+MAX_PATHS = 1000
+OTHER_PATH = ':other'
+OUTCOME_KEY = 'zelig_outcome'
+
+
+class Outcome:
+    MATCHED = 'matched'
+    UNMATCHED = 'unmatched'
+    MISMATCH = 'mismatch'
+    RECORDED = 'recorded'
+    ERROR = 'error'
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape_label(value):
+    # Label values come from clients, so they are escaped as Prometheus text format requires
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, **extra):
+    labels = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    labels.extend(f'{name}="{_escape_label(value)}"' for name, value in extra.items())
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def _format_float(value):
+    return repr(float(value))
+
+
+class Metrics:
+    REQUEST_LABELS = ('mode', 'method', 'path', 'outcome')
+    UPSTREAM_LABELS = ('mode', 'method', 'path')
+    MATCH_LABELS = ('mode',)
+
+    def __init__(self, mode):
+        self.mode = mode.value
+        self.requests_in_flight = 0
+        self._requests = collections.defaultdict(int)
+        self._request_latency = collections.defaultdict(Histogram)
+        self._upstream_latency = collections.defaultdict(Histogram)
+        self._match_latency = collections.defaultdict(Histogram)
+        self._gauges = []
+        self._paths = set()
+
+    def normalize_path(self, path):
+        # Ids in paths are replaced and number of distinct normalized paths is capped,
+        # so number of label values stays bounded while requests to known endpoints keep their label
+        normalized = normalize_path(path)
+        if normalized not in self._paths:
+            if len(self._paths) >= MAX_PATHS:
+                return OTHER_PATH
+            self._paths.add(normalized)
+        return normalized
+
+    def observe_request(self, method, path, outcome, latency):
+        labels = (self.mode, method, self.normalize_path(path), outcome)
+        self._requests[labels] += 1
+        self._request_latency[labels].observe(latency)
+
+    def observe_upstream(self, method, path, latency):
+        self._upstream_latency[(self.mode, method, self.normalize_path(path))].observe(latency)
+
+    def observe_match(self, latency):
+        self._match_latency[(self.mode,)].observe(latency)
+
+    def add_gauge(self, name, description, callback):
+        self._gauges.append((name, description, callback))
+
+    def _render_histograms(self, name, description, label_names, histograms):
+        lines = [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+        for labels, histogram in list(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(label_names, labels, le=_format_float(bound))} '
+                             f'{cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(label_names, labels, le="+Inf")} {histogram.count}')
+            lines.append(f'{name}_sum{_format_labels(label_names, labels)} {_format_float(histogram.sum)}')
+            lines.append(f'{name}_count{_format_labels(label_names, labels)} {histogram.count}')
+        return lines
+
+    def render(self):
+        lines = ['# HELP zelig_requests_total Number of handled requests',
+                 '# TYPE zelig_requests_total counter']
+        lines.extend(f'zelig_requests_total{_format_labels(self.REQUEST_LABELS, labels)} {count}'
+                     for labels, count in list(self._requests.items()))
+        lines.extend(self._render_histograms('zelig_request_duration_seconds', 'Time of handling request',
+                                             self.REQUEST_LABELS, self._request_latency))
+        lines.extend(self._render_histograms('zelig_upstream_duration_seconds', 'Time of request to target server',
+                                             self.UPSTREAM_LABELS, self._upstream_latency))
+        lines.extend(self._render_histograms('zelig_match_duration_seconds',
+                                             'Time of looking up recorded request or matching responses',
+                                             self.MATCH_LABELS, self._match_latency))
+        gauges = [('zelig_requests_in_flight', 'Number of requests being handled', lambda: self.requests_in_flight)]
+        for name, description, callback in gauges + self._gauges:
+            lines.extend([f'# HELP {name} {description}', f'# TYPE {name} gauge', f'{name} {callback()}'])
+        return '\n'.join(lines) + '\n'
+
+
+class NullMetrics:
+    # Used when metrics are disabled, so collecting them costs nothing
+    def observe_request(self, method, path, outcome, latency):
+        pass
+
+    def observe_upstream(self, method, path, latency):
+        pass
+
+    def observe_match(self, latency):
+        pass
+
+    def add_gauge(self, name, description, callback):
+        pass
+
+
+async def metrics_middleware(app, handler):
+    async def middleware_handler(request):
+        if request.path.startswith(app.config.admin_path):
+            return await handler(request)
+        metrics = app.metrics
+        started = time.time()
+        metrics.requests_in_flight += 1
+        try:
+            return await handler(request)
+        finally:
+            metrics.requests_in_flight -= 1
+            metrics.observe_request(request.method, request.path, request.get(OUTCOME_KEY, Outcome.ERROR),
+                                    time.time() - started)
+    return middleware_handler
+
+
+async def metrics_handler(request):
+    return web.Response(body=request.app.metrics.render().encode('utf-8'),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
@@ -0,0 +1,59 @@
+from zelig.constants import PlaybackPacing
+from zelig.utils import wait
+
+
+class RecordedPacer:
+    # Sleep recorded time between requests minus the time original response took
+    bounded = True
+
+    def __init__(self, first_timestamp, speed, loop):
+        self.offset = first_timestamp
+        self.speed = speed
+        self.loop = loop
+
+    async def pace(self, request, original_response):
+        await wait(request.timestamp - self.offset, original_response['latency'], loop=self.loop)
+        self.offset = request.timestamp
+
+
+class NonePacer(RecordedPacer):
+    # Send requests as fast as concurrency limit allows
+    async def pace(self, request, original_response):
+        pass
+
+
+class ScaledPacer(RecordedPacer):
+    # Keep recorded intervals between sending requests, divided by speed factor
+    def __init__(self, first_timestamp, speed, loop):
+        super().__init__(first_timestamp, speed, loop)
+        self.sent_at = None
+
+    async def pace(self, request, original_response):
+        if self.sent_at is not None:
+            await wait(self.sent_at + (request.timestamp - self.offset) / self.speed - self.loop.time(), loop=self.loop)
+        self.sent_at = self.loop.time()
+        self.offset = request.timestamp
+
+
+class OpenLoopPacer(RecordedPacer):
+    # Send every request at its own scheduled time, no matter if previous requests are finished
+    bounded = False
+
+    def __init__(self, first_timestamp, speed, loop):
+        super().__init__(first_timestamp, speed, loop)
+        self.started_at = loop.time()
+
+    async def pace(self, request, original_response):
+        await wait(self.started_at + (request.timestamp - self.offset) / self.speed - self.loop.time(), loop=self.loop)
+
+
+PACERS = {
+    PlaybackPacing.RECORDED: RecordedPacer,
+    PlaybackPacing.NONE: NonePacer,
+    PlaybackPacing.SCALED: ScaledPacer,
+    PlaybackPacing.OPEN_LOOP: OpenLoopPacer,
+}
+
+
+def get_pacer(config, first_timestamp, loop):
+    return PACERS[config.playback_pacing](first_timestamp, config.playback_speed, loop)
@@ -0,0 +1,266 @@
+import json
+import os
+
+from vcr.persisters.filesystem import FilesystemPersister
+from vcr.request import Request
+from vcr.serialize import serialize, deserialize
+from vcr.serializers import compat
+
+from zelig.blobs import MissingBlobError, get_blob_store, get_blobs_path
+from zelig.compression import detect_compression, get_compression, open_file
+from zelig.constants import CassetteFormat, Compression
+from zelig.encoding import dump_json, load_json, compress_body
+from zelig.log import logger
+
+STREAM_CASSETTE_FORMAT = 'zelig-stream'
+STREAM_CASSETTE_HEADER = {'format': STREAM_CASSETTE_FORMAT, 'version': 1}
+# Number of bytes that are compared to make sure stream cassette was only appended
+STREAM_TAIL_SIZE = 256
+
+
+class ReadOnlyCassetteError(Exception):
+    pass
+
+
+def interaction_to_dict(request, response, compression=Compression.NONE, blobs=None):
+    request = request._to_dict()
+    if blobs is not None:
+        # Large bodies are replaced with references to the blob store, so compression applies to small ones only
+        request['body'] = blobs.reference(request['body'])
+        response = dict(response, body=dict(response['body'], string=blobs.reference(response['body']['string'])))
+    if compression != Compression.NONE:
+        request['body'] = compress_body(request['body'], compression)
+        response = dict(response, body=dict(response['body'],
+                                            string=compress_body(response['body']['string'], compression)))
+    return {
+        'request': compat.convert_to_unicode(request),
+        'response': compat.convert_to_unicode(response),
+    }
+
+
+def interaction_from_dict(interaction, blobs=None):
+    request, response = interaction['request'], interaction['response']
+    if blobs is not None:
+        # Loaded bodies are converted to bytes in every cassette format anyway,
+        # so stored bytes are used as they are and shared by all interactions with the same body
+        request = dict(request, body=blobs.resolve(request['body'], as_bytes=True))
+        response = dict(response, body=dict(response['body'],
+                                            string=blobs.resolve(response['body']['string'], as_bytes=True)))
+    return Request._from_dict(request), compat.convert_to_bytes(response)
+
+
+def dump_interaction(request, response, compression=Compression.NONE, blobs=None):
+    return dump_json(interaction_to_dict(request, response, compression, blobs))
+
+
+def load_interaction(line, blobs=None):
+    return interaction_from_dict(load_json(line), blobs)
+
+
+def get_stream_header(compression=Compression.NONE, blobs=None):
+    header = STREAM_CASSETTE_HEADER
+    if compression != Compression.NONE:
+        header = dict(header, compression=compression.value)
+    if blobs is not None:
+        header = dict(header, blobs=blobs)
+    return header
+
+
+def read_stream_header(path):
+    try:
+        with open(path, 'r') as f:
+            header = json.loads(f.readline())
+    except (IOError, ValueError):
+        return None
+    if not isinstance(header, dict) or header.get('format') != STREAM_CASSETTE_FORMAT:
+        return None
+    return header
+
+
+def is_stream_cassette(path):
+    return read_stream_header(path) is not None
+
+
+def get_header_blob_store(path, header):
+    # Blob store path is relative to the cassette, so cassette and its store can be moved together
+    if header is None or not header.get('blobs'):
+        return None
+    return get_blob_store(os.path.join(os.path.dirname(path), header['blobs']))
+
+
+def iter_stream_cassette(path, skip_invalid=False):
+    # With `skip_invalid` corrupt interactions are logged and skipped instead of stopping the iteration
+    blobs = get_header_blob_store(path, read_stream_header(path))
+    with open(path, 'r') as f:
+        f.readline()
+        for number, line in enumerate(f, 2):
+            if not line.endswith('\n'):
+                # Interaction that was being written when recording was interrupted
+                break
+            try:
+                interaction = load_interaction(line, blobs)
+            except (ValueError, KeyError, TypeError, MissingBlobError) as e:
+                if not skip_invalid:
+                    raise
+                logger.error(f'Skipping invalid interaction on line {number} of {path}. {e!r}')
+                continue
+            yield interaction
+
+
+def _find_line_end(f, end, chunk_size=64 * 1024):
+    # Returns position after the last complete line before `end`
+    position = end
+    while position > 0:
+        start = max(0, position - chunk_size)
+        f.seek(start)
+        newline = f.read(position - start).rfind(b'\n')
+        if newline != -1:
+            return start + newline + 1
+        position = start
+    return 0
+
+
+def _truncate_partial_line(path):
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = _find_line_end(f, end)
+        if position != end:
+            f.truncate(position)
+
+
+def get_stream_position(path):
+    # Returns end of the last complete line of stream cassette with the bytes before it,
+    # so interactions appended later could be read without reading the whole cassette again
+    with open(path, 'rb') as f:
+        position = _find_line_end(f, f.seek(0, os.SEEK_END))
+        f.seek(max(0, position - STREAM_TAIL_SIZE))
+        return position, f.read(position - f.tell())
+
+
+def read_stream_tail(path, position):
+    # Returns interactions appended after `position` and the new position,
+    # or None when cassette was rewritten since the position was taken
+    offset, tail = position
+    if not offset:
+        return None
+    with open(path, 'rb') as f:
+        f.seek(offset - len(tail))
+        if f.read(len(tail)) != tail:
+            return None
+        data = f.read()
+    data = data[:data.rfind(b'\n') + 1]
+    blobs = get_header_blob_store(path, read_stream_header(path))
+    interactions = [load_interaction(line.decode('utf-8'), blobs) for line in data.splitlines()]
+    return interactions, (offset + len(data), (tail + data)[-STREAM_TAIL_SIZE:])
+
+
+class StreamCassetteWriter:
+    def __init__(self, path, compression=Compression.NONE, blobs=None):
+        # `blobs` is path of the blob store relative to the cassette, bodies are kept in the cassette without it
+        dirname, filename = os.path.split(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        header = read_stream_header(path)
+        if header is not None:
+            _truncate_partial_line(path)
+            # Existing cassette is extended with its own compression and blob store
+            compression = Compression(header.get('compression', Compression.NONE.value))
+            blobs = header.get('blobs')
+        self.compression = compression
+        self.blobs = get_header_blob_store(path, {'blobs': blobs})
+        self._file = open(path, 'a')
+        if not self._file.tell():
+            self._write(json.dumps(get_stream_header(compression, blobs)))
+
+    def _write(self, line):
+        self._file.write(line + '\n')
+        self._file.flush()
+
+    def append(self, request, response):
+        self._write(dump_interaction(request, response, self.compression, self.blobs))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class StreamPersister:
+    # Cassette is a header line followed by one JSON line per interaction, so interactions can be
+    # appended as soon as they are recorded and read back one by one
+    def __init__(self, compression=Compression.NONE, blobs=None):
+        self.compression = compression
+        self.blobs = blobs
+
+    @classmethod
+    def load_cassette(cls, cassette_path, serializer=None):
+        if not is_stream_cassette(cassette_path):
+            raise ValueError('Cassette not found.')
+        requests, responses = [], []
+        for request, response in iter_stream_cassette(cassette_path):
+            requests.append(request)
+            responses.append(response)
+        return requests, responses
+
+    def save_cassette(self, cassette_path, cassette_dict, serializer=None):
+        if os.path.exists(cassette_path):
+            os.remove(cassette_path)
+        with StreamCassetteWriter(cassette_path, self.compression, self.blobs) as writer:
+            for request, response in zip(cassette_dict['requests'], cassette_dict['responses']):
+                writer.append(request, response)
+
+    def open_writer(self, cassette_path):
+        return StreamCassetteWriter(cassette_path, self.compression, self.blobs)
+
+
+class CompressedYamlPersister:
+    # YAML cassette is always read and written at once, so it is compressed as a whole
+    def __init__(self, compression):
+        self.compression = compression
+
+    @classmethod
+    def load_cassette(cls, cassette_path, serializer):
+        try:
+            with open_file(cassette_path, 'r', detect_compression(cassette_path)) as f:
+                cassette_content = f.read()
+        except IOError:
+            raise ValueError('Cassette not found.')
+        return deserialize(cassette_content, serializer)
+
+    def save_cassette(self, cassette_path, cassette_dict, serializer):
+        data = serialize(cassette_dict, serializer)
+        dirname, filename = os.path.split(cassette_path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        compression = detect_compression(cassette_path) if os.path.exists(cassette_path) else self.compression
+        with open_file(cassette_path, 'w', compression) as f:
+            f.write(data)
+
+
+def get_cassette_format(path, default=CassetteFormat.YAML):
+    header = read_stream_header(path)
+    if header is not None:
+        return CassetteFormat.COMPACT if header.get('blobs') else CassetteFormat.STREAM
+    if os.path.exists(path):
+        return CassetteFormat.YAML
+    return default
+
+
+def get_persister(path, default_format=CassetteFormat.YAML, compression=Compression.NONE):
+    # Compression of a new cassette is chosen by its extension or configured one,
+    # existing cassettes are always read and extended with their own compression
+    compression = get_compression(path, compression)
+    cassette_format = get_cassette_format(path, default_format)
+    if cassette_format == CassetteFormat.STREAM:
+        return StreamPersister(compression)
+    if cassette_format == CassetteFormat.COMPACT:
+        return StreamPersister(compression, blobs=os.path.basename(get_blobs_path(path)))
+    if os.path.exists(path):
+        compression = detect_compression(path)
+    if compression == Compression.NONE:
+        return FilesystemPersister
+    return CompressedYamlPersister(compression)
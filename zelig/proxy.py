@@ -0,0 +1,65 @@
+import hashlib
+import time
+
+from aiohttp import web
+
+from zelig.constants import BODY_DIGEST_KEY, UPSTREAM_KEY
+from zelig.log import logger
+from zelig.utils import build_vcr_request, filter_response_headers, get_query_string
+
+
+class BodyRecorder:
+    # Keeps streamed body in memory up to `cap` bytes, larger bodies are only hashed
+    def __init__(self, cap):
+        self.cap = cap
+        self.length = 0
+        self._chunks = []
+        self._digest = hashlib.sha256()
+
+    def feed(self, chunk):
+        self.length += len(chunk)
+        self._digest.update(chunk)
+        if self._chunks is not None:
+            if self.length > self.cap:
+                self._chunks = None
+            else:
+                self._chunks.append(bytes(chunk))
+
+    def get_body(self):
+        if self._chunks is not None:
+            return {'string': b''.join(self._chunks)}
+        return {'string': b'', BODY_DIGEST_KEY: self._digest.hexdigest(), 'length': self.length}
+
+
+async def stream_response(request, request_info):
+    config = request.app.config
+    # Build vcr request before sending, so it is stamped with the time request was made
+    vcr_request = build_vcr_request(request_info)
+    started = time.time()
+    async with request[UPSTREAM_KEY].session.request(**request_info) as response:
+        logger.info('{request[method]} {request[url]}{qs} - {status}'.format(
+            request=request_info, status=response.status, qs=get_query_string(request_info['params'])))
+        server_response = web.StreamResponse(status=response.status, reason=response.reason,
+                                             headers=filter_response_headers(response.headers))
+        await server_response.prepare(request)
+        body = BodyRecorder(config.stream_body_cap)
+        async for chunk in response.content.iter_any():
+            body.feed(chunk)
+            server_response.write(chunk)
+            await server_response.drain()
+        await server_response.write_eof()
+
+    if body.length > body.cap:
+        logger.warning(f'Body of {body.length} bytes is over ZELIG_STREAM_BODY_CAP, only its digest is recorded '
+                       f'and the response could not be served in \'serve\' mode')
+    received_response = {
+        'status': {
+            'code': response.status,
+            'message': response.reason,
+        },
+        'headers': dict(response.headers),
+        'body': body.get_body(),
+        'url': str(response.url),
+        'latency': time.time() - started,
+    }
+    return server_response, vcr_request, received_response
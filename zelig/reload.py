@@ -0,0 +1,78 @@
+import asyncio
+import contextlib
+import os
+import signal
+import time
+
+from aiohttp import web
+
+from zelig.log import logger
+
+
+class CassetteReloader:
+    # Cassettes are reloaded when their files change, on SIGHUP and on request to admin endpoint.
+    # Changes are parsed in a thread, so requests are served while cassette is being reloaded.
+
+    def __init__(self, get_cassettes, interval=0):
+        # Cassettes are requested on every reload, so cassette shards loaded later are reloaded too
+        self.get_cassettes = get_cassettes
+        self.interval = interval
+        self._loop = None
+        self._lock = None
+        self._watcher = None
+
+    async def start(self, app):
+        # Started with application, so every forked worker has its own watcher
+        self._loop = app.loop
+        self._lock = asyncio.Lock(loop=app.loop)
+        app.loop.add_signal_handler(signal.SIGHUP, self._schedule_reload)
+        if self.interval:
+            self._watcher = app.loop.create_task(self._watch())
+
+    async def stop(self, app):
+        app.loop.remove_signal_handler(signal.SIGHUP)
+        if self._watcher is not None:
+            self._watcher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._watcher
+            self._watcher = None
+
+    def _schedule_reload(self):
+        self._loop.create_task(self._reload_safely())
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval, loop=self._loop)
+            await self._reload_safely()
+
+    async def _reload_safely(self):
+        try:
+            await self.reload()
+        except Exception as e:
+            logger.error(f'Could not reload cassette. {e!r}')
+
+    async def reload(self, force=False):
+        # Returns number of new or changed interactions
+        added = 0
+        async with self._lock:
+            for cassette in self.get_cassettes():
+                if force or cassette.changed():
+                    added += await self._reload_cassette(cassette)
+        return added
+
+    async def _reload_cassette(self, cassette):
+        started = time.time()
+        changes = await self._loop.run_in_executor(None, cassette.load_changes)
+        added = cassette.apply_changes(changes)
+        logger.info(f'Cassette {cassette._path} reloaded in {time.time() - started:.3f} seconds, '
+                    f'{added} new or changed interactions, {len(cassette.data)} total')
+        return added
+
+
+async def reload_handler(request, reloader):
+    added = await reloader.reload(force=True)
+    if getattr(request.app.config, 'workers', 1) > 1:
+        # Other workers are asked to reload by the parent process
+        os.kill(os.getppid(), signal.SIGHUP)
+    interactions = sum(len(cassette.data) for cassette in reloader.get_cassettes())
+    return web.json_response({'added': added, 'interactions': interactions})
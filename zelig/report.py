@@ -1,14 +1,25 @@
+import asyncio
 import json
 import os
+import queue
 import random
 import string
+import threading
 import time
 
 from vcr.serializers.compat import convert_to_unicode
 from vcr.serializers.yamlserializer import serialize, extension
 
-from zelig.constants import METADATA_FILE
+from zelig.compression import EXTENSIONS, open_file
+from zelig.constants import METADATA_FILE, ReportQueuePolicy, ReportLayout, Compression
+from zelig.diff import get_differences
+from zelig.latency import LatencyStore, get_endpoint, get_latency_path
 from zelig.log import logger
+from zelig.matchers import load_json_body
+from zelig.results import ResultsWriter
+
+
+_STOP = object()
 
 
 def _generate_unique_path(path):
@@ -17,14 +28,16 @@ def _generate_unique_path(path):
     return f'{filename}_{appendix}{ext}'
 
 
-def _write_to_file(path, data, rewrite=False):
+def _write_to_file(path, data, rewrite=False, compression=Compression.NONE):
+    if compression != Compression.NONE:
+        path += EXTENSIONS[compression]
     dirname, filename = os.path.split(path)
     if dirname and not os.path.exists(dirname):
         os.makedirs(dirname)
     if not rewrite and os.path.exists(path):
         path = _generate_unique_path(path)
     logger.debug(f'Saving to {path}')
-    with open(path, 'w') as f:
+    with open_file(path, 'w', compression) as f:
         f.write(data)
 
 
@@ -39,48 +52,140 @@ def _prepare_request(request):
     return request
 
 
-def _prepare_report(data):
+def _copy_response(response, with_body=True):
+    # Recorded responses are shared with cassette, so they should not be changed in place
+    if response is None:
+        return None
+    response = dict(response)
+    if with_body and response.get('body') is not None:
+        response['body'] = dict(response['body'])
+    else:
+        response.pop('body', None)
+    return response
+
+
+def _get_body_differences(original_response, received_response, ignore_paths):
+    if original_response is None:
+        return None
+    try:
+        return get_differences(load_json_body(original_response), load_json_body(received_response), ignore_paths)
+    except ValueError:
+        return None
+
+
+def _prepare_report(data, ignore_paths=()):
+    differences = _get_body_differences(data['original_response'], data['received_response'], ignore_paths)
+    # Only differences of JSON bodies are reported instead of the whole bodies
+    with_body = differences is None
     data['request'] = convert_to_unicode(_prepare_request(data['request']))
-    data['original_response'] = convert_to_unicode(data['original_response'])
-    data['received_response'] = convert_to_unicode(_prepare_headers(data['received_response']))
+    data['original_response'] = convert_to_unicode(_copy_response(data['original_response'], with_body))
+    data['received_response'] = convert_to_unicode(
+        _prepare_headers(_copy_response(data['received_response'], with_body)))
+    if not with_body:
+        data['body_differences'] = differences
 
 
-def save_report(report_path, data, root_key='results'):
-    _prepare_report(data)
+def write_report(report_path, data, root_key='results', compression=Compression.NONE):
     data = serialize({root_key: data})
-    _write_to_file(report_path, data)
+    _write_to_file(report_path, data, compression=compression)
+
+
+def save_report(report_path, data, ignore_paths=(), root_key='results', compression=Compression.NONE):
+    _prepare_report(data, ignore_paths)
+    write_report(report_path, data, root_key=root_key, compression=compression)
+
+
+def get_report_path(directory, index):
+    return os.path.join(directory, f'{index:03}{extension}')
 
 
 class Reporter:
+    # Reports are serialized and written by a background thread, so reporting does not block event loop
 
-    def __init__(self, directory, mode):
+    def __init__(self, directory, mode, queue_size=1000, queue_policy=ReportQueuePolicy.BLOCK, flush_interval=0.5,
+                 ignore_paths=(), compression=Compression.NONE, layout=ReportLayout.RESULTS):
         self.directory = directory
         self.mode = mode
+        self.ignore_paths = ignore_paths
+        self.compression = compression
+        self.layout = layout
+        self._results = ResultsWriter(directory, compression=compression)
         self.reports_counter = 0
+        self.reports_dropped = 0
         self.total_played = 0
         self.started = None
         self.finished = None
+        self.latencies = LatencyStore()
+
+        self.queue_policy = queue_policy
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = None
+        self._meta_dirty = False
+        self._meta_flushed = 0
 
     def __enter__(self):
         self.started = time.time()
+        self._writer = threading.Thread(target=self._write_reports, name='zelig-reporter', daemon=True)
+        self._writer.start()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        msg = f'Generated {self.reports_counter} reports.' + \
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._writer = None
+        self._results.close()
+        if self._meta_dirty:
+            self._update_meta()
+        if self.latencies:
+            self.latencies.save(get_latency_path(self.directory))
+
+        msg = f'Generated {self.reports_counter - self.reports_dropped} reports.' + \
               (f' Look to {self.directory} for details' if self.reports_counter else '')
+        if self.reports_dropped:
+            msg += f'. {self.reports_dropped} reports were dropped because disk could not keep up'
         logger.info(msg)
 
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _write_reports(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                return
+            if item is not None:
+                report, index = item
+                try:
+                    self._save_report(report, index)
+                except Exception as e:
+                    logger.error(f'Could not save report {index}. {e!r}')
+            # Results and .meta are flushed at most once per flush interval
+            if self._meta_dirty and time.time() - self._meta_flushed >= self.flush_interval:
+                self._results.flush()
+                self._update_meta()
+
     def _update_requests_time(self):
         self.finished = time.time()
 
     def _save_report(self, report, index):
-        report_path = os.path.join(self.directory, f'{index:03}{extension}')
-        save_report(report_path, report)
+        if self.layout == ReportLayout.FILES:
+            save_report(get_report_path(self.directory, index), report, self.ignore_paths,
+                        compression=self.compression)
+            return
+        _prepare_report(report, self.ignore_paths)
+        self._results.write(index, report, get_endpoint(report['request']['method'], report['request']['url']))
 
     def _update_meta(self):
+        self._meta_dirty = False
+        self._meta_flushed = time.time()
         meta_path = os.path.join(self.directory, METADATA_FILE)
         data = {
             'reports_number': self.reports_counter,
+            'reports_dropped': self.reports_dropped,
             'started': self.started,
             'finished': self.finished,
             'total_played': self.total_played,
@@ -92,10 +197,22 @@ class Reporter:
         self.total_played += 1
 
         self._update_requests_time()
-        self._update_meta()
+        self._meta_dirty = True
+
+    def record_latency(self, method, url, recorded, replayed):
+        self.latencies.add(get_endpoint(method, url), recorded, replayed)
 
-    def report(self, report, request_index=None):
+    async def report(self, report, request_index=None, loop=None):
         self.reports_counter += 1
         if not request_index:
             request_index = self.reports_counter
-        self._save_report(report, request_index)
+        try:
+            self._queue.put_nowait((report, request_index))
+        except queue.Full:
+            if self.queue_policy == ReportQueuePolicy.DROP:
+                self.reports_dropped += 1
+                logger.warning(f'Report queue is full, report {request_index} is dropped')
+                return
+            # Only the reporting request waits for the writer, event loop keeps serving other ones
+            loop = loop or asyncio.get_event_loop()
+            await loop.run_in_executor(None, self._queue.put, (report, request_index))
@@ -0,0 +1,62 @@
+import os
+
+from vcr.serializers.compat import convert_to_unicode
+from vcr.serializers.yamlserializer import serialize
+
+from zelig.constants import FILES_DIRECTORY, REPORT_ARGUMENT
+from zelig.log import logger
+from zelig.report import get_report_path, write_report
+from zelig.results import has_results, read_report, iter_reports
+
+SHOW_COMMAND = 'show'
+EXPORT_COMMAND = 'export'
+
+
+def _restore_report(report):
+    # Bodies are decoded from JSON as bytes, they are shown as text when possible
+    for key in ('request', 'original_response', 'received_response'):
+        if report.get(key) is not None:
+            report[key] = convert_to_unicode(report[key])
+    return report
+
+
+def show_report(report_dir, index):
+    report = read_report(report_dir, index)
+    if report is None:
+        logger.error(f'Could not find report {index} in \'{report_dir}\'')
+        return False
+    print(serialize({'results': _restore_report(report)}))
+    return True
+
+
+def export_reports(report_dir, destination):
+    # Writes reports in the layout of one YAML file per report
+    exported = 0
+    for index, report in iter_reports(report_dir):
+        write_report(get_report_path(destination, index), _restore_report(report))
+        exported += 1
+    logger.info(f'Exported {exported} reports to \'{destination}\'')
+
+
+def report_command(args):
+    report_arg_index = args.index(REPORT_ARGUMENT)
+    command_args = args[report_arg_index + 1:]
+    usage = (f'Please use "zelig report {SHOW_COMMAND} <report_folder> <index>" or '
+             f'"zelig report {EXPORT_COMMAND} <report_folder> [<destination_folder>]" command')
+    if len(command_args) >= 2 and command_args[0] in (SHOW_COMMAND, EXPORT_COMMAND):
+        report_dir = os.path.join(FILES_DIRECTORY, command_args[1])
+        if not has_results(report_dir):
+            logger.error(f'Could not find results file. Check if you\'ve mounted \'{FILES_DIRECTORY}\' directory'
+                         f' and \'{command_args[1]}\' report exists')
+        elif command_args[0] == SHOW_COMMAND and len(command_args) == 3 and command_args[2].isdigit():
+            if show_report(report_dir, int(command_args[2])):
+                return
+        elif command_args[0] == EXPORT_COMMAND and len(command_args) <= 3:
+            destination = os.path.join(FILES_DIRECTORY, command_args[2]) if len(command_args) == 3 else report_dir
+            export_reports(report_dir, destination)
+            return
+        else:
+            logger.error(f'Could not parse arguments "{args}". {usage}')
+    else:
+        logger.error(f'Could not parse arguments "{args}". {usage}')
+    exit(1)
@@ -0,0 +1,125 @@
+import array
+import json
+import os
+
+from zelig.constants import Compression
+from zelig.encoding import dump_json, load_json, compress_body
+
+RESULTS_FILE = 'results.jsonl'
+RESULTS_INDEX_FILE = 'results.index'
+# Every index entry is request index, offset and length of its line in results file
+INDEX_ENTRY_SIZE = 3
+
+
+def get_results_path(directory):
+    return os.path.join(directory, RESULTS_FILE)
+
+
+def _compress_bodies(report, compression):
+    report['request'] = dict(report['request'], body=compress_body(report['request'].get('body'), compression))
+    for key in ('original_response', 'received_response'):
+        response = report.get(key)
+        if response is not None and 'body' in response:
+            report[key] = dict(response, body=dict(response['body'],
+                                                   string=compress_body(response['body'].get('string'), compression)))
+    return report
+
+
+class ResultsWriter:
+    # Reports are appended to one file as lines of short header and report JSON separated by tab,
+    # so summary could read headers without parsing reports. Offsets of the lines are kept in a binary index.
+
+    def __init__(self, directory, compression=Compression.NONE):
+        self.directory = directory
+        self.compression = compression
+        self._results = None
+        self._index = None
+        # Index entries of lines that are not flushed yet
+        self._pending = array.array('Q')
+
+    def _open(self):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        self._results = open(get_results_path(self.directory), 'ab')
+        self._index = open(os.path.join(self.directory, RESULTS_INDEX_FILE), 'ab')
+
+    def write(self, index, report, endpoint):
+        if self._results is None:
+            self._open()
+        if self.compression != Compression.NONE:
+            report = _compress_bodies(report, self.compression)
+        header = json.dumps({'index': index, 'result': report.get('result'), 'endpoint': endpoint})
+        line = f'{header}\t{dump_json(report)}\n'.encode('utf-8')
+        offset = self._results.tell()
+        self._results.write(line)
+        self._pending.extend((index, offset, len(line)))
+
+    def flush(self):
+        # Index entries are written only after their lines are flushed, so index never points to a partially
+        # written line, even when Zelig stops between flushes
+        if self._results is not None:
+            self._results.flush()
+            self._index.write(self._pending.tobytes())
+            self._index.flush()
+            self._pending = array.array('Q')
+
+    def close(self):
+        if self._results is not None:
+            self.flush()
+            self._results.close()
+            self._index.close()
+            self._results = self._index = None
+
+
+def has_results(directory):
+    return os.path.exists(get_results_path(directory))
+
+
+def read_index(directory):
+    entries = array.array('Q')
+    with open(os.path.join(directory, RESULTS_INDEX_FILE), 'rb') as f:
+        data = f.read()
+    # Entry that was being written when Zelig stopped is skipped
+    entry_size = entries.itemsize * INDEX_ENTRY_SIZE
+    entries.frombytes(data[:len(data) - len(data) % entry_size])
+    return entries
+
+
+def _parse_line(line):
+    header, report = line.decode('utf-8').split('\t', 1)
+    return json.loads(header), load_json(report)
+
+
+def read_positions(directory):
+    # Returns offset and length of the latest line of every request index, later entries replace earlier ones
+    entries = read_index(directory)
+    return dict(zip(entries[::INDEX_ENTRY_SIZE], zip(entries[1::INDEX_ENTRY_SIZE], entries[2::INDEX_ENTRY_SIZE])))
+
+
+def read_report(directory, index, positions=None):
+    # Returns the latest report of request with `index` or None.
+    # Positions are read once and passed when many reports are looked up.
+    if positions is None:
+        positions = read_positions(directory)
+    if index not in positions:
+        return None
+    offset, length = positions[index]
+    with open(get_results_path(directory), 'rb') as f:
+        f.seek(offset)
+        _, report = _parse_line(f.read(length))
+    return report
+
+
+def iter_headers(directory):
+    with open(get_results_path(directory), 'rb') as f:
+        for line in f:
+            if line.endswith(b'\n'):
+                yield json.loads(line[:line.index(b'\t')].decode('utf-8'))
+
+
+def iter_reports(directory):
+    with open(get_results_path(directory), 'rb') as f:
+        for line in f:
+            if line.endswith(b'\n'):
+                header, report = _parse_line(line)
+                yield header['index'], report
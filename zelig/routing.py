@@ -0,0 +1,129 @@
+import asyncio
+import os
+from urllib.parse import urlparse
+
+from aiohttp import web
+
+from zelig.constants import UPSTREAM_KEY
+from zelig.log import logger
+from zelig.session import create_client_session, UnpatchedClientSession
+
+DEFAULT_ROUTE_NAME = 'default'
+
+
+class Upstream:
+    # Target server with its own connection pool, timeouts and cassette shard.
+    # vcr intercepts requests for one cassette only, so responses of routed upstreams are recorded by Zelig itself,
+    # while the only upstream of configuration without routes uses the cassette vcr is patched with.
+
+    def __init__(self, name, base_url, cassette_path, config, host=None, prefix='/', patched=False, **options):
+        self.name = name
+        self.base_url = base_url
+        self.cassette_path = cassette_path
+        self.host = host
+        self.prefix = prefix
+        self.patched = patched
+        # Pool settings have the same names as in config, so session of the upstream is created the same way
+        self.upstream_pool_size = options.get('pool_size', config.upstream_pool_size)
+        self.upstream_pool_size_per_host = options.get('pool_size_per_host', config.upstream_pool_size_per_host)
+        self.upstream_keepalive_timeout = options.get('keepalive_timeout', config.upstream_keepalive_timeout)
+        self.upstream_dns_cache = config.upstream_dns_cache
+        self.upstream_connect_timeout = options.get('connect_timeout', config.upstream_connect_timeout)
+        self.upstream_read_timeout = options.get('read_timeout', config.upstream_read_timeout)
+        self.session = None
+        self.cassette = None
+        self._loading = None
+
+    @property
+    def target_host(self):
+        return urlparse(self.base_url).netloc
+
+    def matches(self, host, path):
+        return (self.host is None or self.host == host) and path.startswith(self.prefix)
+
+    async def get_cassette(self, load, loop):
+        # Shard is loaded in a thread on first request routed to the upstream, concurrent requests wait for it
+        if self.cassette is None:
+            if self._loading is None:
+                logger.info(f'Loading {self.name} cassette {self.cassette_path}')
+                self._loading = loop.run_in_executor(None, load, self.cassette_path)
+            try:
+                cassette = await asyncio.shield(self._loading, loop=loop)
+            except Exception:
+                self._loading = None
+                raise
+            if self.cassette is None:
+                self.cassette = cassette
+        return self.cassette
+
+
+def get_upstreams(config):
+    routes = list(getattr(config, 'routes', ()))
+    if config.target_server_base_url:
+        # Requests that do not match any route go to the target server
+        routes.append({'upstream': config.target_server_base_url, 'name': DEFAULT_ROUTE_NAME, 'prefix': '/'})
+    return [Upstream(route['name'], route['upstream'], os.path.join(config.data_directory, route['name']), config,
+                     **{k: v for k, v in route.items() if k not in ('name', 'upstream')})
+            for route in routes]
+
+
+class UpstreamRouter:
+    def __init__(self, upstreams, load=None):
+        # Routes with host are checked first, longer prefixes before shorter ones
+        self.upstreams = sorted(upstreams, key=lambda u: (u.host is None, -len(u.prefix)))
+        self._load = load
+
+    @classmethod
+    def from_cassette(cls, config, cassette):
+        # Without routes every request goes to the target server and is recorded to the only cassette
+        upstream = Upstream(DEFAULT_ROUTE_NAME, config.target_server_base_url, config.data_directory, config,
+                            patched=True)
+        upstream.cassette = cassette
+        return cls([upstream])
+
+    def resolve(self, request):
+        host = request.host.rsplit(':', 1)[0] if request.host else ''
+        for upstream in self.upstreams:
+            if upstream.matches(host, request.path):
+                return upstream
+        return None
+
+    async def get_cassette(self, upstream, loop):
+        return await upstream.get_cassette(self._load, loop)
+
+    def cassettes(self):
+        return [upstream.cassette for upstream in self.upstreams if upstream.cassette is not None]
+
+    async def open_sessions(self, app):
+        for upstream in self.upstreams:
+            if upstream.patched:
+                upstream.session = app.client_session
+            else:
+                upstream.session = create_client_session(upstream, loop=app.loop, session_class=UnpatchedClientSession)
+
+    async def close_sessions(self, app):
+        for upstream in self.upstreams:
+            if not upstream.patched and upstream.session is not None:
+                upstream.session.close()
+            upstream.session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # Only shards that were hit are loaded and saved
+        for upstream in self.upstreams:
+            if not upstream.patched and upstream.cassette is not None:
+                upstream.cassette._save()
+
+
+async def routing_middleware(app, handler):
+    async def middleware_handler(request):
+        if not request.path.startswith(app.config.admin_path):
+            upstream = app.upstream_router.resolve(request)
+            if upstream is None:
+                logger.warning(f'No route for request: {request.method} {request.host}{request.path}')
+                raise web.HTTPNotFound(text=f'Zelig has no route for {request.host}{request.path}')
+            request[UPSTREAM_KEY] = upstream
+        return await handler(request)
+    return middleware_handler
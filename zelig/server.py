@@ -1,63 +1,193 @@
 import asyncio
 import contextlib
 import functools
+import os
 import signal
+import socket
+import time
 
-import vcr
 from aiohttp import web
 from vcr.errors import UnhandledHTTPRequestError
 
 from zelig.app import ZeligServerApplication
-from zelig.constants import ZeligMode, RecordMode
+from zelig.cache import ResponseCache, CassetteAppender, is_cacheable, should_cache
+from zelig.coalesce import COALESCED_METHODS
+from zelig.cassette import use_cassette, load_cassette
+from zelig.constants import ZeligMode, RecordMode, CoalesceRecord, UPSTREAM_KEY
 from zelig.log import logger
 from zelig.matchers import match_responses
+from zelig.metrics import OUTCOME_KEY, Outcome
+from zelig.proxy import stream_response
+from zelig.reload import CassetteReloader, reload_handler
 from zelig.report import Reporter
+from zelig.routing import UpstreamRouter, get_upstreams
+from zelig.sidecar import disable_saving as disable_sidecar_saving
+from zelig.simulation import ResponseSimulator
+from zelig.store import MmapStorePersister, refresh_store
 from zelig.utils import (
-    extract_response_info, extract_request_info, get_response_from_data, wait,
-    make_request, get_server_response
+    extract_request_info, get_response_from_data, wait, get_query_string,
+    make_request, get_recorded_server_response, get_recorded_body, build_vcr_request
 )
 
 
-async def observe(request, reporter, requests_data):
+async def get_cassette(request):
+    return await request.app.upstream_router.get_cassette(request[UPSTREAM_KEY], request.app.loop)
+
+
+async def fetch(request, request_info):
+    # Returns response for the client, received response and vcr request if response should be recorded by Zelig
+    upstream = request[UPSTREAM_KEY]
+    if request.app.config.stream_responses:
+        server_response, vcr_request, received_response = await stream_response(request, request_info)
+        return server_response, received_response, vcr_request
+    if upstream.patched:
+        received_response = await make_request(upstream.session, request_info)
+        return get_recorded_server_response(received_response), received_response, None
+    # Requests to routed upstreams are not intercepted by vcr, so they are recorded the same way as streamed ones
+    vcr_request = build_vcr_request(request_info)
+    started = time.time()
+    received_response = await make_request(upstream.session, request_info)
+    received_response.update(url=str(received_response['url']), latency=time.time() - started)
+    return get_recorded_server_response(received_response), received_response, vcr_request
+
+
+async def forward(request, request_info):
+    config = request.app.config
+    single_flight = request.app.single_flight
+    if single_flight is None or request.method not in COALESCED_METHODS:
+        return await fetch(request, request_info)
+
+    vcr_request = build_vcr_request(request_info)
+    cassette = await get_cassette(request)
+    key = (request[UPSTREAM_KEY].name, cassette.request_key(vcr_request))
+    result, shared = await single_flight.run(key, functools.partial(fetch, request, request_info),
+                                             loop=request.app.loop)
+    if not shared:
+        return result
+    _, received_response, _ = result
+    if not is_cacheable(received_response):
+        # Streamed body was too large to be kept, so it is requested once again
+        return await fetch(request, request_info)
+    # Response of identical request is recorded once, unless it is configured to be recorded for every caller
+    recorded_request = vcr_request if config.coalesce_record == CoalesceRecord.PER_CALLER else None
+    return get_recorded_server_response(received_response), received_response, recorded_request
+
+
+async def observe(request, reporter):
+    metrics = request.app.metrics
     request_info = await extract_request_info(request)
+    requests_data = await get_cassette(request)
 
-    original_response = get_response_from_data(requests_data, request_info)
+    match_started = time.time()
+    response_index, original_response = get_response_from_data(requests_data, request_info)
+    match_time = time.time() - match_started
     request_matched = (original_response is not None)
     write_to_log = not request_matched
+    request[OUTCOME_KEY] = Outcome.MATCHED if request_matched else Outcome.UNMATCHED
 
-    response = await make_request(request_info)
-
-    received_response = await extract_response_info(response)
+    upstream_started = time.time()
+    server_response, received_response, vcr_request = await forward(request, request_info)
+    if vcr_request is not None:
+        requests_data.append(vcr_request, dict(received_response, body=dict(received_response['body'])))
+    metrics.observe_upstream(request.method, request.path, time.time() - upstream_started)
 
     logger.debug(f'Request already exist: {request_matched}')
     if request_matched:
         # Match responses only when request matched
         matchers = [v.value for v in request.app.config.response_match_on]
-        match = match_responses(original_response, received_response, matchers)
+        match_started = time.time()
+        # Fingerprint of recorded response is computed once and reused for every identical request
+        match = match_responses(original_response, received_response, matchers,
+                                fingerprint1=requests_data.fingerprint(response_index),
+                                ignore_paths=request.app.config.response_ignore_paths)
+        match_time += time.time() - match_started
         logger.debug(f'Responses match: {match}')
         write_to_log = not match
+        if not match:
+            request[OUTCOME_KEY] = Outcome.MISMATCH
+    metrics.observe_match(match_time)
 
     if write_to_log:
-        reporter.report({
+        request_index = original_response['index'] if original_response else requests_data.length
+        await reporter.report({
             'request': request_info,
             'original_response': original_response,
             'received_response': received_response,
             'result': '{} mismatch'.format('Request' if not request_matched else 'Responses')
-        }, request_index=original_response['index'] if original_response else requests_data.length)
+        }, request_index=request_index, loop=request.app.loop)
     reporter.record_metadata()
-    return await get_server_response(response)
+    return server_response
 
 
 async def record(request):
     request_info = await extract_request_info(request)
-    response = await make_request(request_info)
-    return await get_server_response(response)
+    upstream_started = time.time()
+    server_response, received_response, vcr_request = await forward(request, request_info)
+    if vcr_request is not None:
+        cassette = await get_cassette(request)
+        cassette.append(vcr_request, received_response)
+    request.app.metrics.observe_upstream(request.method, request.path, time.time() - upstream_started)
+    request[OUTCOME_KEY] = Outcome.RECORDED
+    return server_response
+
 
 async def serve(request):
     request_info = await extract_request_info(request, replace_host=False)
-    response = await make_request(request_info)
-    await wait(response.latency, loop=request.app.loop)
-    return await get_server_response(response)
+    cassette = await get_cassette(request)
+    match_started = time.time()
+    # Request is looked up in cassette of the upstream it was routed to
+    response = cassette.play_response(build_vcr_request(request_info))
+    request.app.metrics.observe_match(time.time() - match_started)
+    logger.info('{request[method]} {request[url]}{qs} - {status}'.format(
+        request=request_info, status=response['status']['code'], qs=get_query_string(request_info['params'])))
+    if not is_cacheable(response):
+        # Body was over ZELIG_STREAM_BODY_CAP when recorded, so only its digest is known
+        request[OUTCOME_KEY] = Outcome.ERROR
+        logger.warning(f'Recorded response to {request.method} {request_info["url"]} has truncated body '
+                       f'of {response["body"]["length"]} bytes and could not be served')
+        raise web.HTTPBadGateway(text=f'Zelig recorded only digest of {response["body"]["length"]} bytes body '
+                                      f'of this response, so it could not be served')
+    request[OUTCOME_KEY] = Outcome.MATCHED
+    simulator = request.app.simulator
+    latency = simulator.get_latency(cassette, request.method, request_info['url'], response.get('latency'))
+    if not simulator.throttled:
+        await wait(latency, loop=request.app.loop)
+        return get_recorded_server_response(response)
+    body = get_recorded_body(response)
+    rate = simulator.get_rate(len(body), response.get('latency'))
+    # Latency is recorded until the whole body is read, so body transfer time is not waited twice
+    await wait(latency, reserve=len(body) / rate, loop=request.app.loop)
+    return await simulator.send(request, response['status']['code'], response['headers'], body, rate)
+
+
+async def cache(request, response_cache, appender):
+    request_info = await extract_request_info(request)
+    vcr_request = build_vcr_request(request_info)
+
+    key = request.app.cassette.request_key(vcr_request)
+    if request.method in COALESCED_METHODS:
+        match_started = time.time()
+        _, response = request.app.cassette.find_response(vcr_request)
+        if not is_cacheable(response):
+            response = response_cache.get(key)
+        request.app.metrics.observe_match(time.time() - match_started)
+        if response is not None:
+            request[OUTCOME_KEY] = Outcome.MATCHED
+            return get_recorded_server_response(response)
+
+    upstream_started = time.time()
+    received_response = await make_request(request.app.client_session, request_info)
+    latency = time.time() - upstream_started
+    request.app.metrics.observe_upstream(request.method, request.path, latency)
+    received_response.update(url=str(received_response['url']), latency=latency)
+
+    if should_cache(request.method, received_response):
+        response_cache.put(key, received_response)
+        appender.append(vcr_request, received_response)
+        request[OUTCOME_KEY] = Outcome.RECORDED
+    else:
+        request[OUTCOME_KEY] = Outcome.UNMATCHED
+    return get_recorded_server_response(received_response)
 
 
 async def request_handler(request, mode):
@@ -68,57 +198,185 @@ async def request_handler(request, mode):
     try:
         return await handlers[mode](request)
     except UnhandledHTTPRequestError as e:
+        request[OUTCOME_KEY] = Outcome.UNMATCHED
         logger.warning(f'Unknown request in {mode.value} mode: {request.method} {request.url}')
         request.transport.abort()
         # we have closed a connection but we still need to return something
         raise web.HTTPBadRequest(text=str(e))
 
 
-def start(app):
-    loop = asyncio.get_event_loop()
-    handler = app.make_handler(loop=loop)
-    f = loop.create_server(handler, app.config.zelig_host, app.config.zelig_port)
-    srv = loop.run_until_complete(f)
-    host, port = srv.sockets[0].getsockname()
-    logger.info(f'Serving on {host}:{port}')
+async def admin_fallback_handler(request):
+    allowed = {route.method for route in request.app.router.routes()
+               if route.resource.get_info().get('path') == request.path}
+    if allowed:
+        raise web.HTTPMethodNotAllowed(request.method, allowed)
+    raise web.HTTPNotFound(text=f'Unknown admin path {request.path}')
 
-    async def graceful_shutdown():
-        srv.close()
-        await srv.wait_closed()
-        await app.shutdown()
-        await handler.shutdown(60.0)
-        await app.cleanup()
-        logger.info('Zelig server successfully shut down')
 
-    loop.add_signal_handler(signal.SIGTERM, loop.stop)
-    try:
-        loop.run_forever()
-    except KeyboardInterrupt:
-        pass
-    finally:
-        loop.run_until_complete(graceful_shutdown())
-    loop.close()
+def bind_socket(host, port, reuse_port=False):
+    family, type_, proto, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM,
+                                                          flags=socket.AI_PASSIVE)[0]
+    sock = socket.socket(family, type_, proto)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(address)
+    sock.listen(socket.SOMAXCONN)
+    sock.setblocking(False)
+    return sock
 
 
-def start_server(config):
-    app = ZeligServerApplication(config=config)
+def create_app(config, router, stack, loop, cassette=None):
+    app = ZeligServerApplication(config=config, loop=loop)
     mode = config.mode
-
-    if mode == ZeligMode.SERVE:
-        record_mode = RecordMode.NONE
+    app.cassette = cassette
+    app.upstream_router = router
+    app.metrics.add_gauge('zelig_cassette_interactions', 'Number of interactions in cassette',
+                          lambda: sum(len(c) for c in router.cassettes()))
+    if mode == ZeligMode.OBSERVE:
+        reporter = stack.enter_context(Reporter(config.observe_report_directory, mode=mode,
+                                                queue_size=config.report_queue_size,
+                                                queue_policy=config.report_queue_policy,
+                                                flush_interval=config.meta_flush_interval / 1000,
+                                                ignore_paths=config.response_ignore_paths,
+                                                compression=config.compression,
+                                                layout=config.report_layout))
+        app.metrics.add_gauge('zelig_report_queue_depth', 'Number of reports waiting to be written',
+                              reporter.queue_depth)
+        handler = functools.partial(observe, reporter=reporter)
+    elif mode == ZeligMode.CACHE:
+        response_cache = ResponseCache(config.cache_max_size, ttl=config.cache_ttl)
+        appender = stack.enter_context(CassetteAppender(cassette))
+        app.metrics.add_gauge('zelig_cache_bytes', 'Size of responses in cache', lambda: response_cache.size)
+        app.metrics.add_gauge('zelig_cache_entries', 'Number of responses in cache', response_cache.__len__)
+        handler = functools.partial(cache, response_cache=response_cache, appender=appender)
     else:
-        record_mode = RecordMode.ALL
+        if mode == ZeligMode.SERVE:
+            app.simulator = ResponseSimulator(config)
+            reloader = CassetteReloader(router.cassettes, interval=config.reload_interval)
+            app.on_startup.append(reloader.start)
+            app.on_cleanup.append(reloader.stop)
+            app.router.add_route('POST', f'{config.admin_path}/reload',
+                                 functools.partial(reload_handler, reloader=reloader))
+        handler = functools.partial(request_handler, mode=mode)
+    # Admin paths are not routed upstream, so requests that no admin route handles are answered here
+    app.router.add_route('*', f'{config.admin_path}{{path:.*}}', admin_fallback_handler)
+    app.router.add_route('*', '/{path:.*}', handler)
+    return app
 
+
+def start(config, router, cassette=None, sock=None):
+    # Every process runs its own event loop with its own application and client sessions
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
     # Use ExitStack to optionally enter Reporter context
     with contextlib.ExitStack() as stack:
-        request_match_on = [i.value for i in config.request_match_on]
-        cassette = stack.enter_context(vcr.use_cassette(config.data_directory,
-                                                        record_mode=record_mode.value,
-                                                        match_on=request_match_on))
-        if mode == ZeligMode.OBSERVE:
-            reporter = stack.enter_context(Reporter(config.observe_report_directory, mode=mode))
-            app.router.add_route('*', '/{path:.*}', functools.partial(observe, requests_data=cassette, reporter=reporter))
+        app = create_app(config, router, stack, loop, cassette=cassette)
+        handler = app.make_handler(loop=loop)
+        loop.run_until_complete(app.startup())
+        if sock is None:
+            f = loop.create_server(handler, config.zelig_host, config.zelig_port)
+        else:
+            f = loop.create_server(handler, sock=sock)
+        srv = loop.run_until_complete(f)
+        host, port = srv.sockets[0].getsockname()
+        logger.info(f'Serving on {host}:{port}')
+
+        async def graceful_shutdown():
+            srv.close()
+            await srv.wait_closed()
+            await app.shutdown()
+            await handler.shutdown(60.0)
+            await app.cleanup()
+            logger.info('Zelig server successfully shut down')
+
+        loop.add_signal_handler(signal.SIGTERM, loop.stop)
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.run_until_complete(graceful_shutdown())
+    loop.close()
+
+
+def start_workers(config, workers, start_worker, before_reload=None):
+    # Workers are forked after cassette is loaded, so they share it copy-on-write.
+    # Event loop, application and client sessions are created in every worker after fork.
+    # With SO_REUSEPORT every worker gets its own socket and kernel balances connections between them,
+    # otherwise all workers accept connections on one socket bound before fork.
+    reuse_port = hasattr(socket, 'SO_REUSEPORT')
+    shared_sock = None if reuse_port else bind_socket(config.zelig_host, config.zelig_port)
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                disable_sidecar_saving()
+                start_worker(sock=shared_sock or bind_socket(config.zelig_host, config.zelig_port, reuse_port=True))
+            finally:
+                os._exit(0)
+        logger.info(f'Started worker {pid}')
+        children.append(pid)
+
+    def signal_workers(signum, frame):
+        if signum == signal.SIGHUP and before_reload is not None:
+            try:
+                before_reload()
+            except Exception as e:
+                logger.error(f'Could not prepare reload of workers. {e!r}')
+        for child in children:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(child, signal.SIGTERM if signum == signal.SIGINT else signum)
+
+    signal.signal(signal.SIGTERM, signal_workers)
+    signal.signal(signal.SIGINT, signal_workers)
+    # Every worker reloads its own copy of the cassette
+    signal.signal(signal.SIGHUP, signal_workers)
+    for child in children:
+        os.waitpid(child, 0)
+    logger.info('All workers stopped')
+
+
+def get_cassette_kwargs(config):
+    mode = config.mode
+    record_mode = RecordMode.NONE if mode == ZeligMode.SERVE else RecordMode.ALL
+    persister = MmapStorePersister if mode == ZeligMode.SERVE and config.mmap_bodies else None
+    return dict(cassette_format=config.cassette_format,
+                compression=config.compression,
+                persister=persister,
+                sidecar=getattr(config, 'load_cache', False),
+                # Newly recorded interactions are not looked up in cassette
+                # in 'record' mode, and are looked up in LRU in 'cache' mode
+                retain_recorded=(mode not in (ZeligMode.RECORD, ZeligMode.CACHE)),
+                record_mode=record_mode.value,
+                match_on=[i.value for i in config.request_match_on])
+
+
+def prepare_reload(config, router):
+    # Stores and sidecars of changed cassettes are rebuilt once in the parent, so workers only load them on reload
+    for cassette in router.cassettes():
+        if config.mmap_bodies:
+            refresh_store(cassette._path)
+        elif cassette._sidecar and cassette.changed():
+            cassette.load_changes()
+
+
+def start_server(config):
+    mode = config.mode
+    with contextlib.ExitStack() as stack:
+        cassette_kwargs = get_cassette_kwargs(config)
+        if getattr(config, 'routes', None):
+            # Every upstream has its own cassette shard in data directory, shards are loaded on first request
+            cassette = None
+            router = stack.enter_context(UpstreamRouter(get_upstreams(config),
+                                                        load=functools.partial(load_cassette, **cassette_kwargs)))
         else:
-            app.router.add_route('*', '/{path:.*}', functools.partial(request_handler, mode=mode))
+            cassette = stack.enter_context(use_cassette(config.data_directory, **cassette_kwargs))
+            router = UpstreamRouter.from_cassette(config, cassette)
 
-        start(app)
+        if mode == ZeligMode.SERVE and config.workers > 1:
+            start_workers(config, config.workers, functools.partial(start, config, router, cassette=cassette),
+                          before_reload=functools.partial(prepare_reload, config, router))
+        else:
+            start(config, router, cassette=cassette)
@@ -0,0 +1,40 @@
+import aiohttp
+from aiohttp.abc import AbstractCookieJar
+from http.cookies import SimpleCookie
+
+
+class DummyCookieJar(AbstractCookieJar):
+    # Shared session must not leak cookies of one proxied client to another
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def clear(self):
+        pass
+
+    def update_cookies(self, cookies, response_url=None):
+        pass
+
+    def filter_cookies(self, request_url):
+        return SimpleCookie()
+
+
+class UnpatchedClientSession(aiohttp.ClientSession):
+    # Keeps the original request method, so requests made through this session are not intercepted
+    # by vcr, which patches ClientSession when cassette is used. Such requests are recorded by Zelig.
+    _request = aiohttp.ClientSession._request
+
+
+def create_client_session(config, loop=None, session_class=aiohttp.ClientSession):
+    connector = aiohttp.TCPConnector(limit=config.upstream_pool_size,
+                                     limit_per_host=config.upstream_pool_size_per_host,
+                                     keepalive_timeout=config.upstream_keepalive_timeout,
+                                     use_dns_cache=config.upstream_dns_cache,
+                                     loop=loop)
+    return session_class(connector=connector,
+                         cookie_jar=DummyCookieJar(loop=loop),
+                         conn_timeout=config.upstream_connect_timeout,
+                         read_timeout=config.upstream_read_timeout,
+                         loop=loop)
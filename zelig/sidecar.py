@@ -0,0 +1,77 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+from zelig.log import logger
+
+SIDECAR_SUFFIX = '.cache'
+SIDECAR_VERSION = 1
+# Forked serve workers only read sidecars, they are written by the parent process
+_writable = True
+
+
+def get_sidecar_path(cassette_path):
+    return f'{cassette_path}{SIDECAR_SUFFIX}'
+
+
+def _get_digest(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _get_header(cassette_path, digest=None):
+    stat = os.stat(cassette_path)
+    return {
+        'version': SIDECAR_VERSION,
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'digest': digest,
+    }
+
+
+def load_sidecar(cassette_path):
+    # Sidecar is a pickled header followed by pickled data, so stale sidecar is rejected without reading the data.
+    # Returns dict with 'data' list of (request, response) pairs, 'match_on' names and request 'index', or None
+    try:
+        with open(get_sidecar_path(cassette_path), 'rb') as f:
+            header = pickle.load(f)
+            expected = _get_header(cassette_path, digest=header.get('digest'))
+            if header != expected or header['digest'] != _get_digest(cassette_path):
+                return None
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # Sidecar is only a cache, so whatever is wrong with it the cassette is parsed again and sidecar is rebuilt
+        logger.warning(f'Could not load sidecar of {cassette_path}, it will be rebuilt. {e!r}')
+        return None
+
+
+def disable_saving():
+    global _writable
+    _writable = False
+
+
+def save_sidecar(cassette_path, data, match_on=None, index=None):
+    if not _writable:
+        return
+    sidecar_path = get_sidecar_path(cassette_path)
+    tmp_path = None
+    try:
+        # Every writer has its own temporary file, so concurrent writers never mix their data
+        fd, tmp_path = tempfile.mkstemp(prefix=f'{os.path.basename(sidecar_path)}.', suffix='.tmp',
+                                        dir=os.path.dirname(os.path.abspath(sidecar_path)))
+        with open(fd, 'wb') as f:
+            pickle.dump(_get_header(cassette_path, digest=_get_digest(cassette_path)), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump({'data': data, 'match_on': match_on, 'index': index or {}}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, sidecar_path)
+    except (IOError, pickle.PicklingError) as e:
+        logger.warning(f'Could not save sidecar of {cassette_path}. {e!r}')
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,106 @@
+import array
+import asyncio
+import collections
+import random
+
+from aiohttp import web
+
+from zelig.constants import ServeLatency, ServeBandwidth
+from zelig.latency import get_endpoint
+from zelig.utils import filter_response_headers
+
+# Interval of the timer that paces bodies of all throttled responses
+TICK = 0.05
+
+
+class LatencyDistribution:
+    # Recorded latencies grouped by endpoint, rebuilt when cassette is reloaded
+    def __init__(self, cassette):
+        self.cassette = cassette
+        self._data = None
+        self._length = 0
+        self._latencies = {}
+
+    def _build(self):
+        latencies = collections.defaultdict(lambda: array.array('d'))
+        for request, response in self.cassette.data:
+            if response.get('latency') is not None:
+                latencies[get_endpoint(request.method, request.uri)].append(response['latency'])
+        self._latencies = dict(latencies)
+        self._data, self._length = self.cassette.data, len(self.cassette.data)
+
+    def sample(self, method, url, default):
+        if self.cassette.data is not self._data or len(self.cassette.data) != self._length:
+            self._build()
+        latencies = self._latencies.get(get_endpoint(method, url))
+        return random.choice(latencies) if latencies else default
+
+
+class BandwidthScheduler:
+    # One timer paces all throttled responses: every tick wakes all of them,
+    # and each one sends as many bytes as its rate allows since it was started
+    def __init__(self, tick=TICK):
+        self.tick = tick
+        self._next_tick = None
+
+    def _wait_tick(self, loop):
+        if self._next_tick is None:
+            self._next_tick = loop.create_future()
+            loop.call_later(self.tick, self._wake)
+        # Cancelled response should not cancel the tick other responses wait for
+        return asyncio.shield(self._next_tick, loop=loop)
+
+    def _wake(self):
+        next_tick, self._next_tick = self._next_tick, None
+        next_tick.set_result(None)
+
+    async def send(self, response, body, rate, loop):
+        body = memoryview(body)
+        sent = 0
+        started = loop.time()
+        while sent < len(body):
+            await self._wait_tick(loop)
+            allowed = int((loop.time() - started) * rate) - sent
+            if allowed <= 0:
+                continue
+            chunk = body[sent:sent + allowed]
+            response.write(bytes(chunk))
+            await response.drain()
+            sent += len(chunk)
+
+
+class ResponseSimulator:
+    def __init__(self, config):
+        self.latency = config.serve_latency
+        self.bandwidth = config.serve_bandwidth
+        self.rate = config.serve_bandwidth_rate
+        # Every cassette shard has its own distribution
+        self._distributions = {}
+        self._scheduler = BandwidthScheduler() if self.bandwidth != ServeBandwidth.NONE else None
+
+    @property
+    def throttled(self):
+        return self._scheduler is not None
+
+    def get_latency(self, cassette, method, url, recorded):
+        if self.latency == ServeLatency.NONE:
+            return 0
+        if self.latency == ServeLatency.DISTRIBUTION:
+            if cassette not in self._distributions:
+                self._distributions[cassette] = LatencyDistribution(cassette)
+            return self._distributions[cassette].sample(method, url, recorded or 0)
+        return recorded or 0
+
+    def get_rate(self, length, recorded_latency):
+        # Recorded rate spreads the body over the time original response took
+        if self.bandwidth == ServeBandwidth.RECORDED and recorded_latency:
+            return max(1, length / recorded_latency)
+        return self.rate
+
+    async def send(self, request, status, headers, body, rate):
+        response = web.StreamResponse(status=status, headers=filter_response_headers(headers))
+        response.content_length = len(body)
+        await response.prepare(request)
+        await self._scheduler.send(response, body, rate, loop=request.app.loop)
+        await response.write_eof()
+        return response
@@ -0,0 +1,135 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+
+from vcr.serializers import yamlserializer
+
+from zelig.log import logger
+from zelig.persisters import (
+    ReadOnlyCassetteError, get_persister, is_stream_cassette, iter_stream_cassette, dump_interaction, load_interaction
+)
+
+STORE_SUFFIX = '.store'
+STORE_INDEX_FILE = 'index'
+STORE_BODIES_FILE = 'bodies'
+BODY_REFERENCE_KEY = '__store__'
+STORE_LOAD_ATTEMPTS = 3
+
+
+def get_store_path(cassette_path):
+    return f'{cassette_path}{STORE_SUFFIX}'
+
+
+def is_store_fresh(store_path, cassette_path):
+    index_path = os.path.join(store_path, STORE_INDEX_FILE)
+    return os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(cassette_path)
+
+
+def _iter_cassette(cassette_path):
+    if is_stream_cassette(cassette_path):
+        return iter_stream_cassette(cassette_path)
+    return zip(*get_persister(cassette_path).load_cassette(cassette_path, yamlserializer))
+
+
+def _to_bytes(body):
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    return bytes(body or b'')
+
+
+def build_store(cassette_path, store_path):
+    # Response bodies are written one after another to a raw file, everything else goes to the index
+    # with offsets of the bodies. Equal bodies are written once and share the offset.
+    # Every build goes to its own directory, so workers reloading at the same time never write the same files.
+    build_path = tempfile.mkdtemp(prefix=f'{os.path.basename(store_path)}.',
+                                  dir=os.path.dirname(os.path.abspath(store_path)))
+    try:
+        offsets = {}
+        with open(os.path.join(build_path, STORE_INDEX_FILE), 'w') as index, \
+                open(os.path.join(build_path, STORE_BODIES_FILE), 'wb') as bodies:
+            for request, response in _iter_cassette(cassette_path):
+                body = _to_bytes(response.get('body', {}).get('string'))
+                digest = hashlib.sha256(body).digest()
+                if digest not in offsets:
+                    offsets[digest] = bodies.tell()
+                    bodies.write(body)
+                response = dict(response, body={BODY_REFERENCE_KEY: [offsets[digest], len(body)]})
+                index.write(dump_interaction(request, response) + '\n')
+        _switch_store(store_path, build_path)
+    except BaseException:
+        shutil.rmtree(build_path, ignore_errors=True)
+        raise
+
+
+def _switch_store(store_path, build_path):
+    # Store path is a symlink to the current build and is replaced atomically with a link to the new one
+    previous = os.path.realpath(store_path) if os.path.islink(store_path) else None
+    if previous is None and os.path.isdir(store_path):
+        shutil.rmtree(store_path, ignore_errors=True)
+    link_path = f'{build_path}.link'
+    os.symlink(os.path.basename(build_path), link_path)
+    os.replace(link_path, store_path)
+    if previous is not None and previous != build_path:
+        # Processes that loaded the previous build keep its bodies mapped after it is removed
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def refresh_store(cassette_path):
+    store_path = get_store_path(cassette_path)
+    if not is_store_fresh(store_path, cassette_path):
+        # Processes reloading at the same time wait for one of them to build the store and use the same build
+        with open(f'{store_path}.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not is_store_fresh(store_path, cassette_path):
+                logger.info(f'Building body store {store_path}')
+                build_store(cassette_path, store_path)
+    return store_path
+
+
+def _map_bodies(path):
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return memoryview(b'')
+        # Mapping stays valid after file is closed
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def load_store(store_path):
+    # Link is resolved once, so index and bodies are read from the same build
+    store_path = os.path.realpath(store_path)
+    bodies = _map_bodies(os.path.join(store_path, STORE_BODIES_FILE))
+    requests, responses = [], []
+    with open(os.path.join(store_path, STORE_INDEX_FILE), 'r') as index:
+        for line in index:
+            request, response = load_interaction(line)
+            offset, length = response['body'][BODY_REFERENCE_KEY]
+            # Slicing a memoryview does not copy, body pages are read from disk when response is sent
+            response['body'] = {'string': bodies[offset:offset + length]}
+            requests.append(request)
+            responses.append(response)
+    return requests, responses
+
+
+class MmapStorePersister:
+    # Read-only persister that keeps response bodies in a memory-mapped file next to the cassette
+    read_only = True
+
+    @classmethod
+    def load_cassette(cls, cassette_path, serializer=None):
+        if not os.path.exists(cassette_path):
+            raise ValueError('Cassette not found.')
+        for attempt in range(STORE_LOAD_ATTEMPTS):
+            store_path = refresh_store(cassette_path)
+            try:
+                return load_store(store_path)
+            except FileNotFoundError:
+                # Build was replaced by another process before it was opened
+                if attempt == STORE_LOAD_ATTEMPTS - 1:
+                    raise
+
+    @staticmethod
+    def save_cassette(cassette_path, cassette_dict, serializer=None):
+        raise ReadOnlyCassetteError('Cassettes with memory-mapped bodies are read-only')
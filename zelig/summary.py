@@ -1,40 +1,119 @@
+import collections
 import json
+import math
 import os
 import time
 
 from zelig.constants import FILES_DIRECTORY, METADATA_FILE, SUMMARY_ARGUMENT
+from zelig.latency import LatencyStore, get_latency_path, percentile
 from zelig.log import logger
+from zelig.results import has_results, iter_headers
 
+LATENCY_THRESHOLD_ARGUMENT = '--latency-threshold'
+DEFAULT_LATENCY_THRESHOLD = 20
+# Exit code of 'summary' command when replayed latency regressed
+REGRESSION_EXIT_CODE = 2
+MAX_SUMMARY_ENDPOINTS = 10
 
-def get_summary_text(mode, report_dir, total_played, reports_number, started, finished, **kwargs):
+
+def get_summary_text(mode, report_dir, total_played, reports_number, started, finished, reports_dropped=0, **kwargs):
     return (
     f"""Summary of '{report_dir}' recorded in '{mode}' mode:
     Total requests played: {total_played}
         Successful: {total_played - reports_number}
-        Reports generated: {reports_number}
+        Reports generated: {reports_number - reports_dropped}
+        Reports dropped: {reports_dropped}
     Started at: {time.ctime(started)}
     Finished at: {time.ctime(finished)}
     Elapsed time: {round(finished-started, 4)} sec"""
     )
 
 
+def get_results_summary(report_dir):
+    # Only short headers of results are parsed, not the reports themselves
+    results, endpoints = collections.Counter(), collections.Counter()
+    for header in iter_headers(report_dir):
+        results[header['result']] += 1
+        endpoints[header['endpoint']] += 1
+    lines = ['Reports:']
+    lines.extend(f'    {result}: {count}' for result, count in results.most_common())
+    lines.append('    Endpoints with most reports:')
+    lines.extend(f'        {endpoint}: {count}' for endpoint, count in endpoints.most_common(MAX_SUMMARY_ENDPOINTS))
+    return '\n'.join(lines)
+
+
+def _format_ms(value):
+    return 'n/a' if math.isnan(value) else f'{value * 1000:.1f}ms'
+
+
+def get_latency_summary(latencies, elapsed, threshold):
+    # Returns summary text and list of endpoints which replayed median latency exceeds recorded one by threshold percent
+    replayed = sorted(latencies.replayed)
+    lines = [
+        'Latency:',
+        f'    Requests per second: {round(len(replayed) / elapsed, 2) if elapsed > 0 else "n/a"}',
+        '    ' + ' '.join(f'p{p}: {_format_ms(percentile(replayed, p))}' for p in (50, 90, 99)) +
+        f' max: {_format_ms(replayed[-1])}',
+        f'    Per endpoint, recorded -> replayed (regression threshold {threshold:g}%):',
+    ]
+    regressions = []
+    for endpoint, (recorded, replayed) in sorted(latencies.by_endpoint().items()):
+        recorded = sorted(v for v in recorded if not math.isnan(v))
+        replayed = sorted(replayed)
+        recorded_p50, replayed_p50 = percentile(recorded, 50), percentile(replayed, 50)
+        line = (f'        {endpoint} ({len(replayed)} requests): '
+                f'p50 {_format_ms(recorded_p50)} -> {_format_ms(replayed_p50)}, '
+                f'p90 {_format_ms(percentile(recorded, 90))} -> {_format_ms(percentile(replayed, 90))}')
+        if recorded_p50 > 0 and replayed_p50 > recorded_p50 * (1 + threshold / 100):
+            line += f' REGRESSION +{round((replayed_p50 / recorded_p50 - 1) * 100)}%'
+            regressions.append(endpoint)
+        lines.append(line)
+    return '\n'.join(lines), regressions
+
+
+def _parse_threshold(args):
+    if LATENCY_THRESHOLD_ARGUMENT not in args:
+        return DEFAULT_LATENCY_THRESHOLD
+    threshold_arg_index = args.index(LATENCY_THRESHOLD_ARGUMENT) + 1
+    try:
+        threshold = float(args[threshold_arg_index])
+        del args[threshold_arg_index - 1:threshold_arg_index + 1]
+        return threshold
+    except (IndexError, ValueError):
+        return None
+
+
 def print_summary(args):
+    args = list(args)
+    threshold = _parse_threshold(args)
     summary_arg_index = args.index(SUMMARY_ARGUMENT)
     directory_arg_index = summary_arg_index + 1
-    if directory_arg_index < len(args):
+    if threshold is not None and directory_arg_index < len(args):
         report_dir = args[directory_arg_index]
-        metadata_path = os.path.join(FILES_DIRECTORY, report_dir, METADATA_FILE)
+        report_path = os.path.join(FILES_DIRECTORY, report_dir)
+        metadata_path = os.path.join(report_path, METADATA_FILE)
         if os.path.exists(metadata_path):
             with open(metadata_path, 'r') as f:
                 try:
                     data = json.loads(f.read())
                     print(get_summary_text(report_dir=report_dir, **data))
-                    return
                 except json.JSONDecodeError as e:
                     logger.error(f'Could not read metadata file. {e!s}')
+                    exit(1)
+            if has_results(report_path):
+                print(get_results_summary(report_path))
+            latency_path = get_latency_path(report_path)
+            if os.path.exists(latency_path):
+                text, regressions = get_latency_summary(LatencyStore.load(latency_path),
+                                                        data['finished'] - data['started'], threshold)
+                print(text)
+                if regressions:
+                    exit(REGRESSION_EXIT_CODE)
+            return
         else:
             logger.error(f'Could not find metadata file. Check if you\'ve mounted \'{FILES_DIRECTORY}\' directory'
                          f' and \'{METADATA_FILE}\' file exists')
     else:
-        logger.error(f'Could not parse arguments "{args}". Please use "zelig summary <folder_name>" command')
+        logger.error(f'Could not parse arguments "{args}". '
+                     f'Please use "zelig summary <folder_name> [{LATENCY_THRESHOLD_ARGUMENT} <percent>]" command')
     exit(1)
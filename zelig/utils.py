@@ -2,17 +2,16 @@ import asyncio
 import urllib.parse
 from urllib.parse import urljoin, urlparse
 
-import aiohttp
 from aiohttp import web
 from multidict import MultiDict
-from vcr.errors import UnhandledHTTPRequestError
-from vcr.persisters.filesystem import FilesystemPersister
 from vcr.request import Request
 from vcr.serializers import yamlserializer
 from yarl import URL
 
-from zelig.constants import HEADERS_TO_IGNORE, ErrorCodes
+from zelig.constants import HEADERS_TO_IGNORE, UPSTREAM_KEY, ErrorCodes
 from zelig.log import logger
+from zelig.persisters import get_persister, is_stream_cassette, iter_stream_cassette
+from zelig.sidecar import load_sidecar, save_sidecar
 
 
 async def wait(duration, reserve=0, loop=None):
@@ -22,16 +21,18 @@ async def wait(duration, reserve=0, loop=None):
 
 
 async def extract_request_info(request, replace_host=True):
+    # Request is sent to the upstream it was routed to
+    upstream = request[UPSTREAM_KEY]
     request_info = {
         'method': request.method,
-        'url': urljoin(request.app.config.target_server_base_url, request.match_info.get('path')),
+        'url': urljoin(upstream.base_url, request.match_info.get('path')),
         # request.query has ProxyMultiDict type which doe not fit vcr aiohttp stub
         'params': MultiDict(request.query),
         'headers': request.headers,
         'data': await request.read(),
     }
     if replace_host:
-        request_info['headers']['HOST'] = request.app.config.target_server_host
+        request_info['headers']['HOST'] = upstream.target_host
     return request_info
 
 
@@ -72,20 +73,33 @@ def extract_error_response_info(request_info, error):
     }
 
 
+def build_vcr_request(request_info):
+    return Request(method=request_info['method'],
+                   uri=str(URL(request_info['url']).with_query(request_info['params'])),
+                   body=request_info['data'],
+                   headers=request_info['headers'])
+
+
 def get_response_from_data(data, request_info):
-    request = Request(method=request_info['method'],
-                      uri=str(URL(request_info['url']).with_query(request_info['params'])),
-                      body=request_info['data'],
-                      headers=request_info['headers'])
-    try:
-        responses = data.responses_of(request)
-    except UnhandledHTTPRequestError:
-        return None
-    return responses[0]
+    return data.find_response(build_vcr_request(request_info))
+
 
+def load_data(path, sidecar=False):
+    if sidecar:
+        cached = load_sidecar(path)
+        if cached is not None:
+            return [request for request, _ in cached['data']], [response for _, response in cached['data']]
+    requests, responses = get_persister(path).load_cassette(path, yamlserializer)
+    if sidecar and requests:
+        save_sidecar(path, list(zip(requests, responses)))
+    return requests, responses
 
-def load_data(path):
-    return FilesystemPersister.load_cassette(path, yamlserializer)
+
+def iter_data(path, sidecar=False):
+    if is_stream_cassette(path):
+        # One corrupt line does not stop playback of the rest of data
+        return iter_stream_cassette(path, skip_invalid=True)
+    return zip(*load_data(path, sidecar=sidecar))
 
 
 def filter_response_headers(headers):
@@ -93,20 +107,28 @@ def filter_response_headers(headers):
     return {k: v for k, v in headers.items() if k.lower() not in filtered_headers}
 
 
-async def get_server_response(response):
-    return web.Response(body=await response.read(), status=response.status,
-                        headers=filter_response_headers(response.headers))
+def get_recorded_body(response):
+    body = response['body']['string']
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return body
+
+
+def get_recorded_server_response(response):
+    body = get_recorded_body(response)
+    return web.Response(body=body, status=response['status']['code'],
+                        headers=filter_response_headers(response['headers']))
 
 
 def get_query_string(query_params):
     return f'?{urllib.parse.urlencode(query_params)}' if query_params else ''
 
 
-async def make_request(request_info):
-    async with aiohttp.ClientSession() as session:
-        async with session.request(**request_info) as response:
-            qs = get_query_string(request_info['params'])
-            logger.info('{request[method]} {request[url]}{qs} - {status}'.format(
-                request=request_info, status=response.status, qs=qs))
+async def make_request(session, request_info):
+    # Body is read before the connection is released, so the response is returned as recorded dict
+    async with session.request(**request_info) as response:
+        qs = get_query_string(request_info['params'])
+        logger.info('{request[method]} {request[url]}{qs} - {status}'.format(
+            request=request_info, status=response.status, qs=qs))
 
-            return response
+        return await extract_response_info(response)